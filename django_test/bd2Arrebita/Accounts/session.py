@@ -0,0 +1,95 @@
+import uuid
+
+from django.core.cache import cache
+
+from .models import User
+
+
+SNAPSHOT_KEY = "user_snapshot"
+
+
+def _version_key(user_id):
+    return f"user_version:{user_id}"
+
+
+def _new_stamp():
+    return uuid.uuid4().hex[:12]
+
+
+class SessionUser:
+    """
+    Copia leve do utilizador guardada na sessao (id, nome, email, role).
+    Expoe os mesmos atributos que as views e templates usam do modelo User.
+    """
+
+    __slots__ = ("user_id", "full_name", "email", "role")
+
+    def __init__(self, user_id, full_name, email, role):
+        self.user_id = user_id
+        self.full_name = full_name
+        self.email = email
+        self.role = role
+
+    @property
+    def pk(self):
+        return self.user_id
+
+    def __str__(self):
+        return f"{self.full_name} <{self.email}>"
+
+
+def current_version(user_id):
+    return cache.get(_version_key(user_id))
+
+
+def bump_user_version(user_id):
+    """
+    Marca o snapshot de um utilizador como desatualizado em todas as sessoes.
+    Chamado sempre que os dados do utilizador sao alterados.
+    """
+    cache.set(_version_key(user_id), _new_stamp(), None)
+
+
+def store_session_user(request, user):
+    version_key = _version_key(user.user_id)
+    cache.add(version_key, _new_stamp(), None)
+    request.session["user_id"] = user.user_id
+    request.session["user_email"] = user.email
+    request.session[SNAPSHOT_KEY] = {
+        "id": user.user_id,
+        "name": user.full_name,
+        "email": user.email,
+        "role": user.role,
+        "v": cache.get(version_key),
+    }
+    return SessionUser(user.user_id, user.full_name, user.email, user.role)
+
+
+def load_session_user(request):
+    """
+    Devolve o utilizador da sessao sem ir a BD enquanto o snapshot estiver
+    na versao atual; caso contrario recarrega-o da tabela users.
+    """
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return None
+
+    snapshot = request.session.get(SNAPSHOT_KEY)
+    if (
+        isinstance(snapshot, dict)
+        and snapshot.get("id") == user_id
+        and snapshot.get("v") is not None
+        and snapshot.get("v") == current_version(user_id)
+    ):
+        return SessionUser(
+            snapshot.get("id"),
+            snapshot.get("name"),
+            snapshot.get("email"),
+            snapshot.get("role"),
+        )
+
+    try:
+        user = User.objects.get(user_id=user_id)
+    except User.DoesNotExist:
+        return None
+    return store_session_user(request, user)
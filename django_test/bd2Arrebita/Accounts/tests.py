@@ -1,3 +1,75 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from Arrebita.testing import mock_connection
+from Backoffice import views as backoffice_views
+
+from . import session, views
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "session-tests"}})
+class SessionUserVersionTests(SimpleTestCase):
+    def setUp(self):
+        session.cache.clear()
+        self.user = mock.Mock(user_id=5, full_name="Ana", email="ana@example.com", role="customer")
+        patcher = mock.patch.object(session, "User")
+        self.users = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.users.DoesNotExist = LookupError
+        self.users.objects.get.return_value = self.user
+
+    def login(self):
+        request = RequestFactory().get("/")
+        request.session = {}
+        session.store_session_user(request, self.user)
+        return request
+
+    def test_current_snapshot_is_served_without_the_database(self):
+        request = self.login()
+        user = session.load_session_user(request)
+        self.assertEqual((user.user_id, user.full_name, user.role), (5, "Ana", "customer"))
+        self.users.objects.get.assert_not_called()
+
+    def test_stale_snapshot_is_reloaded(self):
+        request = self.login()
+        session.bump_user_version(5)
+        self.user.role = "admin"
+
+        user = session.load_session_user(request)
+        self.assertEqual(user.role, "admin")
+        self.users.objects.get.assert_called_once_with(user_id=5)
+        self.assertEqual(request.session[session.SNAPSHOT_KEY]["v"], session.current_version(5))
+
+        session.load_session_user(request)
+        self.users.objects.get.assert_called_once()
+
+    def test_profile_edit_bumps_the_version(self):
+        request = self.login()
+        before = session.current_version(5)
+        post = RequestFactory().post("/perfil/", {"full_name": "Ana Silva", "email": "ana@example.com"})
+        post.session = request.session
+        connection, _cursor = mock_connection()
+        with mock.patch.object(views, "connection", connection), \
+                mock.patch.object(views, "User") as users, \
+                mock.patch.object(views, "Order"), \
+                mock.patch.object(views, "Invoice"):
+            response = views.profile(post)
+
+        self.assertEqual(response.status_code, 302)
+        users.objects.filter.return_value.update.assert_called_once_with(full_name="Ana Silva", email="ana@example.com")
+        self.assertNotEqual(session.current_version(5), before)
+
+    def test_backoffice_user_update_bumps_the_version(self):
+        self.login()
+        before = session.current_version(5)
+        request = RequestFactory().post(
+            "/backoffice/users/5/", {"email": "ana@example.com", "full_name": "Ana", "role": "staff"}
+        )
+        connection, cursor = mock_connection()
+        with mock.patch.object(backoffice_views, "connection", connection):
+            response = backoffice_views.backoffice_user_update(request, 5)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(cursor.execute.call_args.args[1], ["ana@example.com", "Ana", "staff", 5])
+        self.assertNotEqual(session.current_version(5), before)
@@ -3,6 +3,7 @@ from django.shortcuts import render, redirect
 from django.utils import timezone
 
 from .models import User
+from .session import bump_user_version, load_session_user, store_session_user
 from Orders.models import Order, Invoice
 
 
@@ -38,13 +39,7 @@ def _default_role():
 
 
 def _session_user(request):
-    user_id = request.session.get("user_id")
-    if not user_id:
-        return None
-    try:
-        return User.objects.get(user_id=user_id)
-    except User.DoesNotExist:
-        return None
+    return load_session_user(request)
 
 
 def login_view(request):
@@ -55,8 +50,7 @@ def login_view(request):
 
         user = User.objects.filter(email=email, password_hash=password).first()
         if user:
-            request.session["user_id"] = user.user_id
-            request.session["user_email"] = user.email
+            store_session_user(request, user)
             next_url = request.GET.get("next") or "/perfil/"
             return redirect(next_url)
 
@@ -85,8 +79,7 @@ def register_view(request):
                 role=role,
                 created_at=_now_naive(),
             )
-            request.session["user_id"] = user.user_id
-            request.session["user_email"] = user.email
+            store_session_user(request, user)
             return redirect("/perfil/")
 
     return render(request, "register.html", {"error": error})
@@ -179,6 +172,7 @@ def profile(request):
             if password_hash:
                 updates["password_hash"] = password_hash
             User.objects.filter(user_id=user.user_id).update(**updates)
+            bump_user_version(user.user_id)
 
         return redirect("/perfil/")
 
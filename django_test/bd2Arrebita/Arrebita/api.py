@@ -0,0 +1,124 @@
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+
+from .pagination import keyset_page
+
+
+API_DEFAULT_LIMIT = 20
+API_MAX_LIMIT = 100
+
+
+class ApiError(ValueError):
+    pass
+
+
+def api_error(message, status=400):
+    return JsonResponse({"error": message}, status=status)
+
+
+def parse_fields(params, allowed, default):
+    """
+    ?fields=a,b,c -> lista de campos pedidos (validada contra `allowed`).
+    """
+    raw = (params.get("fields") or "").strip()
+    if not raw:
+        return list(default)
+    fields = []
+    for name in raw.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in allowed:
+            raise ApiError(f"campo desconhecido: {name}")
+        if name not in fields:
+            fields.append(name)
+    return fields or list(default)
+
+
+def parse_limit(params):
+    raw = params.get("limit")
+    if not raw:
+        return API_DEFAULT_LIMIT
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise ApiError(f"limit invalido: {raw}") from None
+    return max(1, min(API_MAX_LIMIT, limit))
+
+
+def _etag(resource, body):
+    # Hash do proprio conteudo: campos que mudam sem mexer em updated_at
+    # (has_active_promo/promo_price quando uma promocao abre ou fecha, ou
+    # updated_at NULL na view) tambem mudam o ETag.
+    return f'"{hashlib.sha1(resource.encode() + b":" + body).hexdigest()}"'
+
+
+def _serialize(obj, fields):
+    return {field: getattr(obj, field) for field in fields}
+
+
+def conditional_json(request, resource, payload):
+    """
+    Responde 304 se o If-None-Match do cliente corresponde ao ETag do
+    `payload`; senao devolve o JSON. O payload e serializado uma vez e os
+    mesmos bytes dao o hash e o corpo. Poupa a transferencia, nao a query.
+    """
+    body = json.dumps(payload, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":")).encode()
+    etag = _etag(resource, body)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+    response["Cache-Control"] = "no-cache"
+    return response
+
+
+def api_list(request, resource, queryset, sorts, default_sort, allowed_fields, default_fields):
+    """
+    Lista JSON com ?fields=, ?sort=, ?limit= e cursor (?after= / ?before=).
+    O ETag (forte) e o hash da pagina serializada, por isso uma pagina sem
+    alteracoes devolve 304 sem corpo.
+    """
+    try:
+        fields = parse_fields(request.GET, allowed_fields, default_fields)
+        limit = parse_limit(request.GET)
+    except ApiError as exc:
+        return api_error(str(exc))
+
+    sort = (request.GET.get("sort") or "").strip() or default_sort
+    if sort not in sorts:
+        return api_error(f"sort invalido: {sort} (usar {', '.join(sorts)})")
+
+    pk_name = queryset.model._meta.pk.name
+    columns = set(fields) | {pk_name, sorts[sort][0]}
+    page = keyset_page(
+        queryset.only(*columns),
+        sorts,
+        sort,
+        limit,
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+    )
+
+    return conditional_json(
+        request,
+        resource,
+        {
+            "results": [_serialize(row, fields) for row in page.object_list],
+            "next": page.next_token,
+            "previous": page.previous_token,
+        },
+    )
+
+
+def api_detail(request, resource, obj, allowed_fields, default_fields):
+    try:
+        fields = parse_fields(request.GET, allowed_fields, default_fields)
+    except ApiError as exc:
+        return api_error(str(exc))
+
+    return conditional_json(request, resource, _serialize(obj, fields))
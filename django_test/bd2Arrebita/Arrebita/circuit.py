@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker simples para dependencias remotas.
+
+    closed    -> as chamadas passam; `failure_threshold` falhas seguidas abrem.
+    open      -> falha imediata (CircuitOpenError) durante `reset_timeout` s.
+    half_open -> deixa passar uma unica chamada de teste; sucesso fecha,
+                 falha volta a abrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=3, reset_timeout=30, errors=(Exception,)):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.errors = errors
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._consecutive_failures = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+        return self._state
+
+    def _before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == self.OPEN or (state == self.HALF_OPEN and self._probe_in_flight):
+                raise CircuitOpenError(f"{self.name}: circuito aberto")
+            if state == self.HALF_OPEN:
+                self._probe_in_flight = True
+
+    def _on_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+            self._consecutive_failures = 0
+
+    def _on_failure(self, exc):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def call(self, func, *args, **kwargs):
+        self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except self.errors as exc:
+            self._on_failure(exc)
+            raise
+        except BaseException:
+            with self._lock:
+                self._probe_in_flight = False
+            raise
+        self._on_success()
+        return result
+
+
+class LastKnown:
+    """
+    Ultimos resultados bons (LRU limitado), usados como fallback quando a
+    dependencia falha ou o circuito esta aberto.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
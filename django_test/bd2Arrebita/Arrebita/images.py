@@ -0,0 +1,221 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.urls import reverse
+
+try:
+    from PIL import Image
+except Exception as exc:  # pragma: no cover - runtime guard
+    Image = None
+    _import_error = exc
+
+
+# Larguras geradas para cada imagem (so as menores ou iguais ao original).
+IMAGE_WIDTHS = (320, 640, 960, 1280, 1920)
+
+IMAGE_QUALITY = {"webp": 78, "jpeg": 80}
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+CONTENT_TYPES = {"webp": "image/webp", "jpg": "image/jpeg", "png": "image/png"}
+
+IMAGE_WORKERS = getattr(settings, "IMAGE_WORKERS", 2)
+
+_VARIANT_RE = re.compile(r"^(?P<width>\d+)w-(?P<digest>[0-9a-f]{16})\.(?P<ext>webp|jpg|png)$")
+
+# Imagem de origem: ficheiro, hash do conteudo, dimensoes e se tem
+# transparencia (a alternativa ao WebP passa entao a ser PNG, nao JPEG).
+SourceImage = namedtuple("SourceImage", "name path digest width height has_alpha")
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _require_pillow():
+    if Image is None:
+        raise RuntimeError(
+            "Pillow is required. Install it with `pip install Pillow`."
+        ) from _import_error
+
+
+def variants_root():
+    return getattr(
+        settings,
+        "IMAGE_VARIANTS_ROOT",
+        os.path.join(tempfile.gettempdir(), "arrebita_images"),
+    )
+
+
+def static_name(url):
+    """
+    Caminho relativo aos estaticos ("img/a1.png") a partir de um caminho ou
+    URL local (/Static/img/a1.png). None para URLs externos e caminhos
+    absolutos fora de STATIC_URL (/media/x.jpg). Nao verifica se existe.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if "://" in url or url.startswith("//"):
+        return None
+    prefix = "/" + settings.STATIC_URL.strip("/") + "/"
+    if url.startswith(prefix):
+        url = url[len(prefix):]
+    elif url.startswith(prefix[1:]):
+        url = url[len(prefix) - 1:]
+    elif url.startswith("/"):
+        return None
+    return url.lstrip("/") or None
+
+
+def source_image(name):
+    """
+    SourceImage de um ficheiro estatico, ou None se nao existir / nao for
+    imagem. O hash e as dimensoes ficam em memoria enquanto o ficheiro
+    (mtime, tamanho) nao mudar.
+    """
+    if Image is None or not name or not name.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    path = finders.find(name)
+    if not path:
+        return None
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _sources_lock:
+        cached = _sources.get(key)
+    if cached is not None:
+        return cached
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(chunk)
+    try:
+        with Image.open(path) as img:
+            width, height = img.size
+            has_alpha = img.mode in ("RGBA", "LA", "PA") or (
+                img.mode == "P" and "transparency" in img.info
+            )
+    except OSError:
+        return None
+
+    source = SourceImage(name, path, digest.hexdigest()[:16], width, height, has_alpha)
+    with _sources_lock:
+        _sources[key] = source
+    return source
+
+
+def fallback_ext(source):
+    return "png" if source.has_alpha else "jpg"
+
+
+def variant_widths(source):
+    return [width for width in IMAGE_WIDTHS if width <= source.width]
+
+
+def variant_filename(source, width, ext):
+    return f"{width}w-{source.digest}.{ext}"
+
+
+def variant_url(source, width, ext):
+    return reverse(
+        "image_variant",
+        kwargs={"variant": variant_filename(source, width, ext), "source": source.name},
+    )
+
+
+def parse_variant(variant):
+    match = _VARIANT_RE.match(variant)
+    if not match:
+        return None
+    return int(match["width"]), match["digest"], match["ext"]
+
+
+def render_variant(source_path, target, width, ext):
+    """
+    Gera uma variante (corre num processo do pool). Escreve num ficheiro
+    temporario e troca no fim, para que nunca se sirva um ficheiro a meio.
+    """
+    _require_pillow()
+    with Image.open(source_path) as img:
+        img.load()
+        height = max(1, round(img.height * width / img.width))
+        if ext == "jpg":
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in img.getbands() or "transparency" in img.info
+            img = img.convert("RGBA" if has_alpha else "RGB")
+        if img.width != width:
+            img = img.resize((width, height), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=f".{ext}")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                if ext == "webp":
+                    img.save(fh, "WEBP", quality=IMAGE_QUALITY["webp"], method=4)
+                elif ext == "jpg":
+                    img.save(fh, "JPEG", quality=IMAGE_QUALITY["jpeg"], optimize=True, progressive=True)
+                else:
+                    img.save(fh, "PNG", optimize=True)
+            os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    return os.path.getsize(target)
+
+
+def get_pool():
+    """
+    Pool de processos partilhado pelas geracoes a pedido. Usa spawn: o
+    processo do servidor tem threads e fazer fork dele nao e seguro.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def variant_path(source, width, ext):
+    return os.path.join(variants_root(), source.digest[:2], variant_filename(source, width, ext))
+
+
+def ensure_variant(source, width, ext, pool=None):
+    """
+    Caminho da variante em disco, gerando-a no pool se ainda nao existir.
+    """
+    target = variant_path(source, width, ext)
+    if not os.path.exists(target):
+        (pool or get_pool()).submit(render_variant, source.path, target, width, ext).result()
+    return target
+
+
+def srcsets(source):
+    """
+    (srcset WebP, srcset alternativo, URL por omissao) de uma imagem.
+    """
+    widths = variant_widths(source)
+    ext = fallback_ext(source)
+    webp = ", ".join(f"{variant_url(source, w, 'webp')} {w}w" for w in widths)
+    fallback = ", ".join(f"{variant_url(source, w, ext)} {w}w" for w in widths)
+    default_width = widths[min(1, len(widths) - 1)]
+    return webp, fallback, variant_url(source, default_width, ext)
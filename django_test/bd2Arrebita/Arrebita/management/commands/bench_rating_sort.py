@@ -0,0 +1,130 @@
+import datetime as dt
+import random
+import time
+import tracemalloc
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from Wines.models import WineListView
+from Wines.ratings import RatedWinePage
+
+
+PAGE_SIZE = 9
+
+
+def _sample_rows(count):
+    # Linhas como vem do vw_wine_list (todas as colunas do modelo).
+    now = dt.datetime(2025, 1, 1)
+    rows = []
+    for index in range(count):
+        rows.append({
+            "wine_id": uuid.uuid4(),
+            "sku": f"SKU-{index:06d}",
+            "name": f"Vinho {random.randint(0, count):06d}",
+            "type_id": uuid.uuid4(),
+            "type_label": "Tinto",
+            "region": "Douro",
+            "vintage_year": 2018,
+            "price": Decimal("12.50"),
+            "stock_qty": 30,
+            "tasting_notes": "Notas de frutos vermelhos, taninos finos e final longo.",
+            "alcohol_content": Decimal("13.5"),
+            "serving_temperature": 16,
+            "bottle_capacity": 750,
+            "pairing": "Carnes vermelhas",
+            "winemaker": "Enologo",
+            "created_at": now,
+            "updated_at": now,
+            "primary_image_url": f"/Static/img/wines/{index}.png",
+            "primary_image_type": "image/png",
+            "grape_varieties": "Touriga Nacional, Tinta Roriz",
+            "promo_pct_off": None,
+            "promo_price": None,
+            "has_active_promo": False,
+        })
+    return rows
+
+
+def _instances(rows, field_names):
+    return [
+        WineListView.from_db("default", field_names, [row[name] for name in field_names])
+        for row in rows
+    ]
+
+
+def _legacy_page(rows, field_names, ratings_map, page):
+    # Caminho antigo: list(wines_qs) + sort em Python + slice.
+    wines = _instances(rows, field_names)
+    for wine in wines:
+        wine._rating_avg = ratings_map.get(str(wine.wine_id), 0)
+    wines.sort(key=lambda wine: (wine._rating_avg, wine.name or ""), reverse=True)
+    start = (page - 1) * PAGE_SIZE
+    return wines[start:start + PAGE_SIZE]
+
+
+def _heap_page(rows, field_names, ratings_map, page):
+    by_id = {row["wine_id"]: row for row in rows}
+    pairs = [(row["wine_id"], row["name"]) for row in rows]
+
+    def hydrate(ids):
+        return _instances([by_id[wine_id] for wine_id in ids], field_names)
+
+    rated = RatedWinePage(pairs, ratings_map, hydrate, sort="-rating")
+    start = (page - 1) * PAGE_SIZE
+    return rated[start:start + PAGE_SIZE]
+
+
+def _measure(func, *args):
+    # Tempo sem tracemalloc (que abranda muito a alocacao), pico de memoria
+    # numa segunda execucao.
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    tracemalloc.start()
+    func(*args)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed_ms, peak
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara a ordenacao por rating antiga (todas as instancias + sort) "
+        "com a selecao por heap sobre (wine_id, name)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000")
+        parser.add_argument("--page", type=int, default=1)
+
+    def handle(self, *args, **options):
+        field_names = [field.attname for field in WineListView._meta.concrete_fields]
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        page = max(1, options["page"])
+
+        for size in sizes:
+            rows = _sample_rows(size)
+            ratings_map = {
+                str(row["wine_id"]): round(random.uniform(1, 5), 3)
+                for row in rows
+                if random.random() < 0.8
+            }
+
+            legacy, legacy_ms, legacy_peak = _measure(
+                _legacy_page, rows, field_names, ratings_map, page
+            )
+            heap, heap_ms, heap_peak = _measure(
+                _heap_page, rows, field_names, ratings_map, page
+            )
+
+            same = [w.wine_id for w in legacy] == [w.wine_id for w in heap]
+            self.stdout.write(f"{size} vinhos (pagina {page}, resultados iguais: {same})")
+            self.stdout.write(
+                f"  list+sort  {legacy_ms:9.1f} ms  pico {legacy_peak / 1024 / 1024:8.1f} MiB"
+            )
+            self.stdout.write(
+                f"  heap top-k {heap_ms:9.1f} ms  pico {heap_peak / 1024 / 1024:8.1f} MiB"
+            )
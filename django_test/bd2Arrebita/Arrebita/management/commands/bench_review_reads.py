@@ -0,0 +1,91 @@
+import datetime as dt
+import random
+import sys
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Arrebita.reviews import REVIEW_FIELDS, WINE_REVIEW_FIELDS, ReviewRecord, _projection
+
+
+def _sample_docs(count, ObjectId):
+    now = dt.datetime(2025, 1, 1)
+    wine_id = str(uuid.uuid4())
+    return [
+        {
+            "_id": ObjectId(),
+            "wine_id": wine_id,
+            "wine_name": "Arrebita Tinto Reserva",
+            "user_name": f"utilizador{index}",
+            "rating": random.randint(1, 5),
+            "comment": "Tinto sedutor, corpo e final longo. " * random.randint(1, 6),
+            "created_at": now - dt.timedelta(minutes=index),
+        }
+        for index in range(count)
+    ]
+
+
+def _full_decode(payload, decode_all):
+    # Leitura antiga (sem projecao): documento inteiro, mutado no dict.
+    reviews = []
+    for doc in decode_all(payload):
+        doc["id"] = str(doc.get("_id"))
+        try:
+            doc["rating"] = int(doc.get("rating"))
+        except (TypeError, ValueError):
+            doc["rating"] = 0
+        reviews.append(doc)
+    return reviews
+
+
+def _record_decode(payload, decode_all):
+    return [ReviewRecord(doc) for doc in decode_all(payload)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara bytes transferidos e tempo de decode entre o documento "
+        "inteiro e a leitura projetada em ReviewRecord (list_reviews_page)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="50,500,5000")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            from bson import ObjectId, decode_all, encode
+        except Exception as exc:
+            raise CommandError("pymongo is required. Install it with `pip install pymongo`.") from exc
+
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        repeat = options["repeat"]
+
+        def project(doc, fields):
+            keys = set(_projection(fields)) | {"_id"}
+            return {key: value for key, value in doc.items() if key in keys}
+
+        for size in sizes:
+            docs = _sample_docs(size, ObjectId)
+            variants = [
+                ("full_doc", docs, _full_decode),
+                ("community", [project(doc, REVIEW_FIELDS) for doc in docs], _record_decode),
+                ("wine_detail", [project(doc, WINE_REVIEW_FIELDS) for doc in docs], _record_decode),
+            ]
+
+            self.stdout.write(f"{size} reviews")
+            for label, variant_docs, decode in variants:
+                payload = b"".join(encode(doc) for doc in variant_docs)
+
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    rows = decode(payload, decode_all)
+                elapsed_ms = (time.perf_counter() - started) / repeat * 1000
+
+                row_bytes = sum(sys.getsizeof(row) for row in rows) / len(rows) if rows else 0
+                self.stdout.write(
+                    f"  {label:<13} wire {len(payload) / 1024:9.1f} KiB"
+                    f"  decode {elapsed_ms:8.2f} ms"
+                    f"  object {row_bytes:6.0f} B/review"
+                )
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.urls import resolve
+
+from Arrebita.middleware import AccessControlMiddleware, RouteTable
+
+
+DEFAULT_PATHS = (
+    "/backoffice/wines/3f1c2a4e-8b7d-4c6e-9a1f-2b3c4d5e6f70/images/"
+    "9a8b7c6d-5e4f-4a3b-8c2d-1e0f9a8b7c6d/delete/",
+    "/backoffice/orders/invoices/42/update/",
+    "/backoffice/events/3f1c2a4e-8b7d-4c6e-9a1f-2b3c4d5e6f70/update/",
+    "/backoffice/users/access/",
+    "/orders/edit/7/",
+)
+
+
+def _resolve_permissions(path):
+    # Caminho antigo: resolve() por pedido e derivacao das permissoes.
+    match = resolve(path)
+    return AccessControlMiddleware._permissions_for_route(
+        path,
+        match.app_name or match.namespace,
+        match.url_name,
+        match.view_name,
+    )
+
+
+class Command(BaseCommand):
+    help = "Compara resolve() por pedido com a tabela de rotas precompilada."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20000)
+        parser.add_argument("paths", nargs="*")
+
+    def handle(self, *args, **options):
+        iterations = options["iterations"]
+        paths = options["paths"] or DEFAULT_PATHS
+
+        started = time.perf_counter()
+        table = RouteTable()
+        build_ms = (time.perf_counter() - started) * 1000
+        self.stdout.write(f"route table: {len(table.permissions)} routes built in {build_ms:.2f} ms")
+
+        for path in paths:
+            expected = _resolve_permissions(path)
+            if table.lookup(path) != expected:
+                self.stderr.write(f"mismatch for {path}: {table.lookup(path)} != {expected}")
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                _resolve_permissions(path)
+            resolve_us = (time.perf_counter() - started) / iterations * 1e6
+
+            started = time.perf_counter()
+            for _ in range(iterations):
+                table.lookup(path)
+            table_us = (time.perf_counter() - started) / iterations * 1e6
+
+            self.stdout.write(
+                f"{path}\n  resolve(): {resolve_us:.2f} us  table: {table_us:.2f} us"
+                f"  ({resolve_us / table_us if table_us else 0:.1f}x)"
+            )
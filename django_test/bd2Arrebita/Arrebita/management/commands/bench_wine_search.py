@@ -0,0 +1,117 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from Wines.search import _DOCUMENT_SQL, _SEARCH_TEXT_SQL, _ensure_wine_search_table, match_sql, rank_sql
+
+
+# Catalogo sintetico: palavras reais combinadas com um sufixo aleatorio
+# para que os nomes sejam quase todos distintos.
+_SEED_SQL = """
+    INSERT INTO bench_wines (wine_id, sku, name, region, type_label, grape_varieties, winemaker)
+    SELECT
+        gen_random_uuid(),
+        'SKU-' || lpad(i::text, 7, '0'),
+        (ARRAY['Quinta', 'Herdade', 'Casa', 'Adega', 'Monte'])[1 + i %% 5] || ' '
+            || (ARRAY['do Vale', 'da Serra', 'das Pedras', 'do Rio', 'Velha'])[1 + (i / 5) %% 5] || ' '
+            || substr(md5(i::text), 1, 8),
+        (ARRAY['Douro', 'Alentejo', 'Dão', 'Bairrada', 'Vinho Verde', 'Lisboa'])[1 + i %% 6],
+        (ARRAY['Tinto', 'Branco', 'Rosé', 'Espumante'])[1 + i %% 4],
+        (ARRAY['Touriga Nacional', 'Alvarinho', 'Baga', 'Arinto', 'Tinta Roriz'])[1 + (i / 7) %% 5],
+        'Enólogo ' || substr(md5((i * 7)::text), 1, 6)
+    FROM generate_series(1, %s) AS i;
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede a latencia da pesquisa (tsvector + trigram) contra o ILIKE "
+        "antigo num catalogo sintetico em tabelas temporarias."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10000,100000,1000000")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--queries",
+            default="touriga,alentejo tinto,SKU-00042,herdade pedras,alvarinhu",
+            help="Pesquisas separadas por virgula (inclui um erro de escrita).",
+        )
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options["sizes"].split(",") if size.strip()]
+        queries = [q.strip() for q in options["queries"].split(",") if q.strip()]
+        repeat = options["repeat"]
+
+        # Extensoes e funcao unaccent iguais as da tabela real.
+        _ensure_wine_search_table()
+
+        for size in sizes:
+            with transaction.atomic():
+                with connection.cursor() as cur:
+                    self._seed(cur, size)
+                    self.stdout.write(f"{size} vinhos")
+                    for q in queries:
+                        ilike_ms, ilike_rows = self._time(cur, *self._ilike_query(q), repeat)
+                        search_ms, search_rows = self._time(cur, *self._search_query(q), repeat)
+                        self.stdout.write(
+                            f"  {q!r:<18} ILIKE {ilike_ms:8.2f} ms ({ilike_rows:>6})"
+                            f"   pesquisa {search_ms:8.2f} ms ({search_rows:>6})"
+                        )
+                transaction.set_rollback(True)
+
+    def _seed(self, cur, size):
+        cur.execute(
+            """
+            CREATE TEMP TABLE bench_wines (
+                wine_id uuid PRIMARY KEY, sku text, name text, region text,
+                type_label text, grape_varieties text, winemaker text
+            ) ON COMMIT DROP;
+            """
+        )
+        cur.execute(_SEED_SQL, [size])
+        cur.execute(
+            f"""
+            CREATE TEMP TABLE bench_wine_search ON COMMIT DROP AS
+            SELECT w.wine_id, {_DOCUMENT_SQL} AS document, {_SEARCH_TEXT_SQL} AS search_text
+            FROM bench_wines w;
+            """
+        )
+        cur.execute("CREATE INDEX ON bench_wine_search USING gin (document);")
+        cur.execute("CREATE INDEX ON bench_wine_search USING gin (search_text gin_trgm_ops);")
+        cur.execute("ANALYZE bench_wines;")
+        cur.execute("ANALYZE bench_wine_search;")
+
+    def _ilike_query(self, q):
+        # Pesquisa antiga do catalogo (nome / regiao / tipo).
+        pattern = f"%{q}%"
+        return (
+            """
+            SELECT wine_id FROM bench_wines
+            WHERE name ILIKE %s OR region ILIKE %s OR type_label ILIKE %s
+            ORDER BY name LIMIT 9;
+            """,
+            [pattern, pattern, pattern],
+        )
+
+    def _search_query(self, q):
+        match, match_params = match_sql(q)
+        rank, rank_params = rank_sql(q)
+        return (
+            f"""
+            SELECT s.wine_id FROM bench_wine_search s
+            WHERE {match}
+            ORDER BY {rank} DESC LIMIT 9;
+            """,
+            match_params + rank_params,
+        )
+
+    def _time(self, cur, sql, params, repeat):
+        cur.execute(sql, params)
+        rows = len(cur.fetchall())
+        started = time.perf_counter()
+        for _ in range(repeat):
+            cur.execute(sql, params)
+            cur.fetchall()
+        return (time.perf_counter() - started) / repeat * 1000, rows
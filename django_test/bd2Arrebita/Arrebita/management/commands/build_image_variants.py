@@ -0,0 +1,90 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from Arrebita.images import (
+    IMAGE_EXTENSIONS,
+    IMAGE_WORKERS,
+    _require_pillow,
+    fallback_ext,
+    render_variant,
+    source_image,
+    static_name,
+    variant_path,
+    variant_widths,
+)
+from Wines.models import WineListView
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera as variantes (WebP + JPEG/PNG, varias larguras) das imagens "
+        "estaticas e das imagens locais dos vinhos, num pool de processos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=max(IMAGE_WORKERS, os.cpu_count() or 1))
+        parser.add_argument("--force", action="store_true", help="Regenera variantes ja existentes.")
+        parser.add_argument(
+            "--no-wines",
+            action="store_true",
+            help="Nao le primary_image_url de vw_wine_list (so os estaticos).",
+        )
+
+    def _static_images(self):
+        names = set()
+        for finder in finders.get_finders():
+            for name, _storage in finder.list([]):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    names.add(name.replace(os.sep, "/"))
+        return names
+
+    def _wine_images(self):
+        try:
+            urls = WineListView.objects.exclude(primary_image_url__isnull=True).values_list(
+                "primary_image_url", flat=True
+            )
+            return {name for name in map(static_name, urls) if name}
+        except DatabaseError as exc:
+            self.stderr.write(f"Imagens dos vinhos ignoradas: {exc}")
+            return set()
+
+    def handle(self, *args, **options):
+        try:
+            _require_pillow()
+        except RuntimeError as exc:
+            raise CommandError(str(exc)) from exc
+
+        names = self._static_images()
+        if not options["no_wines"]:
+            names |= self._wine_images()
+
+        jobs = []
+        original_bytes = 0
+        for name in sorted(names):
+            image = source_image(name)
+            if image is None:
+                continue
+            original_bytes += os.path.getsize(image.path)
+            for width in variant_widths(image):
+                for ext in ("webp", fallback_ext(image)):
+                    target = variant_path(image, width, ext)
+                    if options["force"] or not os.path.exists(target):
+                        jobs.append((image.path, target, width, ext))
+
+        started = time.perf_counter()
+        written = 0
+        with ProcessPoolExecutor(max_workers=options["workers"]) as pool:
+            futures = [pool.submit(render_variant, *job) for job in jobs]
+            for future in as_completed(futures):
+                written += future.result()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{len(names)} imagens ({original_bytes / 1024 / 1024:.1f} MiB), "
+            f"{len(jobs)} variantes geradas ({written / 1024 / 1024:.1f} MiB) em {elapsed:.2f}s."
+        )
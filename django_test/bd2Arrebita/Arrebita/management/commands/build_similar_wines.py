@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Wines.similar import SIMILAR_TOP_N, build_similar_wines
+
+
+class Command(BaseCommand):
+    help = (
+        "Constroi o indice de vinhos semelhantes (TF-IDF de notas de prova, "
+        "harmonizacao, castas, regiao e tipo). So recalcula os vinhos cujo "
+        "updated_at mudou e os vizinhos afetados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recalcula todas as linhas (acerta tambem o desvio do IDF).",
+        )
+        parser.add_argument("--top-n", type=int, default=SIMILAR_TOP_N)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            updated = build_similar_wines(full=options["full"], top_n=options["top_n"])
+        except RuntimeError as exc:
+            raise CommandError(str(exc)) from exc
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{updated} vinhos recalculados em {elapsed:.2f}s.")
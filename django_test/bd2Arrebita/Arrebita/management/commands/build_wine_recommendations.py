@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from Wines.recommendations import RECOMMENDATIONS_TOP_N, build_wine_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Constroi as recomendacoes de vinhos comprados em conjunto a partir "
+        "de order_items, de forma incremental por order_id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help=(
+                "Reconstroi a matriz inteira (apanha encomendas editadas, canceladas "
+                "ou confirmadas depois do watermark). Correr periodicamente."
+            ),
+        )
+        parser.add_argument("--top-n", type=int, default=RECOMMENDATIONS_TOP_N)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=300.0)
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            started = time.perf_counter()
+            try:
+                updated = build_wine_recommendations(full=full, top_n=options["top_n"])
+            except RuntimeError as exc:
+                raise CommandError(str(exc)) from exc
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{updated} vinhos com recomendacoes recalculadas em {elapsed:.2f}s.")
+            if not options["loop"]:
+                return
+            full = False
+            close_old_connections()
+            time.sleep(options["interval"])
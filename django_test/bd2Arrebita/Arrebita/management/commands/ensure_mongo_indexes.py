@@ -0,0 +1,109 @@
+import datetime as dt
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Arrebita.mongo import (
+    ensure_review_indexes,
+    get_rating_summaries_collection,
+    get_reviews_collection,
+    new_client,
+)
+
+
+BAD_STAGES = {"COLLSCAN", "SORT"}
+
+_PLAN_KEYS = ("winningPlan", "queryPlan", "inputStage", "inputStages", "shards")
+
+
+def _plan_stages(plan):
+    if isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+        return
+    if not isinstance(plan, dict):
+        return
+    stage = plan.get("stage")
+    if stage:
+        yield stage
+    for key in _PLAN_KEYS:
+        if key in plan:
+            yield from _plan_stages(plan[key])
+
+
+def _hot_queries(client):
+    reviews = get_reviews_collection(client)
+    summaries = get_rating_summaries_collection(client)
+
+    sample = reviews.find_one({}, {"wine_id": 1}) or {}
+    wine_id = sample.get("wine_id") or "00000000-0000-0000-0000-000000000000"
+
+    return [
+        (
+            "reviews de um vinho (wine_detail)",
+            reviews.find({"wine_id": wine_id})
+            .sort([("created_at", -1), ("_id", -1)])
+            .limit(51),
+        ),
+        (
+            "reviews recentes (community)",
+            reviews.find({}).sort([("created_at", -1), ("_id", -1)]).limit(61),
+        ),
+        (
+            "resumos de rating (winelist)",
+            summaries.find({"_id": {"$in": [wine_id]}}),
+        ),
+        (
+            "resumos alterados (sync_wine_ratings)",
+            summaries.find(
+                {"updated_at": {"$gte": dt.datetime.utcnow() - dt.timedelta(hours=1)}},
+                {"count": 1, "sum": 1, "updated_at": 1},
+            ).sort("updated_at", 1),
+        ),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria os indices de wine_reviews e wine_rating_summaries e valida com "
+        "explain() que as queries principais nao fazem COLLSCAN nem SORT em memoria."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--uri",
+            default=None,
+            help="URI do MongoDB (por omissao settings.MONGO_URI).",
+        )
+        parser.add_argument(
+            "--skip-verify",
+            action="store_true",
+            help="Apenas cria os indices, sem correr explain().",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            client = new_client(options["uri"] or settings.MONGO_URI)
+            names = ensure_review_indexes(client)
+        except RuntimeError as exc:
+            raise CommandError(str(exc)) from exc
+
+        for name in names:
+            self.stdout.write(f"indice ok: {name}")
+
+        if options["skip_verify"]:
+            return
+
+        failures = []
+        for label, cursor in _hot_queries(client):
+            stages = list(_plan_stages(cursor.explain().get("queryPlanner", {})))
+            bad = sorted(BAD_STAGES.intersection(stages))
+            line = f"{label}: {' <- '.join(stages) or '?'}"
+            if bad:
+                failures.append(f"{label} usa {', '.join(bad)}")
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(self.style.SUCCESS(line))
+
+        if failures:
+            raise CommandError("; ".join(failures))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Arrebita.outbox import dead_count, flush_all, pending_count
+
+
+class Command(BaseCommand):
+    help = "Envia para o MongoDB as reviews pendentes na outbox do Postgres."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Continua a correr, a esvaziar a outbox a cada --interval segundos.",
+        )
+        parser.add_argument("--interval", type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        while True:
+            delivered = flush_all(options["batch_size"])
+            pending = pending_count()
+            dead = dead_count()
+            if delivered or pending or dead or options["verbosity"] > 1:
+                self.stdout.write(f"{delivered} reviews entregues, {pending} pendentes, {dead} desistidas.")
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
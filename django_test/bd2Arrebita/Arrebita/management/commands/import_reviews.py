@@ -0,0 +1,138 @@
+import csv
+import datetime as dt
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from Arrebita.reviews import build_review, insert_reviews
+from Wines.models import WineListView
+
+
+def _parse_created_at(value):
+    if value in (None, ""):
+        return None
+    if isinstance(value, dt.datetime):
+        parsed = value
+    else:
+        parsed = dt.datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if timezone.is_aware(parsed):
+        parsed = parsed.astimezone(dt.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _iter_rows(handle, fmt):
+    if fmt == "csv":
+        yield from csv.DictReader(handle)
+        return
+    for line in handle:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            yield {"_error": f"JSON invalido: {exc}"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa reviews em massa (JSONL ou CSV) para o MongoDB, validadas com "
+        "as mesmas regras do create_review e inseridas em lotes insert_many."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Ficheiro .jsonl/.csv, ou - para stdin.")
+        parser.add_argument("--format", choices=["jsonl", "csv"], default=None)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-wine-check",
+            action="store_true",
+            help="Nao valida wine_id contra o catalogo (vw_wine_list).",
+        )
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.lower().endswith(".csv") else "jsonl")
+        batch_size = max(1, options["batch_size"])
+        dry_run = options["dry_run"]
+
+        wine_names = None
+        if not options["skip_wine_check"]:
+            wine_names = {
+                str(wine_id): name
+                for wine_id, name in WineListView.objects.values_list("wine_id", "name")
+            }
+
+        stats = {"read": 0, "invalid": 0, "inserted": 0, "failed": 0}
+        started = time.perf_counter()
+        batch = []
+
+        def flush():
+            if not batch:
+                return
+            if not dry_run:
+                try:
+                    inserted, errors = insert_reviews(batch)
+                except RuntimeError as exc:
+                    # Os lotes anteriores ja ficaram no Mongo.
+                    raise CommandError(
+                        f"{exc} (interrompido depois de {stats['inserted']} reviews inseridas)"
+                    ) from exc
+                stats["inserted"] += inserted
+                stats["failed"] += len(errors)
+            batch.clear()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{stats['read']} lidas, {stats['inserted']} inseridas "
+                f"({stats['read'] / elapsed if elapsed else 0:.0f} linhas/s)"
+            )
+
+        handle = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        try:
+            for line_no, row in enumerate(_iter_rows(handle, fmt), start=1):
+                stats["read"] += 1
+                try:
+                    if "_error" in row:
+                        raise ValueError(row["_error"])
+                    wine_id = str(row.get("wine_id") or "").strip()
+                    wine_name = (row.get("wine_name") or "").strip() or None
+                    if wine_names is not None:
+                        if wine_id not in wine_names:
+                            raise ValueError(f"vinho desconhecido: {wine_id}")
+                        wine_name = wine_name or wine_names[wine_id]
+                    review = build_review(
+                        wine_id,
+                        wine_name,
+                        row.get("user_name"),
+                        row.get("rating"),
+                        row.get("comment"),
+                        created_at=_parse_created_at(row.get("created_at")),
+                    )
+                except (ValueError, TypeError) as exc:
+                    stats["invalid"] += 1
+                    if options["verbosity"] > 1:
+                        self.stderr.write(f"linha {line_no}: {exc}")
+                    continue
+
+                batch.append(review)
+                if len(batch) >= batch_size:
+                    flush()
+            flush()
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Concluido em {elapsed:.1f}s: {stats['read']} lidas, "
+                f"{stats['invalid']} invalidas, {stats['inserted']} inseridas, "
+                f"{stats['failed']} rejeitadas pelo Mongo"
+                f" ({stats['inserted'] / elapsed if elapsed else 0:.0f} reviews/s)."
+                + (" [dry-run]" if dry_run else "")
+            )
+        )
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.urls import get_resolver
+
+from Arrebita.pagecache import page_cache_stats, reset_page_cache_stats
+
+
+class Command(BaseCommand):
+    help = "Mostra hits, misses e taxa de acerto da cache de paginas anonimas."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Repoe os contadores a zero depois de mostrar.",
+        )
+
+    def handle(self, *args, **options):
+        # Importa as views (e regista as que usam a cache).
+        get_resolver().url_patterns
+
+        stats = page_cache_stats()
+        total_hits = total_misses = 0
+        for view, row in stats.items():
+            total_hits += row["hits"]
+            total_misses += row["misses"]
+            self.stdout.write(
+                f"{view:<16} hits {row['hits']:>8}  misses {row['misses']:>8}"
+                f"  hit rate {row['hit_rate']:6.1%}"
+            )
+        total = total_hits + total_misses
+        rate = total_hits / total if total else 0.0
+        self.stdout.write(
+            f"{'total':<16} hits {total_hits:>8}  misses {total_misses:>8}  hit rate {rate:6.1%}"
+        )
+
+        if options["reset"]:
+            reset_page_cache_stats()
+            self.stdout.write("Contadores repostos.")
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Arrebita.reviews import rebuild_rating_summaries
+from Wines.ratings import sync_wine_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula wine_rating_summaries a partir de wine_reviews (backfill). "
+        "Correr com as escritas de reviews paradas: esvaziar a outbox "
+        "(flush_review_outbox) e parar o flusher e os imports antes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--skip-sync",
+            action="store_true",
+            help=(
+                "Nao recarrega wine_ratings no fim. Os vinhos que ficaram sem "
+                "resumo so saem de la com sync_wine_ratings --full."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            total = rebuild_rating_summaries(batch_size=options["batch_size"])
+        except RuntimeError as exc:
+            raise CommandError(str(exc)) from exc
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"{total} resumos de rating reconstruidos em {elapsed:.2f}s.")
+        )
+        if options["skip_sync"]:
+            return
+
+        # O rebuild pode apagar resumos (vinhos sem reviews); o sync
+        # incremental nao ve remocoes, so o full.
+        started = time.perf_counter()
+        try:
+            updated = sync_wine_ratings(full=True, batch_size=options["batch_size"])
+        except RuntimeError as exc:
+            raise CommandError(str(exc)) from exc
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{updated} vinhos sincronizados em {elapsed:.2f}s.")
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from Arrebita.rollups import HOME_ROLLUPS_TTL, refresh_home_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula os carrosseis da home (mais vendidos da semana, ultimas "
+        "reviews, proximos eventos) e guarda-os em cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=float(HOME_ROLLUPS_TTL))
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            rollups = refresh_home_rollups()
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{len(rollups['best_sellers'])} vinhos, {len(rollups['reviews'])} reviews e "
+                f"{len(rollups['events'])} eventos em {elapsed:.2f}s."
+            )
+            if not options["loop"]:
+                return
+            close_old_connections()
+            time.sleep(options["interval"])
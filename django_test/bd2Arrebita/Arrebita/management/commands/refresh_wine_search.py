@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from Wines.search import refresh_wine_search
+
+
+class Command(BaseCommand):
+    help = (
+        "Cria/atualiza public.wine_search (tsvector + trigram) a partir de "
+        "vw_wine_list. Necessario uma vez antes de a pesquisa nova ser usada."
+    )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            indexed = refresh_wine_search()
+        except DatabaseError as exc:
+            raise CommandError(
+                f"Falha ao indexar (as extensoes unaccent e pg_trgm estao disponiveis?): {exc}"
+            ) from exc
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{indexed} vinhos indexados em {elapsed:.2f}s.")
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from Wines.ratings import sync_wine_ratings
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincroniza a tabela wine_ratings (Postgres) a partir de "
+        "wine_rating_summaries (Mongo), de forma incremental por watermark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recarrega a tabela inteira em vez de usar o watermark.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--loop", action="store_true")
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        full = options["full"]
+        while True:
+            started = time.perf_counter()
+            try:
+                updated = sync_wine_ratings(full=full, batch_size=options["batch_size"])
+            except RuntimeError as exc:
+                raise CommandError(str(exc)) from exc
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{updated} vinhos sincronizados em {elapsed:.2f}s.")
+            if not options["loop"]:
+                return
+            full = False
+            close_old_connections()
+            time.sleep(options["interval"])
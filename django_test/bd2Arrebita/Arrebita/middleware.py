@@ -1,27 +1,140 @@
-from django.db import connection
+import re
+
 from django.http import HttpResponseForbidden
 from django.shortcuts import redirect
-from django.urls import resolve
+from django.urls import URLResolver, get_resolver
+from django.utils.functional import SimpleLazyObject
+
+from Accounts.session import load_session_user
+from .permissions import user_has_permission
+
+
+PUBLIC_PREFIXES = (
+    "/events",
+    "/wines",
+    "/api/wines",
+    "/api/events",
+    "/comunidade",
+    "/cart",
+    "/checkout",
+    "/login",
+    "/registo",
+    "/logout",
+    "/accounts/login",
+    "/accounts/registo",
+    "/accounts/logout",
+    "/Static",
+    "/static",
+    "/img/",
+    "/admin",
+    "/favicon.ico",
+    "/health/",
+)
+
+ASSET_PREFIXES = (
+    "/Static/",
+    "/static/",
+    "/img/",
+    "/favicon.ico",
+    "/robots.txt",
+)
+
+_PUBLIC_PATH_RE = re.compile(
+    r"/\Z|" + "|".join(re.escape(prefix) for prefix in PUBLIC_PREFIXES)
+)
+
+_ASSET_PATH_RE = re.compile("|".join(re.escape(prefix) for prefix in ASSET_PREFIXES))
+
+_NAMED_GROUP_RE = re.compile(r"\(\?P<\w+>")
+
+
+class RouteTable:
+    """
+    Tabela construida uma vez a partir do URLconf: cada rota nomeada fica
+    associada as suas permissoes candidatas, e todas as rotas sao compiladas
+    numa unica regex. Por pedido basta um match e um acesso ao dicionario.
+    """
+
+    def __init__(self, urlconf=None):
+        self.permissions = {}
+        alternatives = []
+        for index, (regex, route, namespaces, app_names, url_name, view_name) in enumerate(
+            self._iter_routes(get_resolver(urlconf).url_patterns)
+        ):
+            key = f"r{index}"
+            self.permissions[key] = AccessControlMiddleware._permissions_for_route(
+                "/" + route,
+                ":".join(app_names) or ":".join(namespaces),
+                url_name,
+                view_name,
+            )
+            alternatives.append(f"(?P<{key}>{_NAMED_GROUP_RE.sub('(?:', regex)})")
+
+        self.regex = re.compile("/(?:" + "|".join(alternatives) + ")") if alternatives else None
+
+    @classmethod
+    def _iter_routes(cls, patterns, regex="", route="", namespaces=(), app_names=()):
+        for entry in patterns:
+            entry_regex = regex + entry.pattern.regex.pattern.lstrip("^")
+            entry_route = route + str(entry.pattern)
+            if isinstance(entry, URLResolver):
+                try:
+                    children = entry.url_patterns
+                except Exception:
+                    continue
+                yield from cls._iter_routes(
+                    children,
+                    entry_regex,
+                    entry_route,
+                    namespaces + ((entry.namespace,) if entry.namespace else ()),
+                    app_names + ((entry.app_name,) if entry.app_name else ()),
+                )
+                continue
 
-from Accounts.models import User
+            url_name = entry.name
+            if url_name:
+                view_name = ":".join(namespaces + (url_name,))
+            else:
+                view_name = entry.lookup_str
+            yield entry_regex, entry_route, namespaces, app_names, url_name, view_name
+
+    def lookup(self, path):
+        if self.regex is None:
+            return None
+        match = self.regex.match(path)
+        if not match:
+            return None
+        return self.permissions[match.lastgroup]
 
 
 class AccessControlMiddleware:
+    route_table = None
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self._get_route_table()
 
     def __call__(self, request):
         path = request.path_info or "/"
 
-        request.current_user = self._get_current_user(request)
-        request.can_backoffice = False
-        request.cart_count = self._cart_count(request)
+        if self._is_asset_path(path):
+            # Ficheiros estaticos nao precisam de utilizador nem de permissoes.
+            request.current_user = None
+            request.can_backoffice = False
+            request.cart_count = 0
+            return self.get_response(request)
 
-        if request.current_user:
-            request.can_backoffice = any(
-                self._has_permission(request.current_user.user_id, perm)
-                for perm in ("backoffice.dashboard", "backoffice:dashboard", "dashboard")
+        # So tocam na BD quando uma view ou template os le.
+        request.current_user = SimpleLazyObject(lambda: self._get_current_user(request))
+        request.can_backoffice = SimpleLazyObject(
+            lambda: user_has_permission(
+                request.current_user,
+                "backoffice.dashboard",
+                "backoffice:dashboard",
+                "dashboard",
             )
+        )
+        request.cart_count = self._cart_count(request)
 
         if self._is_public_path(path):
             return self.get_response(request)
@@ -30,11 +143,7 @@ class AccessControlMiddleware:
             return redirect(f"/login/?next={path}")
 
         permissions = self._permission_for_request(request, path)
-        allowed = any(
-            self._has_permission(request.current_user.user_id, perm)
-            for perm in permissions
-            if perm
-        )
+        allowed = user_has_permission(request.current_user, *permissions)
         if not allowed:
             required = permissions[0] if permissions else path
             return HttpResponseForbidden(
@@ -45,31 +154,21 @@ class AccessControlMiddleware:
         return self.get_response(request)
 
     @staticmethod
-    def _is_public_path(path):
-        if path == "/":
-            return True
-
-        public_prefixes = (
-            "/events",
-            "/wines",
-            "/comunidade",
-            "/cart",
-            "/checkout",
-            "/login",
-            "/registo",
-            "/logout",
-            "/accounts/login",
-            "/accounts/registo",
-            "/accounts/logout",
-            "/Static",
-            "/static",
-            "/admin",
-            "/favicon.ico",
-        )
-        return any(path.startswith(prefix) for prefix in public_prefixes)
+    def _is_asset_path(path):
+        return _ASSET_PATH_RE.match(path) is not None
 
     @staticmethod
-    def _permission_for_request(request, path):
+    def _is_public_path(path):
+        return _PUBLIC_PATH_RE.match(path) is not None
+
+    @classmethod
+    def _get_route_table(cls):
+        if cls.route_table is None:
+            cls.route_table = RouteTable()
+        return cls.route_table
+
+    @classmethod
+    def _permission_for_request(cls, request, path):
         if path in {"/backoffice", "/backoffice/"}:
             return ["backoffice.dashboard"]
 
@@ -79,48 +178,48 @@ class AccessControlMiddleware:
         if path.startswith("/orders/invoices"):
             return ["orders.invoices", "orders.my_invoices"]
 
-        try:
-            match = resolve(path)
-            permissions = []
+        permissions = cls._get_route_table().lookup(path)
+        if permissions is not None:
+            return permissions
+
+        if path.startswith("/backoffice"):
+            return ["backoffice.dashboard"]
+        return [path]
 
-            module = match.app_name or match.namespace
-            url_name = match.url_name
-            view_name = match.view_name
+    @staticmethod
+    def _permissions_for_route(path, module, url_name, view_name):
+        permissions = []
 
-            if not url_name and view_name and ":" in view_name:
-                url_name = view_name.split(":")[-1]
+        if not url_name and view_name and ":" in view_name:
+            url_name = view_name.split(":")[-1]
 
-            if not module and view_name and ":" in view_name:
-                module = view_name.split(":")[0]
+        if not module and view_name and ":" in view_name:
+            module = view_name.split(":")[0]
 
-            if not module:
-                module = AccessControlMiddleware._module_from_path(path)
+        if not module:
+            module = AccessControlMiddleware._module_from_path(path)
 
-            if module and url_name:
-                functionality = AccessControlMiddleware._normalize_permission(
-                    module, url_name
-                )
-                permissions.append(f"{module}.{functionality}")
+        if module and url_name:
+            functionality = AccessControlMiddleware._normalize_permission(
+                module, url_name
+            )
+            permissions.append(f"{module}.{functionality}")
 
-                if module == "orders" and functionality == "invoices":
-                    permissions.append("orders.my_invoices")
+            if module == "orders" and functionality == "invoices":
+                permissions.append("orders.my_invoices")
 
-            if view_name and ":" in view_name:
-                permissions.append(view_name.replace(":", "."))
+        if view_name and ":" in view_name:
+            permissions.append(view_name.replace(":", "."))
 
-            if view_name and view_name not in permissions:
-                permissions.append(view_name)
+        if view_name and view_name not in permissions:
+            permissions.append(view_name)
 
-            if url_name and url_name not in permissions:
-                permissions.append(url_name)
+        if url_name and url_name not in permissions:
+            permissions.append(url_name)
 
-            if not permissions:
-                permissions.append(path)
-            return permissions
-        except Exception:
-            if path.startswith("/backoffice"):
-                return ["backoffice.dashboard"]
-            return [path]
+        if not permissions:
+            permissions.append(path)
+        return permissions
 
     @staticmethod
     def _normalize_permission(module, url_name):
@@ -190,23 +289,14 @@ class AccessControlMiddleware:
             return "backoffice"
         return None
 
-    @staticmethod
-    def _has_permission(user_id, permission):
-        with connection.cursor() as cur:
-            cur.execute("SELECT fn_user_has_permission(%s, %s);", [user_id, permission])
-            row = cur.fetchone()
-            return bool(row and row[0])
-
     @staticmethod
     def _get_current_user(request):
-        user_id = request.session.get("user_id")
-        if not user_id:
+        if not request.session.get("user_id"):
             return None
-        try:
-            return User.objects.get(user_id=user_id)
-        except User.DoesNotExist:
+        user = load_session_user(request)
+        if user is None:
             request.session.flush()
-            return None
+        return user
 
     @staticmethod
     def _cart_count(request):
@@ -1,27 +1,87 @@
 from django.conf import settings
 
 try:
-    from pymongo import MongoClient
+    from pymongo import ASCENDING, DESCENDING, MongoClient
+    from pymongo.errors import PyMongoError
 except Exception as exc:  # pragma: no cover - runtime guard
     MongoClient = None
+    ASCENDING, DESCENDING = 1, -1
+    PyMongoError = RuntimeError
     _import_error = exc
 
 
+# Erros que contam como falha do Mongo (RuntimeError: pymongo em falta).
+MONGO_ERRORS = (PyMongoError, RuntimeError)
+
+
+# Indices necessarios para as queries de Arrebita.reviews:
+#   - find({wine_id}).sort(created_at desc)  -> detalhe do vinho
+#   - find({}).sort(created_at desc)         -> pagina da comunidade
+# O _id entra como desempate para a paginacao por cursor.
+REVIEW_INDEXES = (
+    {
+        "name": "wine_id_created_at",
+        "keys": [("wine_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+    },
+    {
+        "name": "created_at",
+        "keys": [("created_at", DESCENDING), ("_id", DESCENDING)],
+    },
+)
+
+
+# wine_rating_summaries: o sync para o Postgres (Wines.ratings) le por
+# updated_at >= watermark, ordenado por updated_at.
+RATING_SUMMARY_INDEXES = (
+    {
+        "name": "updated_at",
+        "keys": [("updated_at", ASCENDING)],
+    },
+)
+
+
 _client = None
 
 
+def new_client(uri):
+    if MongoClient is None:
+        raise RuntimeError(
+            "pymongo is required. Install it with `pip install pymongo`."
+        ) from _import_error
+    return MongoClient(uri, **getattr(settings, "MONGO_CLIENT_OPTIONS", {}))
+
+
 def _get_client():
     global _client
     if _client is None:
-        if MongoClient is None:
-            raise RuntimeError(
-                "pymongo is required. Install it with `pip install pymongo`."
-            ) from _import_error
-        _client = MongoClient(settings.MONGO_URI)
+        _client = new_client(settings.MONGO_URI)
     return _client
 
 
-def get_reviews_collection():
-    client = _get_client()
+def get_reviews_collection(client=None):
+    client = client or _get_client()
     db = client[settings.MONGO_DB_NAME]
     return db[settings.MONGO_COLLECTION]
+
+
+def get_rating_summaries_collection(client=None):
+    client = client or _get_client()
+    db = client[settings.MONGO_DB_NAME]
+    return db[settings.MONGO_RATING_SUMMARIES_COLLECTION]
+
+
+def ensure_review_indexes(client=None):
+    """
+    Cria (de forma idempotente) os indices declarados em REVIEW_INDEXES e
+    RATING_SUMMARY_INDEXES. Devolve os nomes dos indices.
+    """
+    names = []
+    for collection, indexes in (
+        (get_reviews_collection(client), REVIEW_INDEXES),
+        (get_rating_summaries_collection(client), RATING_SUMMARY_INDEXES),
+    ):
+        names.extend(
+            f"{collection.name}.{collection.create_index(index['keys'], name=index['name'])}"
+            for index in indexes
+        )
+    return names
@@ -0,0 +1,274 @@
+import datetime as dt
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+
+from .reviews import DUPLICATE_KEY, build_review, create_review, insert_reviews
+
+
+logger = logging.getLogger(__name__)
+
+
+def _ensure_outbox_table():
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.review_outbox (
+                outbox_id bigint GENERATED ALWAYS AS IDENTITY,
+                payload jsonb NOT NULL,
+                created_at timestamptz NOT NULL DEFAULT now(),
+                attempts integer NOT NULL DEFAULT 0,
+                next_attempt_at timestamptz NOT NULL DEFAULT now(),
+                last_error text,
+                dead_at timestamptz,
+                CONSTRAINT review_outbox_pkey PRIMARY KEY (outbox_id)
+            );
+            """
+        )
+        # Tabelas criadas antes da coluna dead_at.
+        cur.execute("ALTER TABLE public.review_outbox ADD COLUMN IF NOT EXISTS dead_at timestamptz;")
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_review_outbox_next_attempt ON public.review_outbox (next_attempt_at);"
+        )
+
+
+_table_ready = False
+
+
+def _ensure_outbox_table_once():
+    global _table_ready
+    if not _table_ready:
+        _ensure_outbox_table()
+        _table_ready = True
+
+
+def enqueue_review(wine_id, wine_name, user_name, rating, comment):
+    """
+    Guarda a review na outbox do Postgres e volta logo; o envio para o Mongo
+    e feito em lote pelo flusher. O _id do Mongo e gerado aqui para que
+    reenvios nao dupliquem a review.
+    """
+    try:
+        from bson import ObjectId
+    except Exception as exc:  # pragma: no cover - runtime guard
+        raise RuntimeError(
+            "pymongo is required. Install it with `pip install pymongo`."
+        ) from exc
+
+    review = build_review(wine_id, wine_name, user_name, rating, comment)
+    payload = dict(review, _id=str(ObjectId()), created_at=review["created_at"].isoformat())
+
+    _ensure_outbox_table_once()
+    with connection.cursor() as cur:
+        cur.execute(
+            "INSERT INTO public.review_outbox (payload) VALUES (%s);",
+            [json.dumps(payload)],
+        )
+
+    flusher.wake()
+
+
+def submit_review(wine_id, wine_name, user_name, rating, comment):
+    """
+    Ponto de entrada das views: usa a outbox e, se o Postgres falhar,
+    escreve diretamente no Mongo (RuntimeError se tambem falhar).
+    """
+    try:
+        enqueue_review(wine_id, wine_name, user_name, rating, comment)
+    except DatabaseError:
+        logger.exception("Outbox de reviews indisponivel, a escrever no Mongo")
+        create_review(wine_id, wine_name, user_name, rating, comment)
+
+
+def _review_from_payload(payload):
+    from bson import ObjectId
+
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    review = dict(payload)
+    review["_id"] = ObjectId(review["_id"])
+    review["created_at"] = dt.datetime.fromisoformat(review["created_at"])
+    return review
+
+
+def _backoff_seconds(attempts):
+    max_backoff = getattr(settings, "REVIEW_OUTBOX_MAX_BACKOFF", 300)
+    return min(max_backoff, 2 ** min(attempts, 16))
+
+
+def _claim_batch(batch_size):
+    """
+    Reclama um lote num unico statement (commit imediato): as linhas ficam
+    reservadas empurrando next_attempt_at para a frente, em vez de ficarem
+    com locks abertos durante a ida ao Mongo. Se o processo morrer a meio,
+    voltam a ficar disponiveis quando a reserva expirar.
+    """
+    claim_timeout = getattr(settings, "REVIEW_OUTBOX_CLAIM_TIMEOUT", 60)
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.review_outbox
+            SET next_attempt_at = now() + make_interval(secs => %s)
+            WHERE outbox_id IN (
+                SELECT outbox_id
+                FROM public.review_outbox
+                WHERE dead_at IS NULL AND next_attempt_at <= now()
+                ORDER BY outbox_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING outbox_id, payload, attempts;
+            """,
+            [claim_timeout, batch_size],
+        )
+        return sorted(cur.fetchall())
+
+
+def flush_outbox(batch_size=None):
+    """
+    Envia para o Mongo as reviews pendentes (um lote por chamada).
+    O lote e reclamado e confirmado antes da ida ao Mongo; o resultado
+    (apagar as entregues, reagendar as falhadas) e gravado depois, noutra
+    transacao. Podem correr varios flushers ao mesmo tempo.
+    Uma linha que falhe REVIEW_OUTBOX_MAX_ATTEMPTS vezes fica marcada com
+    dead_at e deixa de ser tentada. Devolve o numero de entregues.
+    """
+    batch_size = batch_size or getattr(settings, "REVIEW_OUTBOX_BATCH_SIZE", 500)
+    max_attempts = getattr(settings, "REVIEW_OUTBOX_MAX_ATTEMPTS", 20)
+    _ensure_outbox_table_once()
+
+    rows = _claim_batch(batch_size)
+    if not rows:
+        return 0
+
+    # Payloads que nao se conseguem ler nunca vao passar: vao logo para dead.
+    failed = {}
+    reviews, sent = [], []
+    for row in rows:
+        try:
+            reviews.append(_review_from_payload(row[1]))
+            sent.append(row)
+        except (KeyError, TypeError, ValueError) as exc:
+            failed[row[0]] = (max_attempts, f"payload invalido: {exc}")
+
+    try:
+        _inserted, errors = insert_reviews(reviews)
+    except RuntimeError as exc:
+        errors = {
+            index: {"errmsg": f"{type(exc).__name__}: {exc}"}
+            for index in range(len(sent))
+        }
+
+    delivered = []
+    for index, row in enumerate(sent):
+        error = errors.get(index)
+        if error is None or error.get("code") == DUPLICATE_KEY:
+            delivered.append(row[0])
+        else:
+            failed[row[0]] = (row[2] + 1, str(error.get("errmsg", "")))
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            if failed:
+                cur.executemany(
+                    """
+                    UPDATE public.review_outbox
+                    SET attempts = %s,
+                        next_attempt_at = now() + make_interval(secs => %s),
+                        last_error = %s,
+                        dead_at = CASE WHEN %s THEN now() END
+                    WHERE outbox_id = %s;
+                    """,
+                    [
+                        [attempts, _backoff_seconds(attempts), message[:500], attempts >= max_attempts, outbox_id]
+                        for outbox_id, (attempts, message) in failed.items()
+                    ],
+                )
+            if delivered:
+                cur.execute(
+                    "DELETE FROM public.review_outbox WHERE outbox_id = ANY(%s);",
+                    [delivered],
+                )
+
+    dead = [outbox_id for outbox_id, (attempts, _msg) in failed.items() if attempts >= max_attempts]
+    if dead:
+        logger.error("Reviews da outbox desistidas apos %s tentativas: %s", max_attempts, dead)
+    return len(delivered)
+
+
+def flush_all(batch_size=None):
+    total = 0
+    while True:
+        delivered = flush_outbox(batch_size)
+        total += delivered
+        if not delivered:
+            return total
+
+
+def pending_count():
+    _ensure_outbox_table_once()
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM public.review_outbox WHERE dead_at IS NULL;")
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+
+def dead_count():
+    """Reviews desistidas (dead_at preenchido), a ver a mao em last_error."""
+    _ensure_outbox_table_once()
+    with connection.cursor() as cur:
+        cur.execute("SELECT COUNT(*) FROM public.review_outbox WHERE dead_at IS NOT NULL;")
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+
+def _sync_sql_ratings():
+    # Mantem a copia SQL dos ratings (usada no filtro/ordenacao do catalogo)
+    # atualizada logo apos novas reviews chegarem ao Mongo.
+    from Wines.ratings import ratings_synced, sync_wine_ratings
+
+    if ratings_synced():
+        sync_wine_ratings()
+
+
+class OutboxFlusher:
+    """
+    Thread em background (uma por processo) que esvazia a outbox.
+    Arranca na primeira review submetida; wake() forca um envio imediato.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def wake(self):
+        self._start()
+        self._event.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="review-outbox-flusher", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        interval = getattr(settings, "REVIEW_OUTBOX_FLUSH_INTERVAL", 5)
+        while True:
+            self._event.wait(interval)
+            self._event.clear()
+            try:
+                if flush_all():
+                    _sync_sql_ratings()
+            except Exception:
+                logger.exception("Falha ao esvaziar a outbox de reviews")
+            finally:
+                close_old_connections()
+
+
+flusher = OutboxFlusher()
@@ -0,0 +1,191 @@
+import functools
+import hashlib
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+
+PAGE_CACHE_TTL = 300
+
+_STATS_KEY = "pagecache:stats:{view}:{kind}"
+
+# Os contadores de hit/miss ficam em memoria do processo e so sao somados
+# a cache partilhada de tempos a tempos: com a FileBasedCache cada incr e
+# um get+set de um ficheiro, caro demais para fazer por pedido.
+PAGE_CACHE_STATS_FLUSH_INTERVAL = 30
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+_stats_flushed_at = time.monotonic()
+
+# Views decoradas (registadas no import), para o relatorio de hit rate.
+_cached_views = set()
+
+# O token CSRF e diferente para cada visitante: guarda-se a pagina com um
+# marcador e o token certo e posto de volta ao servir.
+_CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+_CSRF_PLACEHOLDER = "__csrf_token__"
+
+
+def _tag_key(tag):
+    return f"pagecache:tag:{tag}"
+
+
+def invalidate_page_cache(*tags):
+    """
+    Invalida todas as paginas em cache que dependem de `tags`
+    ("wines", "events", "ratings"). Chamado depois das escritas.
+    """
+    for tag in tags:
+        cache.set(_tag_key(tag), uuid.uuid4().hex[:12], None)
+
+
+def _tag_stamps(tags):
+    keys = [_tag_key(tag) for tag in tags]
+    stamps = cache.get_many(keys)
+    missing = [key for key in keys if key not in stamps]
+    for key in missing:
+        cache.add(key, uuid.uuid4().hex[:12], None)
+    if missing:
+        stamps.update(cache.get_many(missing))
+    return ":".join(str(stamps.get(key, "")) for key in keys)
+
+
+def normalize_querystring(query_dict):
+    """
+    Querystring canonica: chaves e valores ordenados, sem valores vazios.
+    ?b=2&a=1&c= e ?a=1&b=2 partilham a mesma entrada.
+    """
+    items = []
+    for key in sorted(query_dict.keys()):
+        values = sorted(value.strip() for value in query_dict.getlist(key) if value.strip())
+        items.extend((key, value) for value in values)
+    return "&".join(f"{key}={value}" for key, value in items)
+
+
+def _is_cacheable_request(request):
+    if request.method not in ("GET", "HEAD"):
+        return False
+    session = getattr(request, "session", None)
+    if session is not None and session.get("user_id"):
+        return False
+    if getattr(request, "cart_count", 0):
+        return False
+    return True
+
+
+def _flush_stats():
+    global _stats_flushed_at
+    with _stats_lock:
+        pending = dict(_stats)
+        _stats.clear()
+        _stats_flushed_at = time.monotonic()
+    for (view_name, kind), count in pending.items():
+        key = _STATS_KEY.format(view=view_name, kind=kind)
+        if not cache.add(key, count, None):
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                cache.set(key, count, None)
+
+
+def _record(view_name, kind):
+    with _stats_lock:
+        _stats[(view_name, kind)] += 1
+        due = time.monotonic() - _stats_flushed_at >= PAGE_CACHE_STATS_FLUSH_INTERVAL
+    if due:
+        _flush_stats()
+
+
+def page_cache_stats():
+    """
+    Hits, misses e taxa de acerto por view. Aproximado: os outros processos
+    ainda podem ter ate PAGE_CACHE_STATS_FLUSH_INTERVAL segundos por somar.
+    """
+    _flush_stats()
+    views = sorted(_cached_views)
+    keys = [
+        _STATS_KEY.format(view=view, kind=kind)
+        for view in views
+        for kind in ("hit", "miss")
+    ]
+    values = cache.get_many(keys)
+    stats = {}
+    for view in views:
+        hits = values.get(_STATS_KEY.format(view=view, kind="hit"), 0)
+        misses = values.get(_STATS_KEY.format(view=view, kind="miss"), 0)
+        total = hits + misses
+        stats[view] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+    return stats
+
+
+def reset_page_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+    cache.delete_many(
+        [_STATS_KEY.format(view=view, kind=kind) for view in _cached_views for kind in ("hit", "miss")]
+    )
+
+
+def _respond(request, cached):
+    body, content_type = cached
+    body = body.replace(_CSRF_PLACEHOLDER, get_token(request))
+    response = HttpResponse(body, content_type=content_type)
+    response["X-Page-Cache"] = "HIT"
+    return response
+
+
+def cache_anonymous_page(*tags, timeout=PAGE_CACHE_TTL):
+    """
+    Cache da pagina inteira para visitantes anonimos sem carrinho.
+    A chave junta o caminho, a querystring normalizada e o carimbo de cada
+    tag; invalidate_page_cache(tag) torna obsoletas as paginas dessa tag.
+    """
+    def decorator(view):
+        view_name = view.__name__
+        _cached_views.add(view_name)
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _is_cacheable_request(request):
+                return view(request, *args, **kwargs)
+
+            raw = f"{request.path}?{normalize_querystring(request.GET)}"
+            digest = hashlib.sha1(raw.encode()).hexdigest()
+            key = f"pagecache:page:{view_name}:{_tag_stamps(tags)}:{digest}"
+
+            cached = cache.get(key)
+            if cached is not None:
+                _record(view_name, "hit")
+                return _respond(request, cached)
+
+            _record(view_name, "miss")
+            response = view(request, *args, **kwargs)
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and _is_cacheable_request(request)
+            ):
+                charset = response.charset or "utf-8"
+                body = _CSRF_INPUT_RE.sub(
+                    rf"\g<1>{_CSRF_PLACEHOLDER}\g<2>",
+                    response.content.decode(charset),
+                )
+                cache.set(key, (body, response["Content-Type"]), timeout)
+                response["X-Page-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,153 @@
+import base64
+import binascii
+import json
+import math
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+
+
+# Ordenacoes com paginacao por cursor: sort -> (campo, descendente).
+# A chave primaria desempata sempre no mesmo sentido do campo.
+WINE_KEYSET_SORTS = {
+    "name": ("name", False),
+    "-name": ("name", True),
+    "price": ("price", False),
+    "-price": ("price", True),
+    "-created_at": ("created_at", True),
+}
+
+EVENT_KEYSET_SORTS = {
+    "starts_at": ("starts_at", False),
+    "-starts_at": ("starts_at", True),
+    "price": ("price_cents", False),
+    "-price": ("price_cents", True),
+}
+
+
+def _encode_token(value, pk):
+    raw = json.dumps([None if value is None else str(value), str(pk)])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_token(token, field):
+    if not token:
+        return None
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        if value is not None:
+            value = field.to_python(value)
+        return value, field.model._meta.pk.to_python(pk)
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error, ValidationError):
+        return None
+
+
+def _ordering(field, pk_name, desc, nulls_last):
+    nulls = {"nulls_last": True} if nulls_last else {"nulls_first": True}
+    if desc:
+        return [F(field).desc(**nulls), F(pk_name).desc()]
+    return [F(field).asc(**nulls), F(pk_name).asc()]
+
+
+def _after(field, pk_name, desc, nulls_last, value, pk):
+    """
+    Condicao "linhas depois de (value, pk)" na ordem dada, tratando
+    valores NULL (created_at, price_cents podem ser nulos).
+    """
+    cmp = "lt" if desc else "gt"
+    same_value_null = Q(**{f"{field}__isnull": True, f"{pk_name}__{cmp}": pk})
+    if value is None:
+        if nulls_last:
+            return same_value_null
+        return same_value_null | Q(**{f"{field}__isnull": False})
+
+    condition = Q(**{f"{field}__{cmp}": value}) | Q(**{field: value, f"{pk_name}__{cmp}": pk})
+    if nulls_last:
+        condition |= Q(**{f"{field}__isnull": True})
+    return condition
+
+
+class KeysetPage:
+    """
+    Pagina obtida por cursor. Expoe o que o template usa do Page do Django
+    (number, has_next, has_previous, paginator.num_pages) e os tokens
+    para a pagina seguinte/anterior.
+    """
+
+    def __init__(self, object_list, number, total, per_page, next_token, previous_token):
+        self.object_list = object_list
+        self.number = number
+        self.count = total
+        self.num_pages = math.ceil(total / per_page) if total is not None else None
+        self.next_token = next_token
+        self.previous_token = previous_token
+
+    @property
+    def paginator(self):
+        return self
+
+    def has_next(self):
+        return self.next_token is not None
+
+    def has_previous(self):
+        return self.previous_token is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_page(queryset, sorts, sort, per_page, after=None, before=None, number=1, total=None):
+    """
+    Pagina de `queryset` ordenada por sorts[sort], a partir do token
+    `after` (seguinte) ou `before` (anterior). Cada pagina e um
+    WHERE (campo, pk) > (...) LIMIT per_page + 1, sem OFFSET nem COUNT:
+    o custo nao depende da profundidade. `total` (opcional) vem de uma
+    contagem em cache.
+    """
+    field_name, desc = sorts[sort]
+    field = queryset.model._meta.get_field(field_name)
+    pk_name = queryset.model._meta.pk.name
+    backwards = False
+    position = _decode_token(after, field)
+    if position is None and before:
+        position = _decode_token(before, field)
+        backwards = position is not None
+    if position is None:
+        number = 1
+
+    # Para tras percorre-se a ordem invertida (os NULL, que vao no fim da
+    # lista, passam para o inicio) e invertem-se as linhas no fim.
+    query_desc = desc != backwards
+    query_nulls_last = not backwards
+
+    qs = queryset.order_by(*_ordering(field_name, pk_name, query_desc, query_nulls_last))
+    if position is not None:
+        qs = qs.filter(_after(field_name, pk_name, query_desc, query_nulls_last, *position))
+
+    rows = list(qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def token(row):
+        return _encode_token(getattr(row, field_name), row.pk)
+
+    if backwards:
+        next_token = token(rows[-1]) if rows else None
+        previous_token = token(rows[0]) if rows and has_more else None
+    else:
+        next_token = token(rows[-1]) if rows and has_more else None
+        previous_token = token(rows[0]) if rows and position is not None else None
+
+    number = max(1, number)
+    if previous_token is None:
+        number = 1
+    return KeysetPage(rows, number, total, per_page, next_token, previous_token)
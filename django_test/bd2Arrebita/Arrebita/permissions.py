@@ -0,0 +1,62 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+
+_DEFAULT_TTL = 60
+
+_cache = {}
+_lock = threading.Lock()
+
+
+def _ttl():
+    return getattr(settings, "PERMISSION_CACHE_TTL", _DEFAULT_TTL)
+
+
+def _load_role_permissions(role):
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT permission FROM public.role_permissions WHERE role = %s;",
+            [role],
+        )
+        return frozenset(row[0] for row in cur.fetchall() if row[0])
+
+
+def role_permissions(role):
+    """
+    Devolve o conjunto de permissoes de um role.
+    Fica em cache no processo durante PERMISSION_CACHE_TTL segundos.
+    """
+    if not role:
+        return frozenset()
+
+    now = time.monotonic()
+    entry = _cache.get(role)
+    if entry and entry[0] > now:
+        return entry[1]
+
+    permissions = _load_role_permissions(role)
+    with _lock:
+        _cache[role] = (now + _ttl(), permissions)
+    return permissions
+
+
+def user_has_permission(user, *permissions):
+    if not user:
+        return False
+    granted = role_permissions(getattr(user, "role", None))
+    return any(perm in granted for perm in permissions if perm)
+
+
+def invalidate_role_permissions(role=None):
+    """
+    Limpa a cache de um role (ou de todos, quando role e None).
+    Chamado sempre que role_permissions e alterada.
+    """
+    with _lock:
+        if role is None:
+            _cache.clear()
+        else:
+            _cache.pop(role, None)
@@ -1,38 +1,485 @@
+import base64
+import binascii
 import datetime as dt
 
-from .mongo import get_reviews_collection
+from django.conf import settings
 
+from .circuit import CircuitBreaker, LastKnown
+from .mongo import MONGO_ERRORS, get_rating_summaries_collection, get_reviews_collection
+from .pagecache import invalidate_page_cache
 
-def create_review(wine_id, wine_name, user_name, rating, comment):
-    review = {
-        "wine_id": str(wine_id),
+
+RATING_VALUES = (1, 2, 3, 4, 5)
+
+# Quantos _id de reviews ja somadas ficam guardados em cada resumo: um
+# reenvio da mesma review (retry da outbox, import repetido) nao volta a
+# somar. Chega para os retries recentes; os resumos sao lidos sem o campo.
+SUMMARY_APPLIED_IDS = 500
+
+# Codigo do Mongo para chave duplicada.
+DUPLICATE_KEY = 11000
+
+# Campos que os templates mostram de uma review.
+REVIEW_FIELDS = ("wine_id", "wine_name", "user_name", "rating", "comment", "created_at")
+
+# O detalhe do vinho nao precisa de repetir o vinho em cada review.
+WINE_REVIEW_FIELDS = ("user_name", "rating", "comment", "created_at")
+
+
+# Todas as chamadas ao Mongo dos reviews passam por aqui: se o Atlas falhar
+# varias vezes seguidas, os pedidos seguintes falham logo (ou usam o ultimo
+# resultado conhecido) em vez de esperarem pelos timeouts.
+reviews_breaker = CircuitBreaker(
+    "mongo_reviews",
+    failure_threshold=getattr(settings, "MONGO_BREAKER_FAILURE_THRESHOLD", 3),
+    reset_timeout=getattr(settings, "MONGO_BREAKER_RESET_TIMEOUT", 30),
+    errors=MONGO_ERRORS,
+)
+
+_last_summaries = LastKnown(max_entries=5000)
+_last_pages = LastKnown(max_entries=512)
+
+
+def _unavailable(exc):
+    return RuntimeError(f"MongoDB indisponivel: {exc}")
+
+
+class ReviewRecord:
+    """
+    Review pronta para os templates, construida so com os campos projetados.
+    """
+
+    __slots__ = ("id",) + REVIEW_FIELDS
+
+    def __init__(self, doc):
+        self.id = str(doc.get("_id"))
+        self.wine_id = doc.get("wine_id")
+        self.wine_name = doc.get("wine_name")
+        self.user_name = doc.get("user_name")
+        self.comment = doc.get("comment")
+        self.created_at = doc.get("created_at")
+        try:
+            self.rating = int(doc.get("rating"))
+        except (TypeError, ValueError):
+            self.rating = 0
+
+
+def build_review(wine_id, wine_name, user_name, rating, comment, created_at=None):
+    """
+    Valida e normaliza uma review (mesmas regras dos formularios):
+    vinho obrigatorio, rating inteiro 1-5 e comentario nao vazio.
+    Levanta ValueError quando a review nao e valida.
+    """
+    wine_id = str(wine_id or "").strip()
+    if not wine_id:
+        raise ValueError("wine_id em falta")
+
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        raise ValueError(f"rating invalido: {rating!r}") from None
+    if rating not in RATING_VALUES:
+        raise ValueError(f"rating fora de 1-5: {rating}")
+
+    comment = (comment or "").strip()
+    if not comment:
+        raise ValueError("comentario vazio")
+
+    return {
+        "wine_id": wine_id,
         "wine_name": wine_name,
-        "user_name": user_name,
-        "rating": int(rating),
+        "user_name": (user_name or "").strip() or "Anonimo",
+        "rating": rating,
         "comment": comment,
-        "created_at": dt.datetime.utcnow(),
+        "created_at": created_at or dt.datetime.utcnow(),
     }
+
+
+def create_review(wine_id, wine_name, user_name, rating, comment):
+    review = build_review(wine_id, wine_name, user_name, rating, comment)
+    try:
+        reviews_breaker.call(_insert_review, review)
+    except MONGO_ERRORS as exc:
+        raise _unavailable(exc) from exc
+    invalidate_page_cache("ratings")
+
+
+def _insert_review(review):
     get_reviews_collection().insert_one(review)
+    _add_to_rating_summaries([review])
+
+
+def insert_reviews(reviews):
+    """
+    Insere um lote de reviews com insert_many(ordered=False) e soma-as aos
+    resumos de rating no mesmo passo. Devolve (inseridas, falhadas), onde
+    falhadas mapeia o indice no lote para o erro do Mongo (code, errmsg).
+
+    Uma review que ja existia (chave duplicada: o lote e um reenvio) conta
+    nas falhadas mas e somada ao resumo na mesma; a soma e idempotente,
+    por isso so fica contada uma vez.
+    Passa pelo circuit breaker; levanta RuntimeError se o Mongo falhar.
+    """
+    try:
+        return reviews_breaker.call(_insert_reviews, reviews)
+    except MONGO_ERRORS as exc:
+        raise _unavailable(exc) from exc
+
+
+def _insert_reviews(reviews):
+    try:
+        from pymongo.errors import BulkWriteError
+    except Exception as exc:  # pragma: no cover - runtime guard
+        raise RuntimeError(
+            "pymongo is required. Install it with `pip install pymongo`."
+        ) from exc
+
+    if not reviews:
+        return 0, {}
+
+    failed = {}
+    try:
+        get_reviews_collection().insert_many(reviews, ordered=False)
+    except BulkWriteError as exc:
+        for error in exc.details.get("writeErrors", []):
+            failed[error.get("index")] = error
+
+    stored = [
+        review
+        for index, review in enumerate(reviews)
+        if index not in failed or failed[index].get("code") == DUPLICATE_KEY
+    ]
+    if stored:
+        _add_to_rating_summaries(stored)
+        invalidate_page_cache("ratings")
+    return len(reviews) - len(failed), failed
+
+
+def _summary_update(review, now):
+    """
+    $inc de uma review no resumo do vinho, so se o _id da review ainda nao
+    estiver em `applied`. Se ja estiver, o filtro nao apanha o documento e
+    o upsert falha com chave duplicada (ignorada por quem chama).
+    """
+    from pymongo import UpdateOne
+
+    rating = review["rating"]
+    inc = {"count": 1, "sum": rating}
+    if rating in RATING_VALUES:
+        inc[f"histogram.{rating}"] = 1
+    return UpdateOne(
+        {"_id": str(review["wine_id"]), "applied": {"$ne": review["_id"]}},
+        {
+            "$inc": inc,
+            "$set": {"updated_at": now},
+            "$push": {"applied": {"$each": [review["_id"]], "$slice": -SUMMARY_APPLIED_IDS}},
+        },
+        upsert=True,
+    )
+
+
+def _add_to_rating_summaries(reviews):
+    """
+    Soma as reviews (ja com _id) aos resumos, uma operacao por review num
+    unico bulk_write. As chaves duplicadas sao repetidas uma vez: na
+    primeira review de um vinho dois upserts podem correr ao mesmo tempo;
+    com o documento ja criado, uma nova chave duplicada quer dizer que a
+    review ja estava somada.
+    """
+    try:
+        from pymongo.errors import BulkWriteError
+    except Exception as exc:  # pragma: no cover - runtime guard
+        raise RuntimeError(
+            "pymongo is required. Install it with `pip install pymongo`."
+        ) from exc
+
+    collection = get_rating_summaries_collection()
+    now = dt.datetime.utcnow()
+    operations = [_summary_update(review, now) for review in reviews]
+    for _attempt in range(2):
+        try:
+            collection.bulk_write(operations, ordered=False)
+            return
+        except BulkWriteError as exc:
+            errors = exc.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            operations = [operations[error["index"]] for error in errors]
 
 
-def list_reviews(wine_id=None, limit=50):
+def _summary_from_doc(doc):
+    count = int(doc.get("count") or 0)
+    total = doc.get("sum") or 0
+    histogram = doc.get("histogram") or {}
+    return {
+        "count": count,
+        "sum": total,
+        "avg": float(total) / count if count else 0.0,
+        "histogram": {value: int(histogram.get(str(value)) or 0) for value in RATING_VALUES},
+    }
+
+
+def rating_summaries(wine_ids):
+    """
+    Resumo de ratings (count, sum, avg, histograma) por vinho.
+    Le apenas os documentos dos vinhos pedidos em wine_rating_summaries.
+    """
+    str_ids = [str(wid) for wid in wine_ids]
+    if not str_ids:
+        return {}
+
+    try:
+        summaries = reviews_breaker.call(_fetch_rating_summaries, str_ids)
+    except MONGO_ERRORS as exc:
+        known = [wid for wid in str_ids if wid in _last_summaries]
+        if not known:
+            raise _unavailable(exc) from exc
+        return {
+            wid: summary
+            for wid, summary in ((wid, _last_summaries.get(wid)) for wid in known)
+            if summary and summary["count"]
+        }
+
+    for wid in str_ids:
+        _last_summaries.set(wid, summaries.get(wid) or _summary_from_doc({}))
+    return summaries
+
+
+def _fetch_rating_summaries(str_ids):
+    cursor = get_rating_summaries_collection().find({"_id": {"$in": str_ids}}, {"applied": 0})
+    return {doc["_id"]: _summary_from_doc(doc) for doc in cursor}
+
+
+def rating_summary(wine_id):
+    summary = rating_summaries([wine_id]).get(str(wine_id))
+    return summary or _summary_from_doc({})
+
+
+def rebuild_rating_summaries(batch_size=1000):
+    """
+    Recalcula wine_rating_summaries a partir de wine_reviews.
+    Usado para backfill; devolve o numero de vinhos com resumo.
+
+    Os resumos sao escritos numa colecao sombra (com os mesmos indices) que
+    no fim substitui a atual com um rename, por isso os leitores nunca veem
+    um resumo a meio. Tem de correr com as escritas de reviews paradas
+    (outbox esvaziada e flusher parado, sem imports): um $inc feito entre o
+    aggregate e o rename vai para a colecao antiga e perde-se.
+    """
+    try:
+        from pymongo import InsertOne
+    except Exception as exc:  # pragma: no cover - runtime guard
+        raise RuntimeError(
+            "pymongo is required. Install it with `pip install pymongo`."
+        ) from exc
+
+    group = {
+        "_id": "$wine_id",
+        "count": {"$sum": 1},
+        "sum": {"$sum": "$rating"},
+    }
+    for value in RATING_VALUES:
+        group[f"h{value}"] = {
+            "$sum": {"$cond": [{"$eq": ["$rating", value]}, 1, 0]}
+        }
+
+    summaries = get_rating_summaries_collection()
+    shadow = summaries.database[f"{summaries.name}_rebuild"]
+    shadow.drop()
+
+    now = dt.datetime.utcnow()
+    total = 0
+    batch = []
+    for row in get_reviews_collection().aggregate(
+        [{"$group": group}], allowDiskUse=True
+    ):
+        if row.get("_id") is None:
+            continue
+        total += 1
+        batch.append(
+            InsertOne(
+                {
+                    "_id": str(row["_id"]),
+                    "count": row.get("count") or 0,
+                    "sum": row.get("sum") or 0,
+                    "histogram": {str(value): row.get(f"h{value}") or 0 for value in RATING_VALUES},
+                    "updated_at": now,
+                }
+            )
+        )
+        if len(batch) >= batch_size:
+            shadow.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        shadow.bulk_write(batch, ordered=False)
+
+    if not total:
+        summaries.delete_many({})
+        return 0
+
+    for index in summaries.list_indexes():
+        if index["name"] != "_id_":
+            options = {key: value for key, value in index.items() if key not in ("key", "v", "ns")}
+            shadow.create_index(list(index["key"].items()), **options)
+    shadow.rename(summaries.name, dropTarget=True)
+    return total
+
+
+def _encode_cursor(doc):
+    created_at = doc.get("created_at")
+    if not isinstance(created_at, dt.datetime):
+        return None
+    raw = f"{created_at.isoformat()}|{doc.get('_id')}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(token):
+    if not token:
+        return None
+    try:
+        from bson import ObjectId
+        from bson.errors import InvalidId
+    except Exception as exc:  # pragma: no cover - runtime guard
+        raise RuntimeError(
+            "pymongo is required. Install it with `pip install pymongo`."
+        ) from exc
+
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        created_raw, _, oid_raw = raw.partition("|")
+        return dt.datetime.fromisoformat(created_raw), ObjectId(oid_raw)
+    except (ValueError, TypeError, UnicodeDecodeError, binascii.Error, InvalidId):
+        return None
+
+
+def _projection(fields):
+    projection = {field: 1 for field in fields}
+    projection["created_at"] = 1
+    return projection
+
+
+def list_reviews_page(wine_id=None, after=None, limit=50, fields=REVIEW_FIELDS):
+    """
+    Pagina de reviews por cursor em (created_at, _id), mais recentes primeiro.
+    `after` e o token opaco devolvido pela pagina anterior; devolve
+    (reviews, next_token), com next_token None quando nao ha mais.
+    Cada pagina e um range scan no indice, independentemente da profundidade.
+    So os `fields` pedidos vem do Mongo, ja convertidos em ReviewRecord.
+    """
+    key = (None if wine_id is None else str(wine_id), after or None, limit, tuple(fields))
+    try:
+        page = reviews_breaker.call(_fetch_reviews_page, wine_id, after, limit, fields)
+    except MONGO_ERRORS as exc:
+        page = _last_pages.get(key)
+        if page is None:
+            raise _unavailable(exc) from exc
+        return page
+
+    _last_pages.set(key, page)
+    return page
+
+
+def _page_query(wine_id, after):
     query = {}
     if wine_id is not None:
         query["wine_id"] = str(wine_id)
 
+    position = _decode_cursor(after)
+    if position:
+        created_at, oid = position
+        # Um unico range em created_at; o _id so desempata dentro do limite.
+        query["created_at"] = {"$lte": created_at}
+        query["$nor"] = [{"created_at": created_at, "_id": {"$gte": oid}}]
+    return query
+
+
+def _page_from_docs(docs, limit):
+    next_token = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_token = _encode_cursor(docs[-1])
+    return [ReviewRecord(doc) for doc in docs], next_token
+
+
+def _fetch_reviews_page(wine_id, after, limit, fields):
     cursor = (
         get_reviews_collection()
-        .find(query)
-        .sort("created_at", -1)
-        .limit(limit)
+        .find(_page_query(wine_id, after), _projection(fields))
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
     )
-    reviews = []
-    for doc in cursor:
-        doc["id"] = str(doc.get("_id"))
-        rating = doc.get("rating")
-        try:
-            doc["rating"] = int(rating)
-        except (TypeError, ValueError):
-            doc["rating"] = 0
-        reviews.append(doc)
-    return reviews
+    return _page_from_docs(list(cursor), limit)
+
+
+def wine_detail_reviews(wine_id, after=None, limit=50, fields=WINE_REVIEW_FIELDS):
+    """
+    Pagina de reviews e resumo de ratings (count, avg, histograma) de um
+    vinho numa unica ida ao Mongo. Devolve (reviews, next_token, summary).
+    """
+    str_id = str(wine_id)
+    key = ("detail", str_id, after or None, limit, tuple(fields))
+    try:
+        result = reviews_breaker.call(_fetch_wine_detail, str_id, after, limit, fields)
+    except MONGO_ERRORS as exc:
+        result = _last_pages.get(key)
+        if result is None:
+            raise _unavailable(exc) from exc
+        return result
+
+    _last_pages.set(key, result)
+    _last_summaries.set(str_id, result[2])
+    return result
+
+
+def _fetch_wine_detail(str_id, after, limit, fields):
+    # O $match + $limit 1 da uma unica review como semente (nenhuma se o
+    # vinho nao tiver reviews); cada faceta faz depois um $lookup indexado:
+    # a pagina pelo indice (wine_id, created_at, _id) e o resumo pelo _id
+    # em wine_rating_summaries. Assim nenhuma faceta le todas as reviews.
+    pipeline = [
+        {"$match": {"wine_id": str_id}},
+        {"$limit": 1},
+        {
+            "$facet": {
+                "page": [
+                    {
+                        "$lookup": {
+                            "from": settings.MONGO_COLLECTION,
+                            "pipeline": [
+                                {"$match": _page_query(str_id, after)},
+                                {"$sort": {"created_at": -1, "_id": -1}},
+                                {"$limit": limit + 1},
+                                {"$project": _projection(fields)},
+                            ],
+                            "as": "docs",
+                        }
+                    },
+                    {"$project": {"_id": 0, "docs": 1}},
+                ],
+                "summary": [
+                    {
+                        "$lookup": {
+                            "from": settings.MONGO_RATING_SUMMARIES_COLLECTION,
+                            "pipeline": [
+                                {"$match": {"_id": str_id}},
+                                {"$project": {"applied": 0}},
+                            ],
+                            "as": "docs",
+                        }
+                    },
+                    {"$project": {"_id": 0, "docs": 1}},
+                ],
+            }
+        },
+    ]
+    result = next(get_reviews_collection().aggregate(pipeline), None) or {}
+
+    def first_docs(facet):
+        rows = result.get(facet) or []
+        return rows[0].get("docs", []) if rows else []
+
+    reviews, next_token = _page_from_docs(first_docs("page"), limit)
+    summary_docs = first_docs("summary")
+    summary = _summary_from_doc(summary_docs[0] if summary_docs else {})
+    return reviews, next_token, summary
@@ -0,0 +1,145 @@
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from Events.models import EventListView
+from Wines.models import WINE_LIST_FIELDS
+from Wines.neighbours import LIST_COLUMNS
+from Wines.recommendations import EXCLUDED_ORDER_STATUSES
+from .reviews import list_reviews_page
+
+
+# Intervalo normal entre refrescamentos (comando refresh_home_rollups).
+HOME_ROLLUPS_TTL = 300
+
+# Se o agendamento parar, a home recalcula ela propria (uma vez, com
+# lock) quando os dados tiverem mais do que isto.
+HOME_ROLLUPS_MAX_AGE = 3 * HOME_ROLLUPS_TTL
+
+BEST_SELLERS_DAYS = 7
+HOME_CAROUSEL_SIZE = 8
+
+# Versao no nome: linhas em cache com outro formato nao chegam ao template.
+_ROLLUPS_KEY = "home:rollups:v2"
+_LOCK_KEY = "home:rollups:lock"
+
+_EVENT_FIELDS = (
+    "event_id", "title", "slug", "is_online", "venue_name", "city",
+    "starts_at", "price_cents", "currency_code", "is_free",
+)
+
+def _best_sellers(limit):
+    with connection.cursor() as cur:
+        cur.execute(
+            f"""
+            SELECT {LIST_COLUMNS}, top.quantity
+            FROM (
+                SELECT oi.wine_id, SUM(oi.quantity) AS quantity
+                FROM public.order_items oi
+                JOIN public.orders o ON o.order_id = oi.order_id
+                WHERE o.created_at >= now() - make_interval(days => %s)
+                  AND o.status::text <> ALL(%s)
+                GROUP BY oi.wine_id
+                ORDER BY quantity DESC, oi.wine_id
+                LIMIT %s
+            ) top
+            JOIN public.vw_wine_list w ON w.wine_id = top.wine_id
+            ORDER BY top.quantity DESC, w.name;
+            """,
+            [BEST_SELLERS_DAYS, list(EXCLUDED_ORDER_STATUSES), limit],
+        )
+        columns = list(WINE_LIST_FIELDS) + ["quantity"]
+        return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+
+def _latest_reviews(limit):
+    # O wine_id das reviews e texto livre (imports): so entram as que dao
+    # um UUID valido, senao o {% url %} da home levantava NoReverseMatch.
+    reviews, _next = list_reviews_page(limit=limit)
+    rows = []
+    for review in reviews:
+        try:
+            wine_id = uuid.UUID(str(review.wine_id).strip())
+        except (TypeError, ValueError):
+            continue
+        rows.append(
+            {
+                "wine_id": wine_id,
+                "wine_name": review.wine_name,
+                "user_name": review.user_name,
+                "rating": review.rating,
+                "comment": review.comment,
+                "created_at": review.created_at,
+            }
+        )
+    return rows
+
+
+def _upcoming_events(limit):
+    events = (
+        EventListView.objects.only(*_EVENT_FIELDS)
+        .filter(starts_at__gte=timezone.now())
+        .exclude(status__in=("draft", "cancelled", "archived"))
+        .order_by("starts_at", "event_id")[:limit]
+    )
+    rows = []
+    for event in events:
+        if event.is_free:
+            price = "Gratuito"
+        elif event.price_cents is None:
+            price = "Preco a definir"
+        else:
+            price = f"{(event.currency_code or 'EUR').strip() or 'EUR'} {event.price_cents / 100:.2f}"
+        rows.append(
+            {
+                "title": event.title or event.slug or f"Evento {event.event_id}",
+                # Como em Events.views: sem slug, event_detail aceita o UUID.
+                "detail_slug": event.slug or str(event.event_id),
+                "starts_at": event.starts_at,
+                "location": "Online" if event.is_online else (event.venue_name or event.city or ""),
+                "price": price,
+            }
+        )
+    return rows
+
+
+def refresh_home_rollups(limit=HOME_CAROUSEL_SIZE):
+    """
+    Recalcula os carrosseis da home (mais vendidos dos ultimos 7 dias,
+    ultimas reviews, proximos eventos) e guarda-os em cache.
+    Se uma das fontes falhar mantem-se o valor anterior dessa parte.
+    """
+    previous = cache.get(_ROLLUPS_KEY) or {}
+    rollups = {"built_at": time.time()}
+    sources = (
+        ("best_sellers", _best_sellers, DatabaseError),
+        ("reviews", _latest_reviews, RuntimeError),
+        ("events", _upcoming_events, DatabaseError),
+    )
+    for name, compute, errors in sources:
+        try:
+            rollups[name] = compute(limit)
+        except errors:
+            rollups[name] = previous.get(name, [])
+    cache.set(_ROLLUPS_KEY, rollups, None)
+    return rollups
+
+
+def home_rollups():
+    """
+    Carrosseis da home lidos da cache. Normalmente so o comando
+    refresh_home_rollups os calcula; um pedido so recalcula se a cache
+    estiver vazia ou muito antiga, e so um de cada vez.
+    """
+    rollups = cache.get(_ROLLUPS_KEY)
+    age = time.time() - rollups["built_at"] if rollups else None
+    if age is None or age > HOME_ROLLUPS_MAX_AGE:
+        if cache.add(_LOCK_KEY, 1, 60):
+            try:
+                rollups = refresh_home_rollups()
+            finally:
+                cache.delete(_LOCK_KEY)
+    return rollups or {"best_sellers": [], "reviews": [], "events": []}
@@ -0,0 +1,220 @@
+import gzip
+import mimetypes
+import os
+from email.utils import formatdate
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except Exception:  # pragma: no cover - brotli e opcional
+    brotli = None
+
+
+# Extensoes que vale a pena comprimir (imagens e fontes ja vem comprimidas).
+COMPRESSIBLE_EXTENSIONS = (".css", ".js", ".mjs", ".map", ".json", ".svg", ".txt", ".xml", ".html", ".ico")
+
+# Ficheiros mais pequenos que isto nao ganham nada com compressao.
+COMPRESS_MIN_SIZE = 512
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Nomes sem hash podem mudar no proximo deploy: cache curta com revalidacao.
+REVALIDATE_CACHE_CONTROL = "public, max-age=60, must-revalidate"
+
+# Ordem de preferencia quando o cliente aceita varias.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def _compress(content):
+    """
+    Versoes comprimidas de `content`: {".gz": bytes, ".br": bytes}. So as
+    que ficam pelo menos 5% mais pequenas.
+    """
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(content, quality=11)
+    return {
+        suffix: data
+        for suffix, data in variants.items()
+        if len(data) < len(content) * 0.95
+    }
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage (nomes com o hash do conteudo) que, no fim do
+    collectstatic, grava ao lado de cada ficheiro com hash as versoes .gz e
+    .br (se o modulo brotli estiver instalado).
+
+    Sem manifest (antes do primeiro collectstatic, em desenvolvimento ou
+    nos testes), ou para um ficheiro que nao existe, devolve o nome original
+    em vez de levantar ValueError: um asset em falta nao pode dar 500 a
+    pagina inteira.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed = []
+        for original, processed, changed in super().post_process(paths, dry_run, **options):
+            if isinstance(processed, str):
+                hashed.append(processed)
+            yield original, processed, changed
+
+        if dry_run:
+            return
+        for name in sorted(set(hashed)):
+            if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+                continue
+            with self.open(name) as fh:
+                content = fh.read()
+            if len(content) < COMPRESS_MIN_SIZE:
+                continue
+            for suffix, data in _compress(content).items():
+                if self.exists(name + suffix):
+                    self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(data))
+                yield name, name + suffix, True
+
+
+class StaticFile:
+    __slots__ = ("path", "size", "content_type", "last_modified", "etag", "immutable", "encoded")
+
+    def __init__(self, path, immutable):
+        stat = os.stat(path)
+        self.path = path
+        self.size = stat.st_size
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type in (
+            "application/javascript", "application/json", "image/svg+xml",
+        ):
+            self.content_type += "; charset=utf-8"
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        # Fraco: o mesmo recurso pode ir com ou sem Content-Encoding.
+        self.etag = f'W/"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+        self.immutable = immutable
+        # {"br": (caminho, tamanho), "gzip": (...)}
+        self.encoded = {}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.encoded[encoding] = (path + suffix, os.path.getsize(path + suffix))
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        token, *params = [item.strip() for item in part.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _sep, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token and quality > 0:
+            accepted.add(token.lower())
+    return accepted
+
+
+def _read_file(fh, block_size=64 * 1024):
+    try:
+        yield from iter(lambda: fh.read(block_size), b"")
+    finally:
+        fh.close()
+
+
+class StaticFilesApp:
+    """
+    Camada WSGI a frente da aplicacao Django para os ficheiros de
+    STATIC_ROOT. O indice e construido uma vez no arranque (os ficheiros so
+    mudam com um novo collectstatic + restart); por pedido e so um acesso
+    ao dicionario.
+
+    - nomes com hash (presentes no manifest) levam Cache-Control immutable;
+      os restantes uma cache curta com ETag/Last-Modified;
+    - escolhe a versao .br/.gz pelo Accept-Encoding e responde sempre com
+      Vary: Accept-Encoding quando existem versoes comprimidas;
+    - o corpo vai por wsgi.file_wrapper (sendfile no gunicorn/uwsgi).
+    """
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = root if root is not None else getattr(settings, "STATIC_ROOT", None)
+        self.prefix = "/" + (prefix or settings.STATIC_URL).strip("/") + "/"
+        self.files = self._scan() if self.root and os.path.isdir(self.root) else {}
+
+    def _hashed_names(self):
+        storage = CompressedManifestStaticFilesStorage(location=self.root)
+        return set(storage.hashed_files.values())
+
+    def _scan(self):
+        hashed = self._hashed_names()
+        compressed_suffixes = tuple(suffix for _encoding, suffix in ENCODINGS)
+        files = {}
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(compressed_suffixes):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                files[self.prefix + name] = StaticFile(path, name in hashed)
+        return files
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        static_file = self.files.get(path) if path.startswith(self.prefix) else None
+        if static_file is None:
+            return self.application(environ, start_response)
+        return self.serve(static_file, environ, start_response)
+
+    def serve(self, static_file, environ, start_response):
+        method = environ.get("REQUEST_METHOD", "GET")
+        if method not in ("GET", "HEAD"):
+            start_response("405 Method Not Allowed", [("Allow", "GET, HEAD"), ("Content-Length", "0")])
+            return []
+
+        headers = [
+            ("Content-Type", static_file.content_type),
+            ("Cache-Control", IMMUTABLE_CACHE_CONTROL if static_file.immutable else REVALIDATE_CACHE_CONTROL),
+            ("Last-Modified", static_file.last_modified),
+            ("ETag", static_file.etag),
+        ]
+        if static_file.encoded:
+            headers.append(("Vary", "Accept-Encoding"))
+
+        if not static_file.immutable and (
+            environ.get("HTTP_IF_NONE_MATCH") == static_file.etag
+            or environ.get("HTTP_IF_MODIFIED_SINCE") == static_file.last_modified
+        ):
+            start_response("304 Not Modified", headers)
+            return []
+
+        path, size = static_file.path, static_file.size
+        accepted = _accepted_encodings(environ.get("HTTP_ACCEPT_ENCODING"))
+        for encoding, _suffix in ENCODINGS:
+            if encoding in accepted and encoding in static_file.encoded:
+                path, size = static_file.encoded[encoding]
+                headers.append(("Content-Encoding", encoding))
+                break
+        headers.append(("Content-Length", str(size)))
+        start_response("200 OK", headers)
+
+        if method == "HEAD":
+            return []
+        fh = open(path, "rb")
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if file_wrapper is not None:
+            return file_wrapper(fh, 64 * 1024)
+        return _read_file(fh)
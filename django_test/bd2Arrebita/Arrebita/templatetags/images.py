@@ -0,0 +1,54 @@
+from django import template
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from Arrebita.images import source_image, srcsets, static_name, variant_widths
+
+register = template.Library()
+
+
+def _existing_static(url):
+    name = static_name(url)
+    return name if name and finders.find(name) else None
+
+
+@register.simple_tag
+def responsive_image(src, alt="", sizes="100vw", css_class="", loading="lazy", fallback=""):
+    """
+    <picture> com srcset WebP e JPEG/PNG em varias larguras para uma imagem
+    estatica ("img/a1.png" ou "/Static/img/a1.png"). URLs externos e
+    caminhos fora dos estaticos (/media/...) vao tal como vieram num <img>
+    simples; um estatico em falta usa o `fallback`.
+
+    static() so e chamado para ficheiros que existem: com o manifest um nome
+    desconhecido levanta ValueError e a pagina inteira dava 500.
+
+        {% responsive_image "img/a1.png" alt="..." sizes="33vw" css_class="card-img" %}
+    """
+    external = bool(src) and static_name(src) is None
+    name = None if external else (_existing_static(src) or _existing_static(fallback))
+    image = source_image(name) if name else None
+
+    attrs = [("alt", alt), ("loading", loading), ("decoding", "async")]
+    if css_class:
+        attrs.append(("class", css_class))
+
+    if image is None or not variant_widths(image):
+        url = src if external else (static(name) if name else None)
+        if url:
+            attrs.insert(0, ("src", url))
+        return format_html("<img{}>", format_html_join("", ' {}="{}"', attrs))
+
+    webp, alternative, default = srcsets(image)
+    attrs.extend([("width", image.width), ("height", image.height)])
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}"{}></picture>',
+        webp,
+        sizes,
+        default,
+        alternative,
+        sizes,
+        format_html_join("", ' {}="{}"', attrs),
+    )
@@ -0,0 +1,25 @@
+from unittest import mock
+
+
+def selected_columns(queryset):
+    """
+    Colunas que o SELECT de `queryset` vai buscar (usado nos testes das
+    projecoes das listas).
+    """
+    compiler = queryset.query.get_compiler(using=queryset.db)
+    select, _klass_info, _annotations = compiler.get_select()
+    return {
+        getattr(getattr(expr, "target", None), "column", None) or alias
+        for expr, _sql, alias in select
+    }
+
+
+def mock_connection():
+    """
+    (connection, cursor) falsos: connection.cursor() devolve sempre o mesmo
+    cursor, para os testes verem o SQL que as funcoes de raw SQL executam.
+    """
+    cursor = mock.MagicMock()
+    connection = mock.MagicMock()
+    connection.cursor.return_value.__enter__.return_value = cursor
+    return connection, cursor
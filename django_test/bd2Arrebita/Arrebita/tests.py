@@ -1,3 +1,795 @@
-from django.test import TestCase
+import base64
+import contextlib
+import datetime as dt
+import functools
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from bson import ObjectId
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.db.models import Q
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from Events.models import EventListView
+from Wines.models import WineListView
+
+from . import api, circuit, mongo, outbox, pagecache, permissions, reviews, rollups, views
+from .pagination import EVENT_KEYSET_SORTS, WINE_KEYSET_SORTS, keyset_page
+from .middleware import AccessControlMiddleware
+from .staticfiles import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, StaticFilesApp
+from .templatetags import images as image_tags
+
+
+def _review(wine_id="w1", rating=4):
+    return {
+        "_id": ObjectId(),
+        "wine_id": wine_id,
+        "wine_name": "Vinho",
+        "user_name": "Ana",
+        "rating": rating,
+        "comment": "Bom",
+        "created_at": dt.datetime(2024, 1, 1),
+    }
+
+
+def _duplicates(indexes):
+    return BulkWriteError({"writeErrors": [{"index": i, "code": reviews.DUPLICATE_KEY} for i in indexes]})
+
+
+class RatingSummaryIdempotencyTests(SimpleTestCase):
+    def setUp(self):
+        self.reviews_collection = mock.Mock()
+        self.summaries = mock.Mock()
+        for target, value in (
+            ("get_reviews_collection", self.reviews_collection),
+            ("get_rating_summaries_collection", self.summaries),
+            ("invalidate_page_cache", mock.Mock()),
+        ):
+            patcher = mock.patch.object(reviews, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_summary_update_is_guarded_by_review_id(self):
+        review = _review()
+        update = reviews._summary_update(review, dt.datetime(2024, 1, 1))
+        self.assertEqual(update._filter, {"_id": "w1", "applied": {"$ne": review["_id"]}})
+        self.assertEqual(update._doc["$push"]["applied"]["$each"], [review["_id"]])
+        self.assertEqual(update._doc["$inc"], {"count": 1, "sum": 4, "histogram.4": 1})
+
+    def test_duplicate_reviews_are_still_summarised(self):
+        # Retry de um lote ja inserido: todas as reviews dao chave duplicada,
+        # mas o resumo tem de ser (re)aplicado, de forma idempotente.
+        batch = [_review(), _review("w2", 2)]
+        self.reviews_collection.insert_many.side_effect = _duplicates([0, 1])
+
+        inserted, failed = reviews.insert_reviews(batch)
+
+        self.assertEqual(inserted, 0)
+        self.assertEqual(set(failed), {0, 1})
+        operations = self.summaries.bulk_write.call_args[0][0]
+        self.assertEqual([op._filter["_id"] for op in operations], ["w1", "w2"])
+
+    def test_connection_errors_become_runtime_errors(self):
+        self.reviews_collection.insert_many.side_effect = ServerSelectionTimeoutError("timeout")
+        with mock.patch.object(reviews.reviews_breaker, "call", wraps=reviews.reviews_breaker.call) as call, \
+                self.assertRaises(RuntimeError):
+            reviews.insert_reviews([_review()])
+        call.assert_called_once()
+        reviews.reviews_breaker._on_success()
+
+    def test_already_applied_summary_is_not_retried_forever(self):
+        self.summaries.bulk_write.side_effect = _duplicates([0])
+        reviews.insert_reviews([_review()])
+        self.assertEqual(self.summaries.bulk_write.call_count, 2)
+
+
+class _ReviewsCollection:
+    """
+    wine_reviews em memoria: so os operadores que o list_reviews_page usa
+    (igualdade, $lte, $gte, $nor), sort e limit.
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def _matches(self, doc, query):
+        for key, condition in query.items():
+            if key == "$nor":
+                if any(self._matches(doc, clause) for clause in condition):
+                    return False
+            elif isinstance(condition, dict):
+                value = doc.get(key)
+                if "$lte" in condition and not value <= condition["$lte"]:
+                    return False
+                if "$gte" in condition and not value >= condition["$gte"]:
+                    return False
+            elif doc.get(key) != condition:
+                return False
+        return True
+
+    def find(self, query, projection):
+        collection = self
+
+        class Cursor:
+            def sort(self, keys):
+                self.rows = [doc for doc in collection.docs if collection._matches(doc, query)]
+                for key, direction in reversed(keys):
+                    self.rows.sort(key=lambda doc: doc[key], reverse=direction < 0)
+                return self
+
+            def limit(self, count):
+                keys = set(projection) | {"_id"}
+                return [{key: value for key, value in doc.items() if key in keys} for doc in self.rows[:count]]
+
+        return Cursor()
+
+
+class ReviewsCursorTests(SimpleTestCase):
+    def test_pages_with_identical_timestamps_skip_and_repeat_nothing(self):
+        same = dt.datetime(2024, 5, 1, 12, 0)
+        docs = [dict(_review("w1"), created_at=same) for _ in range(7)]
+        docs += [dict(_review("w1"), created_at=same - dt.timedelta(minutes=1)) for _ in range(2)]
+        docs += [dict(_review("w2"), created_at=same) for _ in range(3)]
+        expected = [
+            str(doc["_id"])
+            for doc in sorted(
+                (doc for doc in docs if doc["wine_id"] == "w1"),
+                key=lambda doc: (doc["created_at"], doc["_id"]),
+                reverse=True,
+            )
+        ]
+
+        seen = []
+        after = None
+        with mock.patch.object(reviews, "get_reviews_collection", return_value=_ReviewsCollection(docs)), \
+                mock.patch.object(reviews, "_last_pages", circuit.LastKnown()):
+            while True:
+                page, after = reviews.list_reviews_page("w1", after=after, limit=3)
+                seen.append([review.id for review in page])
+                if after is None:
+                    break
+
+        self.assertEqual([len(ids) for ids in seen], [3, 3, 3])
+        self.assertEqual([review_id for ids in seen for review_id in ids], expected)
+
+
+class WineDetailReviewsTests(SimpleTestCase):
+    wine_id = "3f1c2a4e-8b7d-4c6e-9a1f-2b3c4d5e6f70"
+
+    def fetch(self, results, **options):
+        collection = mock.Mock()
+        collection.aggregate.return_value = iter(results)
+        with mock.patch.object(reviews, "get_reviews_collection", return_value=collection), \
+                mock.patch.object(reviews, "_last_pages", circuit.LastKnown()), \
+                mock.patch.object(reviews, "_last_summaries", circuit.LastKnown()):
+            result = reviews.wine_detail_reviews(self.wine_id, **options)
+        collection.aggregate.assert_called_once()
+        return result, collection.aggregate.call_args.args[0]
+
+    def test_page_and_summary_come_from_one_aggregate(self):
+        docs = [dict(_review(self.wine_id), created_at=dt.datetime(2024, 1, 3 - i)) for i in range(3)]
+        summary = {"_id": self.wine_id, "count": 3, "sum": 12, "histogram": {"4": 3}}
+        (page, next_token, rating), pipeline = self.fetch(
+            [{"page": [{"docs": docs}], "summary": [{"docs": [summary]}]}], limit=2,
+        )
+
+        self.assertEqual([review.id for review in page], [str(doc["_id"]) for doc in docs[:2]])
+        self.assertEqual(reviews._decode_cursor(next_token), (docs[1]["created_at"], docs[1]["_id"]))
+        self.assertEqual((rating["count"], rating["avg"], rating["histogram"][4]), (3, 4.0, 3))
+
+        self.assertEqual(pipeline[:2], [{"$match": {"wine_id": self.wine_id}}, {"$limit": 1}])
+        facets = pipeline[2]["$facet"]
+        page_lookup = facets["page"][0]["$lookup"]["pipeline"]
+        self.assertEqual(page_lookup[0], {"$match": {"wine_id": self.wine_id}})
+        self.assertEqual(page_lookup[2], {"$limit": 3})
+        self.assertEqual(
+            facets["summary"][0]["$lookup"]["pipeline"],
+            [{"$match": {"_id": self.wine_id}}, {"$project": {"applied": 0}}],
+        )
+
+    def test_after_token_narrows_the_page_lookup(self):
+        docs = [_review(self.wine_id)]
+        token = reviews._encode_cursor(docs[0])
+        _result, pipeline = self.fetch([], after=token)
+        match = pipeline[2]["$facet"]["page"][0]["$lookup"]["pipeline"][0]["$match"]
+        self.assertEqual(match["created_at"], {"$lte": docs[0]["created_at"]})
+
+    def test_wine_without_reviews(self):
+        (page, next_token, rating), _pipeline = self.fetch([])
+        self.assertEqual((page, next_token), ([], None))
+        self.assertEqual((rating["count"], rating["avg"]), (0, 0.0))
+
+
+class RebuildRatingSummariesTests(SimpleTestCase):
+    def test_rebuild_writes_a_shadow_collection_and_renames_it(self):
+        summaries = mock.MagicMock()
+        summaries.name = "wine_rating_summaries"
+        summaries.list_indexes.return_value = [
+            {"v": 2, "key": {"_id": 1}, "name": "_id_"},
+            {"v": 2, "key": {"updated_at": 1}, "name": "updated_at"},
+        ]
+        shadow = summaries.database.__getitem__.return_value
+        reviews_collection = mock.Mock()
+        reviews_collection.aggregate.return_value = iter([{"_id": "w1", "count": 2, "sum": 9, "h4": 1, "h5": 1}])
+
+        with mock.patch.object(reviews, "get_rating_summaries_collection", return_value=summaries), \
+                mock.patch.object(reviews, "get_reviews_collection", return_value=reviews_collection):
+            self.assertEqual(reviews.rebuild_rating_summaries(), 1)
+
+        summaries.database.__getitem__.assert_called_once_with("wine_rating_summaries_rebuild")
+        shadow.drop.assert_called_once()
+        shadow.create_index.assert_called_once_with([("updated_at", 1)], name="updated_at")
+        shadow.rename.assert_called_once_with("wine_rating_summaries", dropTarget=True)
+        summaries.bulk_write.assert_not_called()
+
+
+class OutboxFlushTests(SimpleTestCase):
+    def setUp(self):
+        self.cursor = mock.MagicMock()
+        connection = mock.Mock()
+        connection.cursor.return_value.__enter__ = mock.Mock(return_value=self.cursor)
+        connection.cursor.return_value.__exit__ = mock.Mock(return_value=False)
+        for target, value in (
+            ("connection", connection),
+            ("_ensure_outbox_table_once", mock.Mock()),
+        ):
+            patcher = mock.patch.object(outbox, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(outbox.transaction, "atomic", contextlib.nullcontext)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _row(self, outbox_id, attempts=0):
+        payload = dict(_review(), _id=str(ObjectId()), created_at="2024-01-01T00:00:00")
+        return (outbox_id, json.dumps(payload), attempts)
+
+    def test_mongo_is_called_after_the_claim_is_committed(self):
+        rows = [self._row(1), self._row(2)]
+        with mock.patch.object(outbox, "_claim_batch", return_value=rows), \
+                mock.patch.object(outbox, "insert_reviews", return_value=(1, {1: {"code": 11000}})) as insert:
+            delivered = outbox.flush_outbox()
+
+        self.assertEqual(delivered, 2)
+        insert.assert_called_once()
+        self.cursor.execute.assert_called_once()
+        self.assertIn("DELETE", self.cursor.execute.call_args[0][0])
+        self.assertEqual(self.cursor.execute.call_args[0][1], [[1, 2]])
+
+    def test_rows_are_dead_lettered_after_max_attempts(self):
+        rows = [self._row(1, attempts=19), self._row(2), (3, "{}", 0)]
+        errors = {0: {"code": 2, "errmsg": "erro"}, 1: {"code": 2, "errmsg": "erro"}}
+        with self.settings(REVIEW_OUTBOX_MAX_ATTEMPTS=20), \
+                mock.patch.object(outbox, "_claim_batch", return_value=rows), \
+                mock.patch.object(outbox, "insert_reviews", return_value=(0, errors)), \
+                self.assertLogs("Arrebita.outbox", "ERROR"):
+            delivered = outbox.flush_outbox()
+
+        self.assertEqual(delivered, 0)
+        params = {row[-1]: row for row in self.cursor.executemany.call_args[0][1]}
+        self.assertTrue(params[1][3])
+        self.assertFalse(params[2][3])
+        # Payload ilegivel vai logo para dead.
+        self.assertTrue(params[3][3])
+
+
+class ResponsiveImageTests(SimpleTestCase):
+    def setUp(self):
+        # Como o manifest com DEBUG desligado: nome desconhecido -> ValueError.
+        def strict_static(name):
+            if not image_tags.finders.find(name):
+                raise ValueError(f"Missing staticfiles manifest entry for '{name}'")
+            return f"/Static/{name}"
+
+        patcher = mock.patch.object(image_tags, "static", strict_static)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_non_static_paths_are_emitted_unchanged(self):
+        for src in ("/media/wines/x.jpg", "https://cdn.example.com/x.jpg"):
+            html = image_tags.responsive_image(src, fallback="img/arrebita_tinto.png")
+            self.assertIn(f'src="{src}"', html)
+
+    def test_missing_static_file_uses_fallback(self):
+        with mock.patch.object(image_tags, "source_image", return_value=None):
+            html = image_tags.responsive_image("img/apagada.png", fallback="img/arrebita_tinto.png")
+        self.assertIn('src="/Static/img/arrebita_tinto.png"', html)
+
+    def test_missing_file_without_fallback_has_no_src(self):
+        html = image_tags.responsive_image("/Static/img/apagada.png", alt="x")
+        self.assertNotIn("src=", html)
+
+
+class StaticFilesAppTests(SimpleTestCase):
+    css = "body { color: #5a1a2b; margin: 0 auto; }\n" * 100
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.tmp)
+        source = os.path.join(cls.tmp, "src")
+        os.makedirs(os.path.join(source, "css"))
+        with open(os.path.join(source, "css", "site.css"), "w") as fh:
+            fh.write(cls.css)
+
+        overrides = override_settings(
+            STATIC_ROOT=os.path.join(cls.tmp, "root"),
+            STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=["django.contrib.staticfiles.finders.FileSystemFinder"],
+        )
+        overrides.enable()
+        cls.addClassCleanup(overrides.disable)
+        call_command("collectstatic", interactive=False, verbosity=0)
+
+        cls.app = StaticFilesApp(lambda environ, start_response: [b"django"])
+        cls.hashed = cls.app.prefix + staticfiles_storage.stored_name("css/site.css")
+
+    def request(self, path, **environ):
+        response = {}
+
+        def start_response(status, headers):
+            response["status"] = status
+            response["headers"] = dict(headers)
+
+        body = b"".join(self.app({"PATH_INFO": path, "REQUEST_METHOD": "GET", **environ}, start_response))
+        return response.get("status"), response.get("headers", {}), body
+
+    def test_hashed_name_is_immutable_and_prefers_brotli(self):
+        self.assertNotEqual(self.hashed, self.app.prefix + "css/site.css")
+        status, headers, body = self.request(self.hashed, HTTP_ACCEPT_ENCODING="gzip, deflate, br")
+        self.assertEqual(status, "200 OK")
+        self.assertEqual(headers["Cache-Control"], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(headers["Vary"], "Accept-Encoding")
+        self.assertEqual(headers["Content-Encoding"], "br")
+        self.assertEqual(int(headers["Content-Length"]), len(body))
+        self.assertLess(len(body), len(self.css))
+
+    def test_encoding_negotiation(self):
+        _status, headers, body = self.request(self.hashed, HTTP_ACCEPT_ENCODING="gzip, br;q=0")
+        self.assertEqual(headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(body).decode(), self.css)
+
+        _status, headers, body = self.request(self.hashed)
+        self.assertNotIn("Content-Encoding", headers)
+        self.assertEqual(body.decode(), self.css)
+
+    def test_unhashed_name_revalidates(self):
+        path = self.app.prefix + "css/site.css"
+        _status, headers, _body = self.request(path)
+        self.assertEqual(headers["Cache-Control"], REVALIDATE_CACHE_CONTROL)
+        status, _headers, body = self.request(path, HTTP_IF_NONE_MATCH=headers["ETag"])
+        self.assertEqual(status, "304 Not Modified")
+        self.assertEqual(body, b"")
+
+    def test_other_paths_reach_django(self):
+        self.assertEqual(self.request(self.app.prefix + "css/nao-existe.css")[2], b"django")
+        self.assertEqual(self.request("/wines/")[2], b"django")
+
+    def test_missing_asset_keeps_unhashed_name(self):
+        self.assertEqual(staticfiles_storage.stored_name("css/nao-existe.css"), "css/nao-existe.css")
+
+
+class MongoHealthTests(SimpleTestCase):
+    def test_health_is_public(self):
+        self.assertTrue(AccessControlMiddleware._is_public_path("/health/mongo/"))
+
+    def test_body_has_only_the_state(self):
+        request = RequestFactory().get("/health/mongo/")
+        with mock.patch.object(views.reviews_breaker, "_state", views.reviews_breaker.OPEN), \
+                mock.patch.object(views.reviews_breaker, "_opened_at", float("inf")):
+            response = views.mongo_health(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(json.loads(response.content), {"mongo_reviews": "open"})
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(circuit.time, "monotonic", side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = circuit.CircuitBreaker("test", failure_threshold=3, reset_timeout=30, errors=(OSError,))
+
+    def fail(self):
+        with self.assertRaises(OSError):
+            self.breaker.call(mock.Mock(side_effect=OSError("down")))
+
+    def open_breaker(self):
+        for _ in range(3):
+            self.fail()
+
+    def test_opens_after_the_failure_threshold(self):
+        self.fail()
+        self.fail()
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+        self.fail()
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        func = mock.Mock()
+        with self.assertRaises(circuit.CircuitOpenError):
+            self.breaker.call(func)
+        func.assert_not_called()
+
+    def test_success_resets_the_failure_count(self):
+        self.fail()
+        self.fail()
+        self.breaker.call(mock.Mock())
+        self.fail()
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_half_open_after_the_cooldown(self):
+        self.open_breaker()
+        self.now += 29
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        self.now += 1
+        self.assertEqual(self.breaker.state, self.breaker.HALF_OPEN)
+
+    def test_successful_probe_closes(self):
+        self.open_breaker()
+        self.now += 30
+        self.assertEqual(self.breaker.call(mock.Mock(return_value="ok")), "ok")
+        self.assertEqual(self.breaker.state, self.breaker.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.now += 30
+        self.fail()
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+        self.now += 29
+        self.assertEqual(self.breaker.state, self.breaker.OPEN)
+
+    def test_only_one_probe_at_a_time(self):
+        self.open_breaker()
+        self.now += 30
+
+        def probe():
+            with self.assertRaises(circuit.CircuitOpenError):
+                self.breaker.call(mock.Mock())
+            return "ok"
+
+        self.assertEqual(self.breaker.call(probe), "ok")
+
+    def test_last_known_summaries_are_served_while_open(self):
+        breaker = circuit.CircuitBreaker("mongo_reviews", failure_threshold=1, reset_timeout=30, errors=mongo.MONGO_ERRORS)
+        summary = reviews._summary_from_doc({"count": 2, "sum": 9, "histogram": {"4": 1, "5": 1}})
+        fetch = mock.Mock(return_value={"w1": summary})
+        with mock.patch.object(reviews, "reviews_breaker", breaker), \
+                mock.patch.object(reviews, "_last_summaries", circuit.LastKnown()), \
+                mock.patch.object(reviews, "_fetch_rating_summaries", fetch):
+            self.assertEqual(reviews.rating_summaries(["w1"]), {"w1": summary})
+            fetch.side_effect = ServerSelectionTimeoutError("timeout")
+            self.assertEqual(reviews.rating_summaries(["w1"]), {"w1": summary})
+            self.assertEqual(breaker.state, breaker.OPEN)
+            fetch.reset_mock()
+            self.assertEqual(reviews.rating_summaries(["w1"]), {"w1": summary})
+            fetch.assert_not_called()
+            with self.assertRaises(RuntimeError):
+                reviews.rating_summaries(["w2"])
+
+
+class _Row:
+    def __init__(self, pk_name, pk, **values):
+        self.pk = pk
+        setattr(self, pk_name, pk)
+        self.__dict__.update(values)
+
+
+class _ListQuerySet:
+    """
+    Avalia em memoria o order_by(F().asc/desc(nulls_*)) e os filter(Q) que
+    o keyset_page gera, com a semantica do Postgres para NULL.
+    """
+
+    def __init__(self, model, rows):
+        self.model = model
+        self.rows = list(rows)
+
+    def order_by(self, *orderings):
+        def compare(a, b):
+            for ordering in orderings:
+                x, y = getattr(a, ordering.expression.name), getattr(b, ordering.expression.name)
+                if x == y:
+                    continue
+                if x is None or y is None:
+                    return (1 if x is None else -1) * (1 if ordering.nulls_last else -1)
+                result = -1 if x < y else 1
+                return -result if ordering.descending else result
+            return 0
+
+        return _ListQuerySet(self.model, sorted(self.rows, key=functools.cmp_to_key(compare)))
+
+    def filter(self, condition):
+        return _ListQuerySet(self.model, [row for row in self.rows if self._matches(row, condition)])
+
+    def _matches(self, row, condition):
+        results = []
+        for child in condition.children:
+            if isinstance(child, Q):
+                results.append(self._matches(row, child))
+                continue
+            lookup, value = child
+            name, _sep, op = lookup.partition("__")
+            actual = getattr(row, name)
+            if op == "isnull":
+                results.append((actual is None) == value)
+            elif op in ("lt", "gt"):
+                results.append(actual is not None and (actual < value if op == "lt" else actual > value))
+            else:
+                results.append(actual is not None and actual == value)
+        matched = all(results) if condition.connector == Q.AND else any(results)
+        return not matched if condition.negated else matched
+
+    def __getitem__(self, index):
+        return self.rows[index]
+
+
+class KeysetPaginationTests(SimpleTestCase):
+    def events(self):
+        # Precos repetidos (desempate pela pk) e NULL nos dois extremos da
+        # lista quando se anda para tras.
+        prices = [500, None, 1000, 500, None, 1000, 500, 0, None]
+        return _ListQuerySet(EventListView, [
+            _Row("event_id", uuid.UUID(int=i + 1), price_cents=price) for i, price in enumerate(prices)
+        ])
+
+    def wines(self):
+        created = [dt.datetime(2024, 1, 2), None, dt.datetime(2024, 1, 1), dt.datetime(2024, 1, 2), None]
+        return _ListQuerySet(WineListView, [
+            _Row("wine_id", uuid.UUID(int=i + 1), created_at=value) for i, value in enumerate(created)
+        ])
+
+    def walk(self, queryset, sorts, sort, per_page):
+        pages = []
+        page = keyset_page(queryset, sorts, sort, per_page)
+        pages.append(page)
+        while page.has_next():
+            page = keyset_page(queryset, sorts, sort, per_page, after=page.next_token, number=page.number + 1)
+            pages.append(page)
+        return pages
+
+    def ids(self, page):
+        return [row.pk.int for row in page]
+
+    def test_after_walks_every_row_once_in_order(self):
+        pages = self.walk(self.events(), EVENT_KEYSET_SORTS, "price", 2)
+        self.assertEqual([self.ids(page) for page in pages], [[8, 1], [4, 7], [3, 6], [2, 5], [9]])
+        self.assertEqual([page.number for page in pages], [1, 2, 3, 4, 5])
+        self.assertFalse(pages[0].has_previous())
+
+    def test_ties_are_broken_by_the_primary_key_in_both_directions(self):
+        pages = self.walk(self.wines(), WINE_KEYSET_SORTS, "-created_at", 2)
+        self.assertEqual([self.ids(page) for page in pages], [[4, 1], [3, 5], [2]])
+
+    def test_before_returns_the_same_pages_backwards(self):
+        for queryset, sorts, sort in (
+            (self.events(), EVENT_KEYSET_SORTS, "price"),
+            (self.events(), EVENT_KEYSET_SORTS, "-price"),
+            (self.wines(), WINE_KEYSET_SORTS, "-created_at"),
+        ):
+            forward = self.walk(queryset, sorts, sort, 2)
+            page = forward[-1]
+            backward = [page]
+            while page.has_previous():
+                page = keyset_page(queryset, sorts, sort, 2, before=page.previous_token, number=page.number - 1)
+                backward.append(page)
+            self.assertEqual(
+                [self.ids(page) for page in reversed(backward)],
+                [self.ids(page) for page in forward],
+                sort,
+            )
+            self.assertEqual(backward[-1].number, 1)
+
+    def test_null_page_boundaries(self):
+        # A pagina anterior a primeira linha NULL acaba no ultimo valor.
+        events = self.events()
+        pages = self.walk(events, EVENT_KEYSET_SORTS, "price", 2)
+        previous = keyset_page(events, EVENT_KEYSET_SORTS, "price", 2, before=pages[3].previous_token)
+        self.assertEqual(self.ids(previous), [3, 6])
+        self.assertEqual(self.ids(keyset_page(events, EVENT_KEYSET_SORTS, "price", 2, after=previous.next_token)), [2, 5])
+
+    def test_bad_cursors_fall_back_to_the_first_page(self):
+        events = self.events()
+        first = self.ids(keyset_page(events, EVENT_KEYSET_SORTS, "price", 2))
+        tampered = base64.urlsafe_b64encode(json.dumps(["abc", "not-a-uuid"]).encode()).decode()
+        for token in ("%%%", "bm90IGpzb24", tampered, base64.urlsafe_b64encode(b"[1]").decode()):
+            for options in ({"after": token}, {"before": token}):
+                page = keyset_page(events, EVENT_KEYSET_SORTS, "price", 2, number=7, **options)
+                self.assertEqual(self.ids(page), first, token)
+                self.assertEqual(page.number, 1)
+
+
+@override_settings(PERMISSION_CACHE_TTL=60)
+class RolePermissionsCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        for target, patcher in (
+            ("time", mock.patch.object(permissions.time, "monotonic", side_effect=lambda: self.now)),
+            ("load", mock.patch.object(permissions, "_load_role_permissions", return_value=frozenset({"wines.edit"}))),
+        ):
+            setattr(self, target, patcher.start())
+            self.addCleanup(patcher.stop)
+        permissions.invalidate_role_permissions()
+        self.addCleanup(permissions.invalidate_role_permissions)
+
+    def test_permissions_are_served_from_memory_within_the_ttl(self):
+        self.assertEqual(permissions.role_permissions("admin"), {"wines.edit"})
+        self.now += 59
+        self.assertTrue(permissions.user_has_permission(mock.Mock(role="admin"), "wines.edit"))
+        self.load.assert_called_once_with("admin")
+
+        self.now += 1
+        permissions.role_permissions("admin")
+        self.assertEqual(self.load.call_count, 2)
+
+    def test_invalidation_drops_one_role_or_all(self):
+        permissions.role_permissions("admin")
+        permissions.role_permissions("staff")
+        permissions.invalidate_role_permissions("admin")
+        permissions.role_permissions("staff")
+        self.assertEqual(self.load.call_count, 2)
+        permissions.role_permissions("admin")
+        self.assertEqual(self.load.call_count, 3)
+
+        permissions.invalidate_role_permissions()
+        permissions.role_permissions("staff")
+        self.assertEqual(self.load.call_count, 4)
+
+
+class LatestReviewsRollupTests(SimpleTestCase):
+    def test_reviews_with_invalid_wine_ids_are_dropped(self):
+        wine_id = "3f1c2a4e-8b7d-4c6e-9a1f-2b3c4d5e6f70"
+        docs = [dict(_review(wine_id=value), _id=str(i)) for i, value in enumerate((wine_id, "vinho-7", None))]
+        page = ([reviews.ReviewRecord(doc) for doc in docs], None)
+        with mock.patch.object(rollups, "list_reviews_page", return_value=page):
+            rows = rollups._latest_reviews(8)
+        self.assertEqual([str(row["wine_id"]) for row in rows], [wine_id])
+
+
+class ApiETagTests(SimpleTestCase):
+    fields = ("wine_id", "price", "has_active_promo", "promo_price", "updated_at")
+
+    def wine(self, **changes):
+        values = dict(wine_id="w1", price=12.5, has_active_promo=False, promo_price=None, updated_at=None)
+        values.update(changes)
+        return mock.Mock(pk="w1", **values)
+
+    def test_promo_change_without_updated_at_changes_etag(self):
+        request = RequestFactory().get("/api/wines/w1/")
+        before = api.api_detail(request, "wine", self.wine(), self.fields, self.fields)
+        after = api.api_detail(request, "wine", self.wine(has_active_promo=True, promo_price=9.9), self.fields, self.fields)
+        self.assertNotEqual(before["ETag"], after["ETag"])
+
+    def test_matching_etag_returns_304(self):
+        first = api.api_detail(RequestFactory().get("/api/wines/w1/"), "wine", self.wine(), self.fields, self.fields)
+        request = RequestFactory().get("/api/wines/w1/", HTTP_IF_NONE_MATCH=first["ETag"])
+        response = api.api_detail(request, "wine", self.wine(), self.fields, self.fields)
+        self.assertEqual(response.status_code, 304)
+
+    def test_payload_is_serialised_once(self):
+        request = RequestFactory().get("/api/wines/w1/")
+        with mock.patch.object(api.json, "dumps", wraps=json.dumps) as dumps:
+            response = api.api_detail(request, "wine", self.wine(price=9.5), self.fields, self.fields)
+        dumps.assert_called_once()
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content)["price"], 9.5)
+
+
+class MongoIndexesTests(SimpleTestCase):
+    def test_rating_summaries_get_an_updated_at_index(self):
+        collections = {}
+
+        def collection(name):
+            created = collections.setdefault(name, mock.Mock())
+            created.name = name
+            created.create_index.side_effect = lambda keys, name: name
+            return created
+
+        with mock.patch.object(mongo, "get_reviews_collection", return_value=collection("wine_reviews")), \
+                mock.patch.object(mongo, "get_rating_summaries_collection", return_value=collection("wine_rating_summaries")):
+            names = mongo.ensure_review_indexes()
+
+        self.assertIn("wine_rating_summaries.updated_at", names)
+        collections["wine_rating_summaries"].create_index.assert_called_once_with(
+            [("updated_at", mongo.ASCENDING)], name="updated_at"
+        )
+
+
+class HomeUpcomingEventsTests(SimpleTestCase):
+    def test_event_without_slug_links_by_id(self):
+        event_id = "0b7e6f2a-1c3d-4e5f-8a9b-0c1d2e3f4a5b"
+        event = mock.Mock(
+            event_id=event_id, title="Prova", slug="", is_online=True, venue_name=None, city=None,
+            starts_at=dt.datetime(2030, 1, 1, 20), price_cents=None, currency_code=None, is_free=True,
+        )
+        with mock.patch.object(rollups.EventListView, "objects") as objects:
+            objects.only.return_value.filter.return_value.exclude.return_value.order_by.return_value = [event]
+            events = rollups._upcoming_events(8)
+
+        request = RequestFactory().get("/")
+        request.session = {}
+        home_rollups = {"best_sellers": [], "reviews": [], "events": events}
+        with mock.patch.object(views, "home_rollups", return_value=home_rollups), \
+                mock.patch.object(views, "recommended_for_wines", return_value=[]):
+            response = views.home(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'href="/events/{event_id}/"', count=2)
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "pagecache-tests"}})
+class PageCacheTests(SimpleTestCase):
+    def setUp(self):
+        pagecache.cache.clear()
+        self.calls = 0
+
+        @pagecache.cache_anonymous_page("wines")
+        def page(request):
+            self.calls += 1
+            return HttpResponse(
+                f'<form><input type="hidden" name="csrfmiddlewaretoken" value="token-{self.calls}"></form>'
+            )
+
+        self.page = page
+
+    def get(self, path="/wines/", session=None, cart_count=0):
+        request = RequestFactory().get(path)
+        request.session = session or {}
+        request.cart_count = cart_count
+        return request, self.page(request)
+
+    def test_second_anonymous_request_is_a_hit(self):
+        self.get()
+        _request, response = self.get()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+
+    def test_logged_in_users_and_carts_bypass_the_cache(self):
+        self.get()
+        for options in ({"session": {"user_id": 7}}, {"cart_count": 2}):
+            _request, response = self.get(**options)
+            self.assertNotIn("X-Page-Cache", response)
+        self.assertEqual(self.calls, 3)
+
+    def test_invalidating_a_tag_expires_its_pages(self):
+        self.get()
+        pagecache.invalidate_page_cache("events")
+        self.get()
+        self.assertEqual(self.calls, 1)
+        pagecache.invalidate_page_cache("wines")
+        _request, response = self.get()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+
+    def test_hits_get_the_visitors_own_csrf_token(self):
+        self.get()
+        with mock.patch.object(pagecache, "get_token", return_value="visitor-token"):
+            _request, response = self.get()
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value="visitor-token"')
+        self.assertNotContains(response, "token-1")
+
+    def test_querystrings_are_normalised(self):
+        self.assertEqual(
+            pagecache.normalize_querystring(QueryDict("b=2&a=1&c=&b=1")),
+            pagecache.normalize_querystring(QueryDict("a=1&b=1&b=2")),
+        )
+        self.get("/wines/?b=2&a=1&c=")
+        _request, response = self.get("/wines/?a=1&b=2")
+        self.assertEqual(response["X-Page-Cache"], "HIT")
+
+    def test_counters_reach_the_shared_cache_in_batches(self):
+        pagecache.reset_page_cache_stats()
+        with mock.patch.object(pagecache.cache, "incr") as incr:
+            self.get()
+            self.get()
+            self.get()
+        incr.assert_not_called()
+        stats = pagecache.page_cache_stats()["page"]
+        self.assertEqual((stats["hits"], stats["misses"]), (2, 1))
@@ -4,5 +4,7 @@ from . import views
 urlpatterns = [
     path("", views.home, name="home"),
     path("comunidade/", views.community, name="community"),
+    path("health/mongo/", views.mongo_health, name="mongo_health"),
+    path("img/<str:variant>/<path:source>", views.image_variant, name="image_variant"),
 
 ]
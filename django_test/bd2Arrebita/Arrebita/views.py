@@ -1,21 +1,69 @@
+from django.http import FileResponse, Http404, JsonResponse
 from django.shortcuts import render, redirect
+from django.urls import reverse
 
+from Orders.models import OrderItem
 from Wines.models import WineListView
-from .reviews import create_review, list_reviews
+from Wines.recommendations import recommended_for_wines
+from .images import (
+    CONTENT_TYPES,
+    IMAGE_WIDTHS,
+    ensure_variant,
+    fallback_ext,
+    parse_variant,
+    source_image,
+    variant_url,
+)
+from .outbox import submit_review
+from .reviews import list_reviews_page, reviews_breaker
+from .rollups import home_rollups
+
+def _recommendation_seeds(request):
+    # Vinhos do carrinho; sem carrinho, os das ultimas compras do utilizador.
+    cart = request.session.get("cart", {})
+    if isinstance(cart, dict):
+        wines = cart.get("wines", {}) if ("wines" in cart or "events" in cart) else cart
+        if isinstance(wines, dict) and wines:
+            return list(wines)
+    user_id = request.session.get("user_id")
+    if user_id:
+        return list(
+            OrderItem.objects.filter(order__user_id=user_id)
+            .order_by("-order_id")
+            .values_list("wine_id", flat=True)[:20]
+        )
+    return []
+
 
 def home(request):
-    # placeholders que podes depois ligar a BD
+    # Os carrosseis vem de rollups em cache (ver Arrebita.rollups): a home
+    # nao corre agregacoes por pedido.
+    rollups = home_rollups()
+    recommended = recommended_for_wines(_recommendation_seeds(request))
+    next_event = rollups["events"][0] if rollups["events"] else None
+    wines_url = reverse("wine:winelist")
+
     destaques = [
-        {"tipo": "Populares", "titulo": "Top da Semana", "img": "img/a2.png", "cta":"Ver vinhos"},
-        {"tipo": "Recomendados", "titulo": "Para Ti", "img": "img/a1.png", "cta":"Ver sugestões"},
-        {"tipo": "Eventos", "titulo": "Noite Arrebita", "img": "img/a3.png", "cta":"Saber mais"},
+        {"tipo": "Populares", "titulo": "Top da Semana", "img": "img/a2.png", "cta": "Ver vinhos",
+         "url": "#top-semana" if rollups["best_sellers"] else wines_url},
+        {"tipo": "Recomendados", "titulo": "Para Ti", "img": "img/a1.png", "cta": "Ver sugestões",
+         "url": "#para-ti" if recommended else wines_url},
+        {"tipo": "Eventos", "titulo": next_event["title"] if next_event else "Noite Arrebita",
+         "img": "img/a3.png", "cta": "Saber mais",
+         "url": reverse("events:event_detail", args=[next_event["detail_slug"]])
+         if next_event else reverse("events:eventlist")},
     ]
-    feed = [
-        {"user":"@colaco", "avatar":"img/u4.jpg", "texto":"Este Merlot… ui! 🔥", "rating":5, "img":"img/c5.jpg"},
-        {"user":"@joao", "avatar":"img/u6.jpg", "texto":"Tinto sedutor, corpo e final longo.", "rating":4, "img":"img/c10.jpg"},
-        {"user":"@pires", "avatar":"img/u2.jpg", "texto":"Rosé travesso — leve e divertido 😜", "rating":4, "img":"img/c7.jpg"},
-    ]
-    return render(request, "home.html", {"destaques": destaques, "feed": feed})
+    return render(
+        request,
+        "home.html",
+        {
+            "destaques": destaques,
+            "best_sellers": rollups["best_sellers"],
+            "feed": rollups["reviews"],
+            "events": rollups["events"],
+            "recommended": recommended,
+        },
+    )
 
 
 def community(request):
@@ -41,7 +89,7 @@ def community(request):
             error = "Preenche vinho, comentario e rating (1-5)."
         else:
             try:
-                create_review(
+                submit_review(
                     wine_id=wine.wine_id,
                     wine_name=wine.name,
                     user_name=user_name,
@@ -52,8 +100,9 @@ def community(request):
             except RuntimeError:
                 error = "Erro ao ligar ao MongoDB."
 
+    next_cursor = None
     try:
-        reviews = list_reviews(limit=60)
+        reviews, next_cursor = list_reviews_page(after=request.GET.get("after"), limit=60)
     except RuntimeError:
         reviews = []
         if not error:
@@ -62,9 +111,42 @@ def community(request):
     context = {
         "wines": wines,
         "reviews": reviews,
+        "next_cursor": next_cursor,
         "error": error,
     }
     return render(request, "community.html", context)
 
 
+def mongo_health(request):
+    """
+    Health check publico (monitorizacao anonima): so o estado do circuit
+    breaker do Mongo (closed / half_open / open), 503 quando esta aberto.
+    Contadores e ultimo erro ficam fora da resposta.
+    """
+    state = reviews_breaker.state
+    status = 503 if state == reviews_breaker.OPEN else 200
+    return JsonResponse({"mongo_reviews": state}, status=status)
+
+
+def image_variant(request, variant, source):
+    """
+    Variante redimensionada de uma imagem estatica (ver Arrebita.images).
+    O nome leva o hash do conteudo, por isso a resposta e imutavel; um hash
+    antigo redireciona para a variante atual.
+    """
+    parsed = parse_variant(variant)
+    image = source_image(source)
+    if parsed is None or image is None:
+        raise Http404("Imagem nao encontrada.")
+    width, digest, ext = parsed
+    if width not in IMAGE_WIDTHS or width > image.width or ext not in ("webp", fallback_ext(image)):
+        raise Http404("Variante invalida.")
+    if digest != image.digest:
+        return redirect(variant_url(image, width, ext))
+
+    response = FileResponse(open(ensure_variant(image, width, ext), "rb"), content_type=CONTENT_TYPES[ext])
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 # Create your views here.
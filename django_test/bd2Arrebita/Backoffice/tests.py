@@ -1,3 +1,61 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.test import RequestFactory, SimpleTestCase
+
+from Arrebita import permissions
+from Arrebita.testing import mock_connection, selected_columns
+from Events.models import EVENT_BACKOFFICE_FIELDS
+
+from . import views
+from .views import _events_list_queryset
+
+
+class BackofficeEventsProjectionTests(SimpleTestCase):
+    def test_backoffice_list_skips_derived_columns(self):
+        request = RequestFactory().get("/backoffice/events/", {"q": "porto", "sort": "price"})
+        events_qs, _filters = _events_list_queryset(request)
+
+        columns = selected_columns(events_qs)
+        self.assertEqual(columns, set(EVENT_BACKOFFICE_FIELDS))
+        self.assertFalse(columns & {"published_at", "is_published", "start_date", "updated_at"})
+
+
+class UserAccessPermissionCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.connection, self.cursor = mock_connection()
+        self.cursor.fetchall.return_value = []
+        self.user = mock.Mock(user_id=5, role="staff")
+        users = mock.Mock()
+        users.objects.order_by.return_value = [self.user]
+        users.objects.get.return_value = self.user
+        users.DoesNotExist = LookupError
+        for target, value in (("connection", self.connection), ("User", users)):
+            patcher = mock.patch.object(views, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        permissions.invalidate_role_permissions()
+        self.addCleanup(permissions.invalidate_role_permissions)
+        patcher = mock.patch.object(permissions, "_load_role_permissions", return_value=frozenset())
+        self.load = patcher.start()
+        self.addCleanup(patcher.stop)
+        permissions.role_permissions("staff")
+        permissions.role_permissions("admin")
+
+    def post(self, data):
+        request = RequestFactory().post("/backoffice/users/access/", dict(data, user_id="5"))
+        response = views.backoffice_user_access(request)
+        self.assertEqual(response.status_code, 302)
+
+    def test_saving_a_role_invalidates_that_role(self):
+        self.post({"permissions": ["wines.edit"]})
+        permissions.role_permissions("admin")
+        self.assertEqual(self.load.call_count, 2)
+        permissions.role_permissions("staff")
+        self.assertEqual(self.load.call_count, 3)
+
+    def test_deleting_a_permission_invalidates_every_role(self):
+        self.post({"delete_permission": "wines.edit"})
+        permissions.role_permissions("admin")
+        permissions.role_permissions("staff")
+        self.assertEqual(self.load.call_count, 4)
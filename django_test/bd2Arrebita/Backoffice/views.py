@@ -13,9 +13,14 @@ from django.utils.text import slugify
 from openpyxl import Workbook, load_workbook
 
 from Accounts.models import User
-from Events.models import EventListView
+from Accounts.session import bump_user_version
+from Arrebita.pagecache import invalidate_page_cache
+from Arrebita.permissions import invalidate_role_permissions
+from Events.models import EVENT_BACKOFFICE_FIELDS, EventListView
 from Orders.models import Order, Invoice, OrderItem, OrderEventItem
 from Wines.models import WineListView
+from Wines.facets import invalidate_wine_facets
+from Wines.search import match_sql, rank_sql, refresh_wine_search_safely, search_ready
 
 EVENT_STATUS_LABELS = {
     "draft": "Rascunho",
@@ -359,8 +364,13 @@ def backoffice_wines(request):
           """
     params = []
 
-    # 5) Filtro de pesquisa geral (nome / SKU)
-    if q:
+    # 5) Filtro de pesquisa geral (nome / SKU / regiao / castas / enologo)
+    use_search = bool(q) and search_ready()
+    if use_search:
+        match, match_params = match_sql(q)
+        sql += f" AND wine_id IN (SELECT s.wine_id FROM public.wine_search s WHERE {match})"
+        params.extend(match_params)
+    elif q:
         sql += " AND (name ILIKE %s OR sku ILIKE %s)"
         params.extend([f"%{q}%", f"%{q}%"])
 
@@ -378,6 +388,17 @@ def backoffice_wines(request):
     if only_on_promo:
         sql += " AND has_active_promo = TRUE"
 
+    # Resultados da pesquisa ordenados por relevancia
+    if use_search:
+        rank, rank_params = rank_sql(q)
+        sql += f"""
+          ORDER BY (
+              SELECT {rank} FROM public.wine_search s
+              WHERE s.wine_id = vw_wine_list.wine_id
+          ) DESC, name
+          """
+        params.extend(rank_params)
+
     # 9) Execução da query de vinhos
     with connection.cursor() as cur:
         cur.execute(sql, params)
@@ -456,6 +477,10 @@ def backoffice_wine_create(request):
             params,
         )
 
+    refresh_wine_search_safely(skus=[data.get("sku")])
+    invalidate_wine_facets()
+    invalidate_page_cache("wines")
+
     return redirect(reverse("backoffice:backoffice_wines"))
 
 
@@ -511,6 +536,10 @@ def backoffice_wine_update(request, wine_id):
             params,
         )
 
+    refresh_wine_search_safely(wine_ids=[wine_uuid])
+    invalidate_wine_facets()
+    invalidate_page_cache("wines")
+
     return redirect(reverse("backoffice:backoffice_wines"))
 
 
@@ -518,12 +547,17 @@ def backoffice_wine_delete(request, wine_id):
     if request.method != "POST":
         return redirect(reverse("backoffice:backoffice_wines"))
 
+    wine_uuid = wine_id if isinstance(wine_id, uuid.UUID) else uuid.UUID(str(wine_id))
     with connection.cursor() as cur:
         cur.execute(
             "CALL public.delete_wine(%s);",
-            [wine_id if isinstance(wine_id, uuid.UUID) else uuid.UUID(str(wine_id))],
+            [wine_uuid],
         )
 
+    refresh_wine_search_safely(wine_ids=[wine_uuid])
+    invalidate_wine_facets()
+    invalidate_page_cache("wines")
+
     return redirect(reverse("backoffice:backoffice_wines"))
 
 
@@ -550,6 +584,8 @@ def backoffice_wine_image_create(request, wine_id):
             [wine_id if isinstance(wine_id, uuid.UUID) else uuid.UUID(str(wine_id)), image_url, image_type],
         )
 
+    invalidate_page_cache("wines")
+
     return redirect(reverse("backoffice:backoffice_wines"))
 
 
@@ -566,11 +602,19 @@ def backoffice_wine_image_delete(request, wine_id, image_id):
             [image_id if isinstance(image_id, uuid.UUID) else uuid.UUID(str(image_id))],
         )
 
+    invalidate_page_cache("wines")
+
     return redirect(reverse("backoffice:backoffice_wines"))
 
 
-def backoffice_events(request):
+def _events_list_queryset(request):
+    # A lista so precisa destas colunas; o export continua com todas.
     events_qs, filters = _events_queryset_from_request(request)
+    return events_qs.only(*EVENT_BACKOFFICE_FIELDS), filters
+
+
+def backoffice_events(request):
+    events_qs, filters = _events_list_queryset(request)
 
     events = list(events_qs[:200])
     for event in events:
@@ -739,6 +783,8 @@ def backoffice_event_create(request):
         )
         cur.execute("REFRESH MATERIALIZED VIEW public.mv_events_all;")
 
+    invalidate_page_cache("events")
+
     return redirect(reverse("backoffice:backoffice_events"))
 
 
@@ -870,6 +916,8 @@ def backoffice_event_update(request, event_id):
         )
         cur.execute("REFRESH MATERIALIZED VIEW public.mv_events_all;")
 
+    invalidate_page_cache("events")
+
     return redirect(reverse("backoffice:backoffice_events"))
 
 
@@ -1312,6 +1360,8 @@ def backoffice_events_import(request):
     with connection.cursor() as cur:
         cur.execute("REFRESH MATERIALIZED VIEW public.mv_events_all;")
 
+    invalidate_page_cache("events")
+
     return redirect(reverse("backoffice:backoffice_events"))
 
 
@@ -1326,6 +1376,8 @@ def backoffice_event_delete(request, event_id):
         )
         cur.execute("REFRESH MATERIALIZED VIEW public.mv_events_all;")
 
+    invalidate_page_cache("events")
+
     return redirect(reverse("backoffice:backoffice_events"))
 
 
@@ -1715,6 +1767,7 @@ def backoffice_user_update(request, user_id):
 
     with connection.cursor() as cur:
         cur.execute(sql, params)
+    bump_user_version(user_id)
 
     return redirect(reverse("backoffice:backoffice_users"))
 
@@ -1811,6 +1864,7 @@ def backoffice_user_access(request):
                     """,
                     [rename_new, rename_old],
                 )
+            invalidate_role_permissions()
 
             return redirect(f"{request.path}?user_id={selected_user.user_id}")
 
@@ -1821,6 +1875,7 @@ def backoffice_user_access(request):
                     "DELETE FROM public.role_permissions WHERE permission = %s;",
                     [delete_permission],
                 )
+            invalidate_role_permissions()
             return redirect(f"{request.path}?user_id={selected_user.user_id}")
 
         selected = set(request.POST.getlist("permissions"))
@@ -1863,6 +1918,7 @@ def backoffice_user_access(request):
                     """,
                     [selected_user.role, perm, desc],
                 )
+        invalidate_role_permissions(selected_user.role)
 
         return redirect(f"{request.path}?user_id={selected_user.user_id}")
 
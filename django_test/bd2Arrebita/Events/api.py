@@ -0,0 +1,46 @@
+import uuid
+
+from django.http import Http404
+
+from Arrebita.api import api_detail, api_list
+from Arrebita.pagination import EVENT_KEYSET_SORTS
+
+from .models import EventListView
+from .views import filter_events
+
+
+EVENT_API_FIELDS = tuple(field.attname for field in EventListView._meta.concrete_fields)
+
+EVENT_API_DEFAULT_FIELDS = (
+    "event_id", "title", "slug", "summary", "is_online", "venue_name",
+    "city", "region", "country_code", "starts_at", "ends_at", "timezone",
+    "price_cents", "currency_code", "is_free", "status",
+)
+
+
+def event_list_api(request):
+    """
+    GET /api/events/ — mesmos filtros da lista HTML (mode, price, status,
+    timing), ?fields=, ?sort=, ?limit= e cursor.
+    """
+    return api_list(
+        request,
+        "events",
+        filter_events(EventListView.objects.all(), request.GET),
+        EVENT_KEYSET_SORTS,
+        "starts_at",
+        EVENT_API_FIELDS,
+        EVENT_API_DEFAULT_FIELDS,
+    )
+
+
+def event_detail_api(request, slug):
+    event = EventListView.objects.filter(slug=slug).first()
+    if not event:
+        try:
+            event = EventListView.objects.filter(event_id=uuid.UUID(str(slug))).first()
+        except (ValueError, TypeError):
+            event = None
+    if not event:
+        raise Http404("Evento nao encontrado")
+    return api_detail(request, "event", event, EVENT_API_FIELDS, EVENT_API_FIELDS)
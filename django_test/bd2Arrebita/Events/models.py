@@ -1,6 +1,33 @@
 from django.db import models
 
 
+# Colunas que cada pagina le de mv_events_all. Na lista publica o resumo
+# vem ja cortado da BD (summary_excerpt), sem trazer a description inteira.
+EVENT_LIST_FIELDS = (
+    "event_id", "title", "slug", "is_online", "online_url",
+    "venue_name", "city", "region", "country_code",
+    "starts_at", "ends_at", "timezone", "capacity",
+    "price_cents", "currency_code", "is_free", "status",
+    "is_upcoming", "is_finished", "duration",
+)
+
+EVENT_CART_FIELDS = (
+    "event_id", "title", "slug", "is_online", "venue_name",
+    "city", "region", "country_code", "starts_at", "price_cents", "is_free",
+)
+
+# O backoffice precisa dos campos editaveis (modal de edicao), incluindo
+# summary e description; ficam de fora as colunas so derivadas.
+EVENT_BACKOFFICE_FIELDS = EVENT_LIST_FIELDS + (
+    "summary", "description", "address_line1", "address_line2",
+    "postal_code", "latitude", "longitude",
+)
+
+# Caracteres de resumo trazidos para a lista (o corte final e feito em
+# Events.views._format_summary).
+EVENT_SUMMARY_EXCERPT = 400
+
+
 class EventListView(models.Model):
     event_id = models.UUIDField(primary_key=True)
     title = models.CharField(max_length=255)
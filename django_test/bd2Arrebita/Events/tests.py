@@ -1,3 +1,14 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from Arrebita.testing import selected_columns
+
+from .models import EVENT_LIST_FIELDS
+from .views import _list_queryset
+
+
+class EventListProjectionTests(SimpleTestCase):
+    def test_eventlist_fetches_list_columns_and_summary_excerpt(self):
+        columns = selected_columns(_list_queryset())
+        self.assertEqual(columns, set(EVENT_LIST_FIELDS) | {"summary_excerpt"})
+        self.assertNotIn("description", columns)
+        self.assertNotIn("summary", columns)
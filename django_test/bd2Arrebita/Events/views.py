@@ -1,9 +1,13 @@
 import uuid
 
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Value
+from django.db.models.functions import Coalesce, Left, NullIf
 from django.shortcuts import render, get_object_or_404
 
-from .models import EventListView
+from Arrebita.pagecache import cache_anonymous_page
+
+from .models import EVENT_LIST_FIELDS, EVENT_SUMMARY_EXCERPT, EventListView
 
 STATUS_LABELS = {
     "draft": "Rascunho",
@@ -36,7 +40,10 @@ def _format_location(event):
 
 
 def _format_summary(event, limit=180):
-    text = (event.summary or event.description or "").strip()
+    if hasattr(event, "summary_excerpt"):
+        text = (event.summary_excerpt or "").strip()
+    else:
+        text = (event.summary or event.description or "").strip()
     if not text:
         return ""
     if len(text) > limit:
@@ -58,14 +65,25 @@ def _format_duration(event):
     return f"{minutes}m"
 
 
-def eventlist(request):
-    mode = request.GET.get("mode", "").strip()
-    price = request.GET.get("price", "").strip()
-    status = request.GET.get("status", "").strip()
-    timing = request.GET.get("timing", "").strip()
-    sort = request.GET.get("sort", "").strip()
+def _list_queryset():
+    # So as colunas que a lista mostra; o resumo vem cortado da BD.
+    return EventListView.objects.only(*EVENT_LIST_FIELDS).annotate(
+        summary_excerpt=Left(
+            Coalesce(NullIf("summary", Value("")), "description"),
+            EVENT_SUMMARY_EXCERPT,
+        )
+    )
 
-    events_qs = EventListView.objects.all()
+
+def filter_events(events_qs, params):
+    """
+    Filtros da lista de eventos (mode, price, status, timing), partilhados
+    pela pagina HTML e pela API JSON.
+    """
+    mode = params.get("mode", "").strip()
+    price = params.get("price", "").strip()
+    status = params.get("status", "").strip()
+    timing = params.get("timing", "").strip()
 
     if mode == "online":
         events_qs = events_qs.filter(is_online=True)
@@ -87,6 +105,19 @@ def eventlist(request):
     elif timing == "ongoing":
         events_qs = events_qs.filter(is_upcoming=False, is_finished=False)
 
+    return events_qs
+
+
+@cache_anonymous_page("events")
+def eventlist(request):
+    mode = request.GET.get("mode", "").strip()
+    price = request.GET.get("price", "").strip()
+    status = request.GET.get("status", "").strip()
+    timing = request.GET.get("timing", "").strip()
+    sort = request.GET.get("sort", "").strip()
+
+    events_qs = filter_events(_list_queryset(), request.GET)
+
     allowed_sorts = {
         "starts_at": "starts_at",
         "-starts_at": "-starts_at",
@@ -156,6 +187,7 @@ def eventlist(request):
     return render(request, "events-list.html", context)
 
 
+@cache_anonymous_page("events")
 def event_detail(request, slug):
     event = EventListView.objects.filter(slug=slug).first()
     if not event:
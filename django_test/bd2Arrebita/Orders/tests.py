@@ -1,3 +1,20 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from Arrebita.testing import selected_columns
+from Events.models import EVENT_CART_FIELDS
+from Wines.models import WINE_CART_FIELDS
+
+from .views import _cart_querysets
+
+
+class CartProjectionTests(SimpleTestCase):
+    def test_cart_fetches_only_cart_columns(self):
+        wines, events = _cart_querysets(["3f1c2a4e-8b7d-4c6e-9a1f-2b3c4d5e6f70"], [])
+
+        wine_columns = selected_columns(wines)
+        self.assertEqual(wine_columns, set(WINE_CART_FIELDS))
+        self.assertFalse(wine_columns & {"tasting_notes", "pairing", "winemaker", "grape_varieties"})
+
+        event_columns = selected_columns(events)
+        self.assertEqual(event_columns, set(EVENT_CART_FIELDS))
+        self.assertFalse(event_columns & {"summary", "description"})
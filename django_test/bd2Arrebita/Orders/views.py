@@ -6,8 +6,8 @@ from django.db import connection
 from django.http import HttpResponse
 from django.utils import timezone
 
-from Wines.models import WineListView
-from Events.models import EventListView
+from Wines.models import WINE_CART_FIELDS, WineListView
+from Events.models import EVENT_CART_FIELDS, EventListView
 from .models import Order, Invoice
 from .forms import OrderForm
 from .pdf_utils import build_invoice_pdf
@@ -91,17 +91,19 @@ def _event_unit_price(event):
     return (Decimal(event.price_cents) / Decimal("100")).quantize(Decimal("0.01"))
 
 
+def _cart_querysets(wine_ids, event_ids):
+    # So as colunas que o carrinho mostra e usa nos precos.
+    wines = WineListView.objects.only(*WINE_CART_FIELDS).filter(wine_id__in=wine_ids)
+    events = EventListView.objects.only(*EVENT_CART_FIELDS).filter(event_id__in=event_ids)
+    return wines, events
+
+
 def _cart_items(cart):
     wines_bucket = cart.get("wines", {}) if isinstance(cart, dict) else {}
     events_bucket = cart.get("events", {}) if isinstance(cart, dict) else {}
 
-    wine_ids = list(wines_bucket.keys())
-    event_ids = list(events_bucket.keys())
-
-    wines = WineListView.objects.filter(wine_id__in=wine_ids)
+    wines, events = _cart_querysets(list(wines_bucket.keys()), list(events_bucket.keys()))
     wine_map = {str(wine.wine_id): wine for wine in wines}
-
-    events = EventListView.objects.filter(event_id__in=event_ids)
     event_map = {str(event.event_id): event for event in events}
 
     items = []
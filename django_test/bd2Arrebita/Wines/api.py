@@ -0,0 +1,40 @@
+from django.shortcuts import get_object_or_404
+
+from Arrebita.api import api_detail, api_list
+from Arrebita.pagination import WINE_KEYSET_SORTS
+
+from .models import WineListView
+from .views import filter_min_rating, filter_wines
+
+
+WINE_API_FIELDS = tuple(field.attname for field in WineListView._meta.concrete_fields)
+
+WINE_API_DEFAULT_FIELDS = (
+    "wine_id", "sku", "name", "type_label", "region", "vintage_year",
+    "price", "promo_price", "has_active_promo", "primary_image_url",
+)
+
+
+def wine_list_api(request):
+    """
+    GET /api/wines/ — mesmos filtros da lista HTML (q, type, min, max,
+    region, decade, rating), ?fields=, ?sort=, ?limit= e cursor.
+    """
+    wines_qs, filters = filter_wines(WineListView.objects.all(), request.GET)
+    if filters["rating"] is not None:
+        wines_qs = filter_min_rating(wines_qs, filters["rating"])
+
+    return api_list(
+        request,
+        "wines",
+        wines_qs,
+        WINE_KEYSET_SORTS,
+        "name",
+        WINE_API_FIELDS,
+        WINE_API_DEFAULT_FIELDS,
+    )
+
+
+def wine_detail_api(request, wine_id):
+    wine = get_object_or_404(WineListView, wine_id=wine_id)
+    return api_detail(request, "wine", wine, WINE_API_FIELDS, WINE_API_FIELDS)
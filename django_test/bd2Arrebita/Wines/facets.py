@@ -0,0 +1,237 @@
+import hashlib
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db import connection
+
+from .models import WineType
+from .ratings import ratings_synced
+from .search import like_escape, match_sql, search_ready
+
+
+FACETS_TTL = 300
+
+# Limites superiores dos escaloes de preco (o ultimo fica aberto).
+PRICE_BUCKETS = (10, 20, 50, 100)
+
+# Precos tem 2 casas decimais (vw_wine_list.price numeric(8,2)).
+PRICE_STEP = 0.01
+
+_GENERATION_KEY = "wine_facets:generation"
+
+
+def _generation():
+    generation = cache.get(_GENERATION_KEY)
+    if generation is None:
+        generation = uuid.uuid4().hex[:12]
+        cache.add(_GENERATION_KEY, generation, None)
+        generation = cache.get(_GENERATION_KEY) or generation
+    return generation
+
+
+def invalidate_wine_facets():
+    """
+    Invalida todas as contagens (e a lista de tipos) em cache.
+    Chamado depois das escritas de vinhos no backoffice.
+    """
+    cache.set(_GENERATION_KEY, uuid.uuid4().hex[:12], None)
+
+
+def cached_wine_types():
+    key = f"wine_types:{_generation()}"
+    types = cache.get(key)
+    if types is None:
+        types = list(WineType.objects.all().order_by("name"))
+        cache.set(key, types, FACETS_TTL)
+    return types
+
+
+def normalize_filters(q="", types=(), min_price=None, max_price=None, rating=None,
+                      region="", decade=None):
+    """
+    Filtros do catalogo numa forma canonica (ordem, espacos, numeros), para
+    que pedidos equivalentes partilhem a mesma entrada de cache.
+    """
+    def to_float(value):
+        try:
+            return float(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    def to_int(value):
+        try:
+            return int(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            return None
+
+    return {
+        "q": " ".join((q or "").lower().split()),
+        "types": sorted({str(t) for t in types if t}),
+        "min": to_float(min_price),
+        "max": to_float(max_price),
+        "rating": to_int(rating) if to_int(rating) in (1, 2, 3, 4, 5) else None,
+        "region": (region or "").strip(),
+        "decade": to_int(decade),
+    }
+
+
+def _cache_key(filters):
+    raw = json.dumps(filters, sort_keys=True)
+    return f"wine_facets:{_generation()}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def _build_query(filters):
+    """
+    Uma unica query com GROUPING SETS. Cada faceta conta com todos os
+    filtros exceto o seu (assim os outros valores continuam a mostrar
+    quantos vinhos dariam), usando COUNT(*) FILTER.
+    """
+    # Limites como literal (constantes): o GROUPING() tem de ver a mesma
+    # expressao do GROUP BY.
+    buckets = "'{" + ",".join(str(int(b)) for b in PRICE_BUCKETS) + "}'::numeric[]"
+
+    base = ["TRUE"]
+    base_params = []
+    joins = ""
+
+    q = filters["q"]
+    if q and search_ready():
+        match, match_params = match_sql(q)
+        base.append(f"w.wine_id IN (SELECT s.wine_id FROM public.wine_search s WHERE {match})")
+        base_params.extend(match_params)
+    elif q:
+        base.append(
+            "(w.name ILIKE %s ESCAPE '\\' OR w.region ILIKE %s ESCAPE '\\' OR w.type_label ILIKE %s ESCAPE '\\')"
+        )
+        base_params.extend([f"%{like_escape(q)}%"] * 3)
+
+    if filters["rating"] is not None and ratings_synced():
+        joins = "LEFT JOIN public.wine_ratings r ON r.wine_id = w.wine_id"
+        base.append("COALESCE(r.rating_avg, 0) >= %s")
+        base_params.append(filters["rating"])
+
+    conditions = {
+        "type": ("TRUE", []),
+        "region": ("TRUE", []),
+        "vintage": ("TRUE", []),
+        "price": ("TRUE", []),
+    }
+    if filters["types"]:
+        conditions["type"] = ("w.type_id::text = ANY(%s)", [filters["types"]])
+    if filters["region"]:
+        conditions["region"] = ("w.region = %s", [filters["region"]])
+    if filters["decade"] is not None:
+        conditions["vintage"] = (
+            "w.vintage_year >= %s AND w.vintage_year < %s",
+            [filters["decade"], filters["decade"] + 10],
+        )
+    price_parts, price_params = [], []
+    if filters["min"] is not None:
+        price_parts.append("w.price >= %s")
+        price_params.append(filters["min"])
+    if filters["max"] is not None:
+        price_parts.append("w.price <= %s")
+        price_params.append(filters["max"])
+    if price_parts:
+        conditions["price"] = (" AND ".join(price_parts), price_params)
+
+    counts = []
+    count_params = []
+    for facet in ("type", "region", "vintage", "price", None):
+        parts = [sql for name, (sql, _p) in conditions.items() if name != facet]
+        for name, (_sql, params) in conditions.items():
+            if name != facet:
+                count_params.extend(params)
+        counts.append(f"COUNT(*) FILTER (WHERE {' AND '.join(parts)})")
+
+    sql = f"""
+        SELECT
+            GROUPING(w.type_id, w.type_label) AS g_type,
+            GROUPING(w.region) AS g_region,
+            GROUPING((w.vintage_year / 10) * 10) AS g_vintage,
+            GROUPING(width_bucket(w.price, {buckets})) AS g_price,
+            w.type_id, w.type_label, w.region,
+            (w.vintage_year / 10) * 10 AS decade,
+            width_bucket(w.price, {buckets}) AS price_bucket,
+            {counts[0]} AS count_type,
+            {counts[1]} AS count_region,
+            {counts[2]} AS count_vintage,
+            {counts[3]} AS count_price,
+            {counts[4]} AS count_all
+        FROM public.vw_wine_list w
+        {joins}
+        WHERE {' AND '.join(base)}
+        GROUP BY GROUPING SETS (
+            (w.type_id, w.type_label),
+            (w.region),
+            ((w.vintage_year / 10) * 10),
+            (width_bucket(w.price, {buckets})),
+            ()
+        );
+    """
+    params = count_params + base_params
+    return sql, params
+
+
+def price_bucket_max_param(high):
+    """
+    Valor do ?max= (inclusivo, price <= max) do link de um escalao. O
+    width_bucket conta [low, high), por isso o link vai ate ao preco
+    anterior a `high`: um vinho a exatamente 20 EUR fica so no 20-50.
+    """
+    return f"{high - PRICE_STEP:.2f}"
+
+
+def _price_bucket_bounds(index):
+    # width_bucket devolve 0 abaixo do primeiro limite e len(limites) acima
+    # do ultimo.
+    low = PRICE_BUCKETS[index - 1] if index > 0 else 0
+    high = PRICE_BUCKETS[index] if index < len(PRICE_BUCKETS) else None
+    return low, high
+
+
+def _compute_facets(filters):
+    sql, params = _build_query(filters)
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+
+    facets = {"types": {}, "regions": [], "vintages": [], "prices": [], "total": 0}
+    for (g_type, g_region, g_vintage, g_price, type_id, type_label, region,
+         decade, price_bucket, count_type, count_region, count_vintage,
+         count_price, count_all) in rows:
+        if not g_type:
+            if type_id is not None:
+                facets["types"][str(type_id)] = count_type
+        elif not g_region:
+            if region:
+                facets["regions"].append({"value": region, "count": count_region})
+        elif not g_vintage:
+            if decade is not None:
+                facets["vintages"].append({"value": decade, "count": count_vintage})
+        elif not g_price:
+            if price_bucket is not None:
+                low, high = _price_bucket_bounds(price_bucket)
+                facets["prices"].append({"min": low, "max": high, "count": count_price})
+        else:
+            facets["total"] = count_all
+
+    facets["regions"].sort(key=lambda item: item["value"])
+    facets["vintages"].sort(key=lambda item: item["value"], reverse=True)
+    facets["prices"].sort(key=lambda item: item["min"])
+    return facets
+
+
+def wine_facets(filters):
+    """
+    Contagens por tipo, regiao, decada de colheita e escalao de preco para
+    os filtros dados (ver normalize_filters). Cache por filtros normalizados;
+    invalidada por invalidate_wine_facets().
+    """
+    key = _cache_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = _compute_facets(filters)
+        cache.set(key, facets, FACETS_TTL)
+    return facets
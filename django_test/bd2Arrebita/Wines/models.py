@@ -1,6 +1,19 @@
 from django.db import models
 
 
+# Colunas que cada pagina le de vw_wine_list. As colunas de texto longo
+# (tasting_notes, pairing, ...) ficam de fora das listagens.
+WINE_LIST_FIELDS = (
+    "wine_id", "name", "type_label", "region", "vintage_year", "price", "created_at",
+    "primary_image_url",
+)
+
+WINE_CART_FIELDS = (
+    "wine_id", "name", "type_label", "region", "price", "promo_price", "has_active_promo",
+    "primary_image_url",
+)
+
+
 class WineType(models.Model):
     type_id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
@@ -13,6 +26,22 @@ class WineType(models.Model):
         return self.name
 
 
+class WineRating(models.Model):
+    """
+    Copia em SQL dos ratings do Mongo (ver Wines.ratings.sync_wine_ratings).
+    """
+
+    wine_id = models.UUIDField(primary_key=True)
+    rating_count = models.IntegerField()
+    rating_sum = models.BigIntegerField()
+    rating_avg = models.DecimalField(max_digits=4, decimal_places=3)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        db_table = "wine_ratings"
+        managed = False
+
+
 class WineListView(models.Model):
     wine_id = models.UUIDField(primary_key=True)
     sku = models.CharField(max_length=100)
@@ -0,0 +1,65 @@
+from django.db import DatabaseError
+
+from .models import WINE_LIST_FIELDS, WineListView
+
+try:
+    import numpy as np
+    from scipy import sparse
+except Exception as exc:  # pragma: no cover - runtime guard
+    np = None
+    sparse = None
+    _import_error = exc
+
+
+# Partilhado pelos indices de vizinhos (recomendacoes e vinhos semelhantes):
+# tabelas (wine_id, rank, <vizinho>) lidas por uma juncao a vw_wine_list.
+
+LIST_COLUMNS = ", ".join(f"w.{field}" for field in WINE_LIST_FIELDS)
+
+# Linhas por INSERT multi-row.
+INSERT_PAGE_SIZE = 1000
+
+
+def require_numpy():
+    if np is None or sparse is None:
+        raise RuntimeError(
+            "numpy and scipy are required. Install them with `pip install numpy scipy`."
+        ) from _import_error
+
+
+def insert_rows(cur, sql, rows, suffix=""):
+    """
+    INSERT ... VALUES (...), (...), ... com INSERT_PAGE_SIZE linhas por
+    statement, em vez de um statement (e uma ida a base) por linha como o
+    executemany.
+    """
+    for start in range(0, len(rows), INSERT_PAGE_SIZE):
+        page = rows[start:start + INSERT_PAGE_SIZE]
+        placeholders = "(" + ", ".join(["%s"] * len(page[0])) + ")"
+        cur.execute(
+            f"{sql} VALUES {', '.join([placeholders] * len(page))} {suffix};",
+            [value for row in page for value in row],
+        )
+
+
+def neighbour_wines(table, neighbour_column, wine_id, limit):
+    """
+    Vizinhos guardados de `wine_id` em `table`, ja ordenados por rank.
+    Uma leitura pela chave primaria (wine_id, rank), junta a vw_wine_list.
+    """
+    try:
+        return list(
+            WineListView.objects.raw(
+                f"""
+                SELECT {LIST_COLUMNS}
+                FROM public.{table} n
+                JOIN public.vw_wine_list w ON w.wine_id = n.{neighbour_column}
+                WHERE n.wine_id = %s
+                ORDER BY n.rank
+                LIMIT %s;
+                """,
+                [wine_id, limit],
+            )
+        )
+    except DatabaseError:
+        return []
@@ -0,0 +1,211 @@
+import datetime as dt
+import heapq
+import time
+import uuid
+
+from django.db import DatabaseError, connection, transaction
+
+from Arrebita.mongo import get_rating_summaries_collection
+from Arrebita.pagecache import invalidate_page_cache
+
+
+SYNC_SOURCE = "wine_rating_summaries"
+
+# Margem aplicada ao watermark para tolerar relogios ligeiramente diferentes
+# entre os servidores que escrevem os resumos.
+WATERMARK_OVERLAP = dt.timedelta(seconds=60)
+
+
+def _ensure_wine_ratings_table():
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_ratings (
+                wine_id uuid NOT NULL,
+                rating_count integer NOT NULL DEFAULT 0,
+                rating_sum bigint NOT NULL DEFAULT 0,
+                rating_avg numeric(4, 3) NOT NULL DEFAULT 0,
+                updated_at timestamptz NOT NULL DEFAULT now(),
+                CONSTRAINT wine_ratings_pkey PRIMARY KEY (wine_id)
+            );
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_wine_ratings_avg ON public.wine_ratings (rating_avg DESC, wine_id);"
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_ratings_sync (
+                source text NOT NULL,
+                watermark timestamp NOT NULL,
+                synced_at timestamptz NOT NULL DEFAULT now(),
+                CONSTRAINT wine_ratings_sync_pkey PRIMARY KEY (source)
+            );
+            """
+        )
+
+
+_synced_checked_at = 0.0
+_synced = False
+
+
+def ratings_synced():
+    """
+    True quando wine_ratings ja foi sincronizada pelo menos uma vez; so
+    entao o filtro/ordenacao por rating podem ser feitos em SQL.
+    """
+    global _synced, _synced_checked_at
+    if _synced:
+        return True
+    now = time.monotonic()
+    if now - _synced_checked_at < 60:
+        return False
+    _synced_checked_at = now
+    try:
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT 1 FROM public.wine_ratings_sync WHERE source = %s;",
+                [SYNC_SOURCE],
+            )
+            _synced = cur.fetchone() is not None
+    except DatabaseError:
+        _synced = False
+    return _synced
+
+
+def _get_watermark(cur):
+    cur.execute(
+        "SELECT watermark FROM public.wine_ratings_sync WHERE source = %s FOR UPDATE;",
+        [SYNC_SOURCE],
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def sync_wine_ratings(full=False, batch_size=1000):
+    """
+    Copia os resumos de rating do Mongo (wine_rating_summaries) para a
+    tabela wine_ratings do Postgres.
+
+    Incremental: so le os resumos com updated_at >= watermark guardado
+    (indice updated_at, ver ensure_mongo_indexes). Os valores sao absolutos
+    (count/sum), por isso reprocessar o limite do watermark nao duplica
+    nada. Com full=True recarrega a tabela inteira, que e a unica forma de
+    remover vinhos cujo resumo deixou de existir (so acontece no
+    rebuild_rating_summaries, que corre o full no fim). Devolve o numero de
+    vinhos atualizados.
+    """
+    _ensure_wine_ratings_table()
+    collection = get_rating_summaries_collection()
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            watermark = None if full else _get_watermark(cur)
+            query = {"updated_at": {"$gte": watermark - WATERMARK_OVERLAP}} if watermark else {}
+
+            if full:
+                cur.execute("DELETE FROM public.wine_ratings;")
+
+            new_watermark = watermark
+            updated = 0
+            batch = []
+
+            def flush():
+                cur.executemany(
+                    """
+                    INSERT INTO public.wine_ratings (wine_id, rating_count, rating_sum, rating_avg, updated_at)
+                    VALUES (%s, %s, %s, %s, now())
+                    ON CONFLICT (wine_id) DO UPDATE
+                    SET rating_count = EXCLUDED.rating_count,
+                        rating_sum = EXCLUDED.rating_sum,
+                        rating_avg = EXCLUDED.rating_avg,
+                        updated_at = now();
+                    """,
+                    batch,
+                )
+                batch.clear()
+
+            cursor = collection.find(
+                query, {"count": 1, "sum": 1, "updated_at": 1}
+            ).sort("updated_at", 1)
+            for doc in cursor:
+                try:
+                    wine_id = uuid.UUID(str(doc["_id"]))
+                except (ValueError, TypeError):
+                    continue
+                count = int(doc.get("count") or 0)
+                total = doc.get("sum") or 0
+                avg = round(float(total) / count, 3) if count else 0
+                batch.append([wine_id, count, total, avg])
+                doc_updated = doc.get("updated_at")
+                if isinstance(doc_updated, dt.datetime) and (
+                    new_watermark is None or doc_updated > new_watermark
+                ):
+                    new_watermark = doc_updated
+                updated += 1
+                if len(batch) >= batch_size:
+                    flush()
+            if batch:
+                flush()
+
+            cur.execute(
+                """
+                INSERT INTO public.wine_ratings_sync (source, watermark, synced_at)
+                VALUES (%s, %s, now())
+                ON CONFLICT (source) DO UPDATE
+                SET watermark = EXCLUDED.watermark,
+                    synced_at = now();
+                """,
+                [SYNC_SOURCE, new_watermark or dt.datetime(1970, 1, 1)],
+            )
+
+    if updated:
+        # O catalogo ordena/filtra por wine_ratings: as paginas em cache
+        # deixam de estar certas.
+        invalidate_page_cache("ratings")
+    return updated
+
+
+class RatedWinePage:
+    """
+    Lista "virtual" para o Paginator quando os ratings ainda vem do Mongo.
+
+    Recebe apenas (wine_id, name) e o mapa de ratings; o slice pedido pelo
+    Paginator e escolhido com um heap limitado (so `stop` elementos) e so
+    esses vinhos sao carregados como objetos completos via `hydrate`.
+    A ordem e a mesma do caminho SQL: rating (0 sem rating), nome e
+    wine_id a desempatar, tudo no sentido do sort.
+    """
+
+    def __init__(self, rows, ratings_map, hydrate, min_rating=None, sort=None):
+        if min_rating is not None:
+            rows = [
+                row for row in rows
+                if (ratings_map.get(str(row[0])) or 0) >= min_rating
+            ]
+        self.rows = rows
+        self.ratings_map = ratings_map
+        self.hydrate = hydrate
+        self.sort = sort
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _key(self, row):
+        return (self.ratings_map.get(str(row[0])) or 0, row[1] or "", row[0])
+
+    def select(self, start, stop):
+        """Linhas (wine_id, name) da posicao start a stop, ja ordenadas."""
+        if self.sort is None:
+            return self.rows[start:stop]
+        if self.sort.startswith("-"):
+            top = heapq.nlargest(stop, self.rows, key=self._key)
+        else:
+            top = heapq.nsmallest(stop, self.rows, key=self._key)
+        return top[start:stop]
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop, _ = index.indices(len(self.rows))
+        return self.hydrate([row[0] for row in self.select(start, stop)])
@@ -0,0 +1,295 @@
+from django.db import DatabaseError, connection, transaction
+
+from .models import WineListView
+from .neighbours import LIST_COLUMNS, insert_rows, neighbour_wines, np, require_numpy, sparse
+
+
+SYNC_SOURCE = "order_items"
+
+# Vizinhos guardados por vinho.
+RECOMMENDATIONS_TOP_N = 12
+
+# Encomendas canceladas nao contam como compra conjunta.
+EXCLUDED_ORDER_STATUSES = ("cancelled", "canceled", "cancelado", "cancelada")
+
+# O checkout grava a encomenda e as linhas em statements separados: so se
+# processam encomendas com alguns minutos, para nao apanhar uma a meio.
+# Limite conhecido: o watermark e o order_id, que nao segue a ordem de
+# commit. Uma encomenda cuja transacao so confirme mais de 5 minutos depois
+# de um order_id maior ja ter sido processado fica de fora do incremental
+# e so entra no proximo --full (que deve correr periodicamente).
+ORDER_SETTLE_INTERVAL = "5 minutes"
+
+
+def _ensure_wine_recommendations_table():
+    with connection.cursor() as cur:
+        # Matriz de co-ocorrencia (simetrica, com a diagonal = numero de
+        # encomendas com o vinho), so com as celulas diferentes de zero.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_copurchase (
+                wine_id uuid NOT NULL,
+                other_wine_id uuid NOT NULL,
+                orders integer NOT NULL,
+                CONSTRAINT wine_copurchase_pkey PRIMARY KEY (wine_id, other_wine_id)
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_recommendations (
+                wine_id uuid NOT NULL,
+                rank smallint NOT NULL,
+                recommended_wine_id uuid NOT NULL,
+                orders integer NOT NULL,
+                score real NOT NULL,
+                CONSTRAINT wine_recommendations_pkey PRIMARY KEY (wine_id, rank)
+            );
+            """
+        )
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_recommendations_sync (
+                source text NOT NULL,
+                last_order_id integer NOT NULL,
+                built_at timestamptz NOT NULL DEFAULT now(),
+                CONSTRAINT wine_recommendations_sync_pkey PRIMARY KEY (source)
+            );
+            """
+        )
+
+
+def _load_baskets(cur, after_order_id):
+    """
+    Linhas (order_id, wine_id) das encomendas assentes com order_id acima
+    de `after_order_id`.
+    """
+    cur.execute(
+        f"""
+        SELECT oi.order_id, oi.wine_id::text
+        FROM public.order_items oi
+        JOIN public.orders o ON o.order_id = oi.order_id
+        WHERE oi.order_id > %s
+          AND o.status::text <> ALL(%s)
+          AND o.created_at < now() - interval '{ORDER_SETTLE_INTERVAL}'
+        ORDER BY oi.order_id;
+        """,
+        [after_order_id, list(EXCLUDED_ORDER_STATUSES)],
+    )
+    return cur.fetchall()
+
+
+def _cooccurrence(rows):
+    """
+    Matriz vinho x vinho a partir das linhas (order_id, wine_id): X e a
+    matriz binaria encomenda x vinho e C = X^T X conta, para cada par, em
+    quantas encomendas aparecem juntos. Devolve (ids dos vinhos, C em COO).
+    """
+    order_keys = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    wine_keys = np.array([row[1] for row in rows])
+    _orders, order_idx = np.unique(order_keys, return_inverse=True)
+    wine_ids, wine_idx = np.unique(wine_keys, return_inverse=True)
+
+    basket = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (order_idx, wine_idx)),
+        shape=(len(_orders), len(wine_ids)),
+    )
+    # A mesma garrafa repetida numa encomenda conta uma vez.
+    basket.data[:] = 1
+    return wine_ids.tolist(), (basket.T @ basket).tocoo()
+
+
+def _top_neighbours(src, dst, counts, src_totals, dst_totals, top_n):
+    """
+    Top-N por vinho de origem, vetorizado. O score e o cosseno entre as
+    colunas (co-compras / sqrt(encomendas_a * encomendas_b)), para que os
+    vinhos que aparecem em todas as encomendas nao dominem; empates pelo
+    numero de co-compras. Devolve (src, rank, dst, counts, scores).
+    """
+    keep = src != dst
+    src, dst, counts = src[keep], dst[keep], counts[keep]
+    scores = counts / np.sqrt(src_totals[keep].astype(np.float64) * dst_totals[keep])
+
+    order = np.lexsort((dst, -counts, -scores, src))
+    src, dst, counts, scores = src[order], dst[order], counts[order], scores[order]
+
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    sizes = np.diff(np.r_[starts, len(src)])
+    rank = np.arange(len(src)) - np.repeat(starts, sizes) + 1
+    keep = rank <= top_n
+    return src[keep], rank[keep], dst[keep], counts[keep], scores[keep]
+
+
+def _write_recommendations(cur, wine_ids, ranked):
+    src, rank, dst, counts, scores = ranked
+    insert_rows(
+        cur,
+        "INSERT INTO public.wine_recommendations (wine_id, rank, recommended_wine_id, orders, score)",
+        [
+            [wine_ids[s], int(r), wine_ids[d], int(c), float(sc)]
+            for s, r, d, c, sc in zip(src, rank, dst, counts, scores)
+        ],
+    )
+
+
+def _full_build(cur, rows, top_n):
+    cur.execute("DELETE FROM public.wine_copurchase;")
+    cur.execute("DELETE FROM public.wine_recommendations;")
+    if not rows:
+        return 0
+
+    wine_ids, matrix = _cooccurrence(rows)
+    insert_rows(
+        cur,
+        "INSERT INTO public.wine_copurchase (wine_id, other_wine_id, orders)",
+        [
+            [wine_ids[i], wine_ids[j], int(n)]
+            for i, j, n in zip(matrix.row, matrix.col, matrix.data)
+        ],
+    )
+
+    totals = matrix.diagonal()
+    ranked = _top_neighbours(
+        matrix.row, matrix.col, matrix.data, totals[matrix.row], totals[matrix.col], top_n
+    )
+    _write_recommendations(cur, wine_ids, ranked)
+    return len(wine_ids)
+
+
+def _incremental_build(cur, rows, top_n):
+    if not rows:
+        return 0
+
+    # 1) Soma a co-ocorrencia das novas encomendas a matriz guardada.
+    wine_ids, delta = _cooccurrence(rows)
+    # Cada par aparece uma vez no delta (COO somado), por isso o ON CONFLICT
+    # nunca ve a mesma chave duas vezes no mesmo statement.
+    insert_rows(
+        cur,
+        "INSERT INTO public.wine_copurchase (wine_id, other_wine_id, orders)",
+        [
+            [wine_ids[i], wine_ids[j], int(n)]
+            for i, j, n in zip(delta.row, delta.col, delta.data)
+        ],
+        suffix="""
+        ON CONFLICT (wine_id, other_wine_id) DO UPDATE
+        SET orders = public.wine_copurchase.orders + EXCLUDED.orders""",
+    )
+
+    # 2) Recalcula o top-N so dos vinhos que entraram nas novas encomendas
+    # (sao as unicas linhas da matriz com contagens novas). Os scores dos
+    # outros vinhos para estes mudam pouco e acertam no proximo --full.
+    affected = wine_ids
+    cur.execute(
+        """
+        SELECT p.wine_id::text, p.other_wine_id::text, p.orders, a.orders, b.orders
+        FROM public.wine_copurchase p
+        JOIN public.wine_copurchase a ON a.wine_id = p.wine_id AND a.other_wine_id = p.wine_id
+        JOIN public.wine_copurchase b ON b.wine_id = p.other_wine_id AND b.other_wine_id = p.other_wine_id
+        WHERE p.wine_id = ANY(%s::uuid[]);
+        """,
+        [affected],
+    )
+    pairs = cur.fetchall()
+    cur.execute(
+        "DELETE FROM public.wine_recommendations WHERE wine_id = ANY(%s::uuid[]);",
+        [affected],
+    )
+    if not pairs:
+        return len(affected)
+
+    ids, codes = np.unique(
+        np.array([row[0] for row in pairs] + [row[1] for row in pairs]), return_inverse=True
+    )
+    ids = ids.tolist()
+    columns = np.array([row[2:] for row in pairs], dtype=np.int64)
+    ranked = _top_neighbours(
+        codes[: len(pairs)], codes[len(pairs):], columns[:, 0], columns[:, 1], columns[:, 2], top_n
+    )
+    _write_recommendations(cur, ids, ranked)
+    return len(affected)
+
+
+def build_wine_recommendations(full=False, top_n=RECOMMENDATIONS_TOP_N):
+    """
+    Constroi as recomendacoes "quem comprou este vinho tambem comprou" a
+    partir de order_items.
+
+    Incremental: so le as encomendas com order_id acima do watermark, soma
+    a sua co-ocorrencia a wine_copurchase e recalcula o top-N dos vinhos
+    afetados. Com full=True reconstroi tudo (tambem apanha encomendas
+    editadas ou canceladas depois de processadas, e as que confirmaram
+    tarde demais para o watermark; ver ORDER_SETTLE_INTERVAL).
+    Devolve o numero de vinhos cujo top-N foi recalculado.
+    """
+    require_numpy()
+    _ensure_wine_recommendations_table()
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT last_order_id FROM public.wine_recommendations_sync WHERE source = %s FOR UPDATE;",
+                [SYNC_SOURCE],
+            )
+            row = cur.fetchone()
+            if row is None:
+                full = True
+            after_order_id = 0 if full else row[0]
+
+            rows = _load_baskets(cur, after_order_id)
+            if full:
+                updated = _full_build(cur, rows, top_n)
+            else:
+                updated = _incremental_build(cur, rows, top_n)
+
+            last_order_id = rows[-1][0] if rows else after_order_id
+            cur.execute(
+                """
+                INSERT INTO public.wine_recommendations_sync (source, last_order_id, built_at)
+                VALUES (%s, %s, now())
+                ON CONFLICT (source) DO UPDATE
+                SET last_order_id = EXCLUDED.last_order_id,
+                    built_at = now();
+                """,
+                [SYNC_SOURCE, last_order_id],
+            )
+    return updated
+
+
+def recommended_wines(wine_id, limit=6):
+    """
+    Vinhos comprados com `wine_id`, ja ordenados.
+    """
+    return neighbour_wines("wine_recommendations", "recommended_wine_id", wine_id, limit)
+
+
+def recommended_for_wines(wine_ids, limit=6):
+    """
+    Recomendacoes para um conjunto de vinhos (ex.: o carrinho): soma os
+    scores dos vizinhos de cada um, sem repetir os proprios vinhos.
+    """
+    seeds = [str(wid) for wid in wine_ids]
+    if not seeds:
+        return []
+    try:
+        return list(
+            WineListView.objects.raw(
+                f"""
+                SELECT {LIST_COLUMNS}
+                FROM (
+                    SELECT r.recommended_wine_id, SUM(r.score) AS score
+                    FROM public.wine_recommendations r
+                    WHERE r.wine_id = ANY(%s::uuid[])
+                      AND r.recommended_wine_id <> ALL(%s::uuid[])
+                    GROUP BY r.recommended_wine_id
+                    ORDER BY score DESC, r.recommended_wine_id
+                    LIMIT %s
+                ) top
+                JOIN public.vw_wine_list w ON w.wine_id = top.recommended_wine_id
+                ORDER BY top.score DESC, w.wine_id;
+                """,
+                [seeds, seeds, limit],
+            )
+        )
+    except DatabaseError:
+        return []
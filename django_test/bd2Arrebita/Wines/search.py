@@ -0,0 +1,207 @@
+import time
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models.expressions import RawSQL
+
+
+# Tabela de pesquisa mantida pela aplicacao a partir de vw_wine_list.
+# `document` e o tsvector (portugues, sem acentos, com pesos) e
+# `search_text` o texto normalizado para os indices trigram (SKU, erros de
+# escrita, pesquisas parciais). Ambos sao calculados na escrita porque
+# unaccent() nao e IMMUTABLE e nao pode ser usado num indice de expressao.
+_DOCUMENT_SQL = """
+    setweight(to_tsvector('portuguese', public.unaccent(coalesce(w.name, ''))), 'A')
+    || setweight(to_tsvector('simple', coalesce(w.sku, '')), 'A')
+    || setweight(to_tsvector('portuguese', public.unaccent(coalesce(w.grape_varieties, ''))), 'B')
+    || setweight(to_tsvector('portuguese', public.unaccent(coalesce(w.region, ''))), 'B')
+    || setweight(to_tsvector('portuguese', public.unaccent(coalesce(w.type_label, ''))), 'C')
+    || setweight(to_tsvector('portuguese', public.unaccent(coalesce(w.winemaker, ''))), 'C')
+"""
+
+_SEARCH_TEXT_SQL = """
+    lower(public.unaccent(concat_ws(' ', w.name, w.sku, w.region, w.type_label,
+                                    w.grape_varieties, w.winemaker)))
+"""
+
+# Vinhos que correspondem a pesquisa: full-text OU substring (trigram) OU
+# semelhanca por palavra (erros de escrita). Todos usam indices GIN.
+# O parametro do LIKE vem escapado por like_escape(), como no icontains.
+_MATCH_SQL = """
+    s.document @@ websearch_to_tsquery('portuguese', public.unaccent(%s))
+    OR s.search_text LIKE '%%' || lower(public.unaccent(%s)) || '%%' ESCAPE '\\'
+    OR lower(public.unaccent(%s)) <%% s.search_text
+"""
+
+_RANK_SQL = """
+    ts_rank_cd(s.document, websearch_to_tsquery('portuguese', public.unaccent(%s)))
+    + word_similarity(lower(public.unaccent(%s)), s.search_text)
+"""
+
+
+def like_escape(value):
+    """
+    Escapa \\, % e _ para que a pesquisa seja literal num LIKE ... ESCAPE '\\'
+    (q=% ou q=_ nao pode apanhar o catalogo inteiro).
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _ensure_wine_search_table():
+    with connection.cursor() as cur:
+        cur.execute("CREATE EXTENSION IF NOT EXISTS unaccent;")
+        cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_search (
+                wine_id uuid NOT NULL,
+                document tsvector NOT NULL,
+                search_text text NOT NULL,
+                indexed_at timestamptz NOT NULL DEFAULT now(),
+                CONSTRAINT wine_search_pkey PRIMARY KEY (wine_id)
+            );
+            """
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_wine_search_document ON public.wine_search USING gin (document);"
+        )
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_wine_search_trgm ON public.wine_search USING gin (search_text gin_trgm_ops);"
+        )
+
+
+_ready_checked_at = 0.0
+_ready = False
+
+
+def search_ready():
+    """
+    True quando wine_search existe e tem dados; ate la as views usam a
+    pesquisa antiga por ILIKE.
+    """
+    global _ready, _ready_checked_at
+    if _ready:
+        return True
+    now = time.monotonic()
+    if now - _ready_checked_at < 60:
+        return False
+    _ready_checked_at = now
+    try:
+        with connection.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.wine_search') IS NOT NULL;")
+            exists = cur.fetchone()[0]
+            if exists:
+                cur.execute("SELECT EXISTS (SELECT 1 FROM public.wine_search);")
+                exists = cur.fetchone()[0]
+        _ready = bool(exists)
+    except DatabaseError:
+        _ready = False
+    return _ready
+
+
+def refresh_wine_search(wine_ids=None, skus=None):
+    """
+    (Re)indexa vinhos a partir de vw_wine_list. Sem argumentos reindexa o
+    catalogo todo e remove vinhos que ja nao existem. Devolve o numero de
+    vinhos indexados.
+    """
+    _ensure_wine_search_table()
+
+    where = ""
+    params = []
+    if wine_ids is not None:
+        where = "WHERE w.wine_id = ANY(%s)"
+        params = [list(wine_ids)]
+    elif skus is not None:
+        where = "WHERE w.sku = ANY(%s)"
+        params = [list(skus)]
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO public.wine_search (wine_id, document, search_text, indexed_at)
+                SELECT w.wine_id, {_DOCUMENT_SQL}, {_SEARCH_TEXT_SQL}, now()
+                FROM public.vw_wine_list w
+                {where}
+                ON CONFLICT (wine_id) DO UPDATE
+                SET document = EXCLUDED.document,
+                    search_text = EXCLUDED.search_text,
+                    indexed_at = now();
+                """,
+                params,
+            )
+            indexed = cur.rowcount
+
+            if wine_ids is None and skus is None:
+                cur.execute(
+                    """
+                    DELETE FROM public.wine_search s
+                    WHERE NOT EXISTS (
+                        SELECT 1 FROM public.vw_wine_list w WHERE w.wine_id = s.wine_id
+                    );
+                    """
+                )
+            elif wine_ids is not None:
+                cur.execute(
+                    """
+                    DELETE FROM public.wine_search s
+                    WHERE s.wine_id = ANY(%s)
+                      AND NOT EXISTS (
+                          SELECT 1 FROM public.vw_wine_list w WHERE w.wine_id = s.wine_id
+                      );
+                    """,
+                    [list(wine_ids)],
+                )
+
+    return indexed
+
+
+def refresh_wine_search_safely(**kwargs):
+    # Usado depois das escritas do backoffice: a pesquisa nao deve fazer
+    # falhar a gravacao do vinho. So atualiza um indice ja carregado (o
+    # carregamento inicial e feito pelo comando refresh_wine_search).
+    if not search_ready():
+        return
+    try:
+        refresh_wine_search(**kwargs)
+    except DatabaseError:
+        pass
+
+
+def match_sql(q):
+    """
+    (sql, params) com a condicao de pesquisa sobre o alias `s` de
+    public.wine_search.
+    """
+    return _MATCH_SQL, [q, like_escape(q), q]
+
+
+def rank_sql(q):
+    return _RANK_SQL, [q, q]
+
+
+def matching_wine_ids(q):
+    """
+    Subquery (RawSQL) com os wine_id que correspondem a `q`, para usar em
+    filter(wine_id__in=...).
+    """
+    sql, params = match_sql(q)
+    return RawSQL(f"SELECT s.wine_id FROM public.wine_search s WHERE {sql}", params)
+
+
+def search_rank(q):
+    """
+    Expressao de relevancia para annotate(); 0 para vinhos ainda nao
+    indexados.
+    """
+    sql, params = rank_sql(q)
+    return RawSQL(
+        f"""
+        COALESCE((
+            SELECT {sql}
+            FROM public.wine_search s
+            WHERE s.wine_id = vw_wine_list.wine_id
+        ), 0)
+        """,
+        params,
+    )
@@ -0,0 +1,269 @@
+import re
+import unicodedata
+
+from django.db import connection, transaction
+
+from .neighbours import insert_rows, neighbour_wines, np, require_numpy, sparse
+
+
+# Vizinhos guardados por vinho.
+SIMILAR_TOP_N = 12
+
+# Linhas de similaridade calculadas de cada vez (cada bloco e denso:
+# bloco x numero de vinhos).
+SIMILAR_BLOCK_SIZE = 512
+
+# Com mais do que esta fracao do catalogo alterada (primeira execucao,
+# edicao em massa) o incremental ja nao poupa nada: recalcula tudo.
+SIMILAR_FULL_REBUILD_FRACTION = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]{3,}")
+
+_STOPWORDS = frozenset(
+    """
+    com como das dos este esta isso mais mas muito nas nos num numa para pela
+    pelo por que sem sua seu uma umas uns and the with
+    """.split()
+)
+
+
+def _ensure_wine_similar_table():
+    with connection.cursor() as cur:
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_similar (
+                wine_id uuid NOT NULL,
+                rank smallint NOT NULL,
+                similar_wine_id uuid NOT NULL,
+                score real NOT NULL,
+                CONSTRAINT wine_similar_pkey PRIMARY KEY (wine_id, rank)
+            );
+            """
+        )
+        # updated_at de cada vinho quando foi indexado pela ultima vez.
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.wine_similar_state (
+                wine_id uuid NOT NULL,
+                source_updated_at timestamptz,
+                indexed_at timestamptz NOT NULL DEFAULT now(),
+                CONSTRAINT wine_similar_state_pkey PRIMARY KEY (wine_id)
+            );
+            """
+        )
+
+
+def _normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def _terms(row):
+    """
+    Termos de um vinho. Notas de prova e harmonizacao entram palavra a
+    palavra; castas, regiao e tipo entram inteiros e com prefixo, para que
+    "Douro" a regiao nao se confunda com a palavra numa nota de prova.
+    """
+    _wine_id, tasting_notes, pairing, grapes, region, type_label = row
+    terms = [
+        word
+        for word in _TOKEN_RE.findall(_normalize(f"{tasting_notes or ''} {pairing or ''}"))
+        if word not in _STOPWORDS
+    ]
+    terms.extend(
+        f"casta:{grape.strip()}"
+        for grape in _normalize(grapes).split(",")
+        if grape.strip()
+    )
+    if region:
+        terms.append(f"regiao:{_normalize(region).strip()}")
+    if type_label:
+        terms.append(f"tipo:{_normalize(type_label).strip()}")
+    return terms
+
+
+def _tfidf(rows):
+    """
+    Matriz TF-IDF (vinhos x termos), com tf sublinear e linhas de norma 1,
+    para que o produto escalar entre duas linhas seja o cosseno.
+    """
+    vocabulary = {}
+    row_idx, col_idx = [], []
+    for i, row in enumerate(rows):
+        for term in _terms(row):
+            row_idx.append(i)
+            col_idx.append(vocabulary.setdefault(term, len(vocabulary)))
+
+    counts = sparse.csr_matrix(
+        (np.ones(len(row_idx), dtype=np.float64), (row_idx, col_idx)),
+        shape=(len(rows), max(len(vocabulary), 1)),
+    )
+    counts.sum_duplicates()
+    counts.data = 1.0 + np.log(counts.data)
+
+    df = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = np.log((1.0 + len(rows)) / (1.0 + df)) + 1.0
+    matrix = counts @ sparse.diags(idf)
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+
+def _top_similar(matrix, rows, top_n):
+    """
+    Para cada linha em `rows`: (rank, coluna, score) dos top_n vinhos mais
+    semelhantes (cosseno > 0), sem o proprio. Calculado por blocos.
+    """
+    result = {}
+    k = min(top_n, matrix.shape[0] - 1)
+    if k <= 0:
+        return {row: [] for row in rows}
+
+    for start in range(0, len(rows), SIMILAR_BLOCK_SIZE):
+        block = np.asarray(rows[start:start + SIMILAR_BLOCK_SIZE])
+        scores = (matrix[block] @ matrix.T).toarray()
+        scores[np.arange(len(block)), block] = -1.0
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for row, cols, vals in zip(block, top, top_scores):
+            keep = vals > 0
+            result[int(row)] = [
+                (rank, int(col), float(val))
+                for rank, (col, val) in enumerate(zip(cols[keep], vals[keep]), start=1)
+            ]
+    return result
+
+
+def _affected_rows(cur, matrix, positions, changed, top_n):
+    """
+    Linhas a recalcular numa atualizacao incremental: os vinhos alterados,
+    os que tinham um vinho alterado (ou removido) na lista, e os que passam
+    a ter um vinho alterado acima do seu ultimo vizinho guardado.
+    """
+    affected = set(changed)
+    cur.execute(
+        """
+        SELECT s.wine_id::text, s.similar_wine_id::text, s.rank, s.score
+        FROM public.wine_similar s;
+        """
+    )
+    stored = {}
+    for wine_id, similar_id, rank, score in cur.fetchall():
+        entry = stored.setdefault(wine_id, [0.0, 0])
+        if similar_id not in positions or positions[similar_id] in changed:
+            affected.add(positions.get(wine_id))
+        if rank >= entry[1]:
+            entry[:] = [score, rank]
+
+    if changed:
+        # Melhor score de cada vinho contra os alterados, por blocos de
+        # linhas como em _top_similar.
+        changed_rows = matrix[np.asarray(sorted(changed))].T
+        best = np.concatenate([
+            np.asarray((matrix[start:start + SIMILAR_BLOCK_SIZE] @ changed_rows).max(axis=1).todense()).ravel()
+            for start in range(0, matrix.shape[0], SIMILAR_BLOCK_SIZE)
+        ])
+        for wine_id, row in positions.items():
+            last_score, count = stored.get(wine_id, (0.0, 0))
+            if best[row] > 0 and (count < top_n or best[row] > last_score):
+                affected.add(row)
+
+    affected.discard(None)
+    return sorted(affected)
+
+
+def build_similar_wines(full=False, top_n=SIMILAR_TOP_N):
+    """
+    Indice "vinhos semelhantes": vetores TF-IDF de notas de prova,
+    harmonizacao, castas, regiao e tipo, e os top_n vizinhos por cosseno
+    guardados em wine_similar.
+
+    O IDF precisa de todo o catalogo, por isso os vetores sao sempre
+    calculados para todos; as linhas guardadas so sao recalculadas para os
+    vinhos cujo updated_at mudou desde a ultima vez (e para os vizinhos
+    afetados por eles). Com full=True recalcula todas as linhas, o que
+    tambem acerta o desvio do IDF entretanto acumulado.
+    Devolve o numero de vinhos recalculados.
+    """
+    require_numpy()
+    _ensure_wine_similar_table()
+
+    with transaction.atomic():
+        with connection.cursor() as cur:
+            cur.execute("LOCK TABLE public.wine_similar_state IN EXCLUSIVE MODE;")
+            cur.execute(
+                """
+                SELECT w.wine_id::text, w.tasting_notes, w.pairing, w.grape_varieties,
+                       w.region, w.type_label, w.updated_at,
+                       st.wine_id IS NULL OR st.source_updated_at IS DISTINCT FROM w.updated_at
+                FROM public.vw_wine_list w
+                LEFT JOIN public.wine_similar_state st ON st.wine_id = w.wine_id
+                ORDER BY w.wine_id;
+                """
+            )
+            catalogue = cur.fetchall()
+
+            ids = [row[0] for row in catalogue]
+            positions = {wine_id: i for i, wine_id in enumerate(ids)}
+            changed = {i for i, row in enumerate(catalogue) if row[7]}
+
+            cur.execute(
+                "DELETE FROM public.wine_similar_state WHERE wine_id <> ALL(%s::uuid[]);",
+                [ids],
+            )
+            cur.execute(
+                "DELETE FROM public.wine_similar WHERE wine_id <> ALL(%s::uuid[]);",
+                [ids],
+            )
+            if not catalogue:
+                return 0
+
+            matrix = _tfidf([row[:6] for row in catalogue])
+            if full or len(changed) > SIMILAR_FULL_REBUILD_FRACTION * len(ids):
+                full = True
+                rows = list(range(len(ids)))
+            else:
+                rows = _affected_rows(cur, matrix, positions, changed, top_n)
+            if not rows:
+                return 0
+
+            neighbours = _top_similar(matrix, rows, top_n)
+            row_ids = [ids[row] for row in rows]
+            cur.execute(
+                "DELETE FROM public.wine_similar WHERE wine_id = ANY(%s::uuid[]);",
+                [row_ids],
+            )
+            insert_rows(
+                cur,
+                "INSERT INTO public.wine_similar (wine_id, rank, similar_wine_id, score)",
+                [
+                    [ids[row], rank, ids[col], score]
+                    for row in rows
+                    for rank, col, score in neighbours[row]
+                ],
+            )
+
+            indexed = rows if full else sorted(changed)
+            insert_rows(
+                cur,
+                "INSERT INTO public.wine_similar_state (wine_id, source_updated_at)",
+                [[ids[row], catalogue[row][6]] for row in indexed],
+                suffix="""
+                ON CONFLICT (wine_id) DO UPDATE
+                SET source_updated_at = EXCLUDED.source_updated_at,
+                    indexed_at = now()""",
+            )
+    return len(rows)
+
+
+def similar_wines(wine_id, limit=6):
+    """
+    Vinhos semelhantes a `wine_id`, ja ordenados.
+    """
+    return neighbour_wines("wine_similar", "similar_wine_id", wine_id, limit)
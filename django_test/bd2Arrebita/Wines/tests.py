@@ -1,3 +1,175 @@
-from django.test import TestCase
+import contextlib
+import datetime as dt
+import uuid
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from Arrebita.testing import selected_columns
+
+from . import facets, neighbours, ratings, recommendations, search, similar
+from .models import WINE_LIST_FIELDS
+from .views import _list_queryset
+
+
+class WineListProjectionTests(SimpleTestCase):
+    heavy_columns = {"tasting_notes", "pairing", "winemaker", "grape_varieties"}
+
+    def test_winelist_fetches_only_list_columns(self):
+        columns = selected_columns(_list_queryset())
+        self.assertEqual(columns, set(WINE_LIST_FIELDS))
+        self.assertFalse(columns & self.heavy_columns)
+
+
+class SimilarWinesIncrementalTests(SimpleTestCase):
+    catalogue = [
+        ("w0", "frutado fresco citrino", "peixe", "Alvarinho", "Minho", "Branco"),
+        ("w1", "frutado fresco mineral", "marisco", "Alvarinho", "Minho", "Branco"),
+        ("w2", "taninos firmes fruta preta", "carne", "Touriga Nacional", "Douro", "Tinto"),
+        ("w3", "taninos macios fruta vermelha", "queijo", "Touriga Nacional", "Douro", "Tinto"),
+        ("w4", "doce frutos secos", "sobremesa", "Touriga Nacional", "Douro", "Porto"),
+    ]
+
+    def test_affected_rows_are_computed_in_blocks(self):
+        matrix = similar._tfidf(self.catalogue)
+        positions = {row[0]: i for i, row in enumerate(self.catalogue)}
+        cursor = mock.Mock()
+        cursor.fetchall.return_value = []
+
+        expected = similar._affected_rows(cursor, matrix, positions, {2}, 12)
+        with mock.patch.object(similar, "SIMILAR_BLOCK_SIZE", 2):
+            blocked = similar._affected_rows(cursor, matrix, positions, {2}, 12)
+
+        self.assertEqual(blocked, expected)
+        self.assertEqual(expected, [2, 3, 4])
+
+
+    def test_full_build_writes_multi_row_inserts(self):
+        cur = mock.MagicMock()
+        cur.fetchall.return_value = [row + (None, True) for row in self.catalogue]
+        connection = mock.Mock()
+        connection.cursor.return_value.__enter__ = mock.Mock(return_value=cur)
+        connection.cursor.return_value.__exit__ = mock.Mock(return_value=False)
+        with mock.patch.object(similar, "connection", connection), \
+                mock.patch.object(similar.transaction, "atomic", contextlib.nullcontext), \
+                mock.patch.object(similar, "_ensure_wine_similar_table"):
+            built = similar.build_similar_wines(full=True, top_n=2)
+
+        self.assertEqual(built, 5)
+        cur.executemany.assert_not_called()
+        inserts = [call.args for call in cur.execute.call_args_list if call.args[0].startswith("INSERT")]
+        self.assertEqual(len(inserts), 2)
+        sql, params = inserts[0]
+        self.assertTrue(sql.startswith("INSERT INTO public.wine_similar "))
+        self.assertEqual(len(params), 4 * sql.count("(%s, %s, %s, %s)"))
+        self.assertEqual(len(inserts[1][1]), 5 * 2)
+        self.assertIn("ON CONFLICT (wine_id)", inserts[1][0])
+
+
+class NeighbourWritesTests(SimpleTestCase):
+    def test_rows_are_inserted_in_multi_row_pages(self):
+        cursor = mock.Mock()
+        rows = [["a", "b", n] for n in range(5)]
+        with mock.patch.object(neighbours, "INSERT_PAGE_SIZE", 2):
+            neighbours.insert_rows(cursor, "INSERT INTO t (x, y, z)", rows, suffix="ON CONFLICT DO NOTHING")
+
+        self.assertEqual(cursor.execute.call_count, 3)
+        sql, params = cursor.execute.call_args_list[0][0]
+        self.assertEqual(sql, "INSERT INTO t (x, y, z) VALUES (%s, %s, %s), (%s, %s, %s) ON CONFLICT DO NOTHING;")
+        self.assertEqual(params, ["a", "b", 0, "a", "b", 1])
+
+    def test_cooccurrence_has_one_cell_per_pair(self):
+        rows = [(1, "a"), (1, "b"), (1, "b"), (2, "a"), (2, "b"), (3, "c")]
+        wine_ids, matrix = recommendations._cooccurrence(rows)
+        cells = list(zip(matrix.row.tolist(), matrix.col.tolist()))
+        self.assertEqual(len(cells), len(set(cells)))
+        counts = {(wine_ids[i], wine_ids[j]): int(n) for (i, j), n in zip(cells, matrix.data)}
+        self.assertEqual(counts[("a", "b")], 2)
+        self.assertEqual(counts[("b", "b")], 2)
+
+
+class SearchLikeEscapeTests(SimpleTestCase):
+    def test_wildcards_are_literal_in_the_substring_match(self):
+        sql, params = search.match_sql("50%_a\\b")
+        self.assertIn("ESCAPE", sql)
+        self.assertEqual(params[1], "50\\%\\_a\\\\b")
+        # Full-text e trigram recebem a pesquisa tal como veio.
+        self.assertEqual(params[0], "50%_a\\b")
+
+
+class PriceFacetLinkTests(SimpleTestCase):
+    def test_bucket_links_exclude_the_upper_boundary(self):
+        # width_bucket: 20.00 cai no escalao [20, 50), nao no [10, 20).
+        low, high = facets._price_bucket_bounds(1)
+        self.assertEqual((low, high), (10, 20))
+        self.assertEqual(facets.price_bucket_max_param(high), "19.99")
+
+
+class SyncWineRatingsTests(SimpleTestCase):
+    def sync(self, full, watermark):
+        cur = mock.MagicMock()
+        cur.fetchone.return_value = (watermark,) if watermark else None
+        connection = mock.Mock()
+        connection.cursor.return_value.__enter__ = mock.Mock(return_value=cur)
+        connection.cursor.return_value.__exit__ = mock.Mock(return_value=False)
+        summaries = mock.Mock()
+        summaries.find.return_value.sort.return_value = [
+            {"_id": "3f1c2a4e-8b7d-4c6e-9a1f-2b3c4d5e6f70", "count": 2, "sum": 7, "updated_at": dt.datetime(2024, 1, 2)},
+        ]
+        with mock.patch.object(ratings, "connection", connection), \
+                mock.patch.object(ratings.transaction, "atomic", contextlib.nullcontext), \
+                mock.patch.object(ratings, "_ensure_wine_ratings_table"), \
+                mock.patch.object(ratings, "get_rating_summaries_collection", return_value=summaries), \
+                mock.patch.object(ratings, "invalidate_page_cache"):
+            updated = ratings.sync_wine_ratings(full=full)
+        statements = [call.args[0] for call in cur.execute.call_args_list]
+        return updated, summaries, statements
+
+    def test_incremental_sync_reads_only_changed_summaries_and_deletes_nothing(self):
+        updated, summaries, statements = self.sync(full=False, watermark=dt.datetime(2024, 1, 1))
+        self.assertEqual(updated, 1)
+        summaries.find.assert_called_once()
+        self.assertIn("updated_at", summaries.find.call_args.args[0])
+        self.assertFalse([sql for sql in statements if "DELETE" in sql])
+
+    def test_full_sync_reloads_the_table(self):
+        _updated, summaries, statements = self.sync(full=True, watermark=None)
+        self.assertEqual(summaries.find.call_args.args[0], {})
+        self.assertIn("DELETE FROM public.wine_ratings;", statements)
+
+
+class RatedWinePageTests(SimpleTestCase):
+    # Empates no rating, no (rating, nome) e vinhos sem rating (None ou
+    # ausentes do mapa, que no SQL sao o COALESCE(rating_avg, 0)).
+    wines = [
+        ("tinto", 4.5), ("branco", 4.5), ("rose", None), ("porto", 3.0), ("branco", 4.5),
+        ("alvarinho", 0.0), ("moscatel", None), ("tinto", 3.0), ("verde", 5.0), ("arinto", 4.5),
+        ("espumante", "missing"), ("alvarinho", 4.5),
+    ]
+
+    def setUp(self):
+        self.rows = [(uuid.UUID(int=(i * 7919) % 97 + 1), name) for i, (name, _rating) in enumerate(self.wines)]
+        self.ratings = {
+            str(row[0]): rating for row, (_name, rating) in zip(self.rows, self.wines) if rating != "missing"
+        }
+
+    def order_by(self, desc, min_rating=None):
+        # ORDER BY COALESCE(rating_avg, 0), name, wine_id (ASC ou DESC).
+        rows = [
+            (self.ratings.get(str(wine_id)) or 0, name, wine_id)
+            for wine_id, name in self.rows
+            if min_rating is None or (self.ratings.get(str(wine_id)) or 0) >= min_rating
+        ]
+        return [row[2] for row in sorted(rows, reverse=desc)]
+
+    def test_pages_match_a_plain_order_by(self):
+        for sort, min_rating in (("-rating", None), ("rating", None), ("-rating", 3), ("rating", 4.5)):
+            page = ratings.RatedWinePage(self.rows, self.ratings, list, min_rating=min_rating, sort=sort)
+            expected = self.order_by(sort.startswith("-"), min_rating)
+            self.assertEqual(len(page), len(expected))
+            pages = [page[start:start + 5] for start in range(0, len(page), 5)]
+            self.assertEqual([wine_id for chunk in pages for wine_id in chunk], expected, (sort, min_rating))
+
+    def test_without_sort_keeps_the_queryset_order(self):
+        page = ratings.RatedWinePage(self.rows, self.ratings, list, min_rating=4.5)
+        self.assertEqual(page[0:3], [row[0] for row in self.rows if (self.ratings.get(str(row[0])) or 0) >= 4.5][:3])
@@ -1,38 +1,60 @@
 # Wines/views.py
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db import DatabaseError
+from django.db.models import DecimalField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404
 from django.shortcuts import render, redirect, get_object_or_404
 
-from .models import WineListView, WineType
-from Arrebita.mongo import get_reviews_collection
-from Arrebita.reviews import create_review, list_reviews
+from .facets import cached_wine_types, normalize_filters, price_bucket_max_param, wine_facets
+from .models import WINE_LIST_FIELDS, WineListView, WineRating
+from .ratings import RatedWinePage, ratings_synced
+from .recommendations import recommended_wines
+from .similar import similar_wines
+from .search import matching_wine_ids, search_rank, search_ready
+from Arrebita.outbox import submit_review
+from Arrebita.pagination import WINE_KEYSET_SORTS, KeysetPage, keyset_page
+from Arrebita.pagecache import cache_anonymous_page
+from Arrebita.reviews import (
+    WINE_REVIEW_FIELDS,
+    rating_summaries,
+    wine_detail_reviews,
+)
 
 
-def winelist(request):
-    """
-    Lista de vinhos com filtros, ordenacao e paginacao.
-    Le da VIEW no Postgres (WineListView) e nao altera dados.
-    """
+# Threads para as leituras do Mongo que correm em paralelo com o Postgres
+# (ver wine_detail). Nao tocam no ORM, por isso nao abrem ligacoes.
+_detail_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="wine-detail")
 
-    # =========================
-    # 1) Ler parametros GET
-    # =========================
-    q = request.GET.get("q", "").strip()
-    sort = request.GET.get("sort", "").strip()
-    selected_types = request.GET.getlist("type")
-    min_price = request.GET.get("min")
-    max_price = request.GET.get("max")
-    rating = request.GET.get("rating")
 
-    # =========================
-    # 2) Query base
-    # =========================
-    wines_qs = WineListView.objects.all()
+def filter_wines(wines_qs, params):
+    """
+    Aplica os filtros do catalogo (q, type, min, max, region, decade) a
+    `wines_qs`. Partilhado pela lista HTML e pela API JSON.
+    Devolve (queryset, filtros); o rating minimo so e validado aqui, porque
+    depende de onde os ratings estao (ver winelist).
+    """
+    q = params.get("q", "").strip()
+    selected_types = params.getlist("type")
+    min_price = params.get("min")
+    max_price = params.get("max")
+    rating = params.get("rating")
+    region = params.get("region", "").strip()
+    decade = params.get("decade")
 
     # =========================
-    # 3) Filtro de pesquisa (nome / casta)
+    # 1) Filtro de pesquisa (nome / SKU / regiao / castas / enologo)
     # =========================
-    if q:
+    use_search_rank = False
+    if q and search_ready():
+        # Full-text + trigram sobre public.wine_search (ver Wines.search).
+        wines_qs = wines_qs.filter(wine_id__in=matching_wine_ids(q)).annotate(
+            search_rank=search_rank(q)
+        )
+        use_search_rank = True
+    elif q:
         wines_qs = wines_qs.filter(
             Q(name__icontains=q)
             | Q(region__icontains=q)
@@ -40,13 +62,13 @@ def winelist(request):
         )
 
     # =========================
-    # 4) Filtro por tipo (checkboxes)
+    # 2) Filtro por tipo (checkboxes)
     # =========================
     if selected_types:
         wines_qs = wines_qs.filter(type_id__in=selected_types)
 
     # =========================
-    # 5) Filtro por preco
+    # 3) Filtro por preco
     # =========================
     if min_price:
         try:
@@ -63,7 +85,23 @@ def winelist(request):
             pass
 
     # =========================
-    # 6) Filtro por classificacao minima (rating vem do Mongo)
+    # 4) Filtros por regiao e decada de colheita (facetas)
+    # =========================
+    if region:
+        wines_qs = wines_qs.filter(region=region)
+
+    decade_value = None
+    if decade:
+        try:
+            decade_value = int(decade)
+            wines_qs = wines_qs.filter(
+                vintage_year__gte=decade_value, vintage_year__lt=decade_value + 10
+            )
+        except ValueError:
+            decade_value = None
+
+    # =========================
+    # 5) Filtro por classificacao minima (rating vem do Mongo)
     # =========================
     rating_filter_value = None
     if rating:
@@ -74,6 +112,79 @@ def winelist(request):
         except ValueError:
             rating_filter_value = None
 
+    filters = {
+        "use_search_rank": use_search_rank,
+        "decade": decade_value,
+        "rating": rating_filter_value,
+    }
+    return wines_qs, filters
+
+
+def annotate_rating(wines_qs):
+    """
+    Junta rating_avg (tabela wine_ratings, 0 sem reviews) a cada vinho.
+    So usar depois de ratings_synced().
+    """
+    rating_avg = Subquery(
+        WineRating.objects.filter(wine_id=OuterRef("wine_id")).values("rating_avg")[:1]
+    )
+    return wines_qs.annotate(
+        rating_avg=Coalesce(
+            rating_avg,
+            Value(0),
+            output_field=DecimalField(max_digits=4, decimal_places=3),
+        )
+    )
+
+
+def filter_min_rating(wines_qs, min_rating):
+    """
+    Filtro por classificacao minima fora da lista HTML: em SQL quando
+    wine_ratings esta sincronizada, senao pelos resumos do Mongo.
+    """
+    if ratings_synced():
+        return annotate_rating(wines_qs).filter(rating_avg__gte=min_rating)
+    ids = [str(wine_id) for wine_id in wines_qs.values_list("wine_id", flat=True)]
+    summaries = rating_summaries(ids) if ids else {}
+    keep = [wine_id for wine_id, summary in summaries.items() if summary["avg"] >= min_rating]
+    return wines_qs.filter(wine_id__in=keep)
+
+
+def _list_queryset():
+    # So as colunas que a lista mostra (sem notas de prova, harmonizacao...).
+    return WineListView.objects.only(*WINE_LIST_FIELDS)
+
+
+@cache_anonymous_page("wines", "ratings")
+def winelist(request):
+    """
+    Lista de vinhos com filtros, ordenacao e paginacao.
+    Le da VIEW no Postgres (WineListView) e nao altera dados.
+    """
+
+    # =========================
+    # 1) Ler parametros GET
+    # =========================
+    q = request.GET.get("q", "").strip()
+    sort = request.GET.get("sort", "").strip()
+    selected_types = request.GET.getlist("type")
+    min_price = request.GET.get("min")
+    max_price = request.GET.get("max")
+    region = request.GET.get("region", "").strip()
+
+    # =========================
+    # 2) Query base
+    # =========================
+    wines_qs = _list_queryset()
+
+    # =========================
+    # 3) Filtros (pesquisa, tipo, preco, regiao, decada, rating)
+    # =========================
+    wines_qs, filters = filter_wines(wines_qs, request.GET)
+    use_search_rank = filters["use_search_rank"]
+    decade_value = filters["decade"]
+    rating_filter_value = filters["rating"]
+
     # =========================
     # 7) Ordenacao
     # =========================
@@ -92,6 +203,9 @@ def winelist(request):
     order_by = allowed_sorts.get(sort)
     if order_by:
         wines_qs = wines_qs.order_by(order_by)
+    elif use_search_rank and not use_rating_sort:
+        # Sem ordenacao escolhida, a pesquisa ordena por relevancia.
+        wines_qs = wines_qs.order_by("-search_rank", "name")
     elif not use_rating_sort:
         wines_qs = wines_qs.order_by("name")
 
@@ -102,14 +216,8 @@ def winelist(request):
         if not ids:
             return {}
         try:
-            collection = get_reviews_collection()
-            str_ids = [str(wid) for wid in ids]
-            pipeline = [
-                {"$match": {"wine_id": {"$in": str_ids}}},
-                {"$group": {"_id": "$wine_id", "avg_rating": {"$avg": "$rating"}}},
-            ]
-            results = collection.aggregate(pipeline)
-            return {row.get("_id"): float(row.get("avg_rating") or 0) for row in results}
+            summaries = rating_summaries(ids)
+            return {wine_id: summary["avg"] for wine_id, summary in summaries.items()}
         except Exception:
             return {}
 
@@ -125,28 +233,94 @@ def winelist(request):
 
     page_number = request.GET.get("page", 1)
 
-    if use_rating_sort or rating_filter_value is not None:
-        wines_list = list(wines_qs)
-        ratings_map = _ratings_map_for([wine.wine_id for wine in wines_list])
-        _attach_ratings(wines_list, ratings_map)
+    # Contagens por faceta para os filtros atuais (cache por filtros
+    # normalizados, invalidada nas escritas de vinhos do backoffice).
+    # O total tambem serve de contagem para a paginacao por cursor.
+    try:
+        facets = wine_facets(
+            normalize_filters(
+                q=q,
+                types=selected_types,
+                min_price=min_price,
+                max_price=max_price,
+                rating=rating_filter_value,
+                region=region,
+                decade=decade_value,
+            )
+        )
+    except DatabaseError:
+        facets = None
+
+    if (use_rating_sort or rating_filter_value is not None) and ratings_synced():
+        # Rating vem da tabela wine_ratings (sincronizada do Mongo), por isso
+        # filtro, ordenacao e paginacao ficam todos no SQL.
+        wines_qs = annotate_rating(wines_qs)
 
         if rating_filter_value is not None:
-            wines_list = [
-                wine for wine in wines_list
-                if getattr(wine, "_rating_avg", 0) >= rating_filter_value
-            ]
+            wines_qs = wines_qs.filter(rating_avg__gte=rating_filter_value)
 
         if use_rating_sort:
-            reverse = sort.startswith("-")
-            wines_list.sort(
-                key=lambda wine: (getattr(wine, "_rating_avg", 0), wine.name or ""),
-                reverse=reverse,
-            )
+            if sort.startswith("-"):
+                wines_qs = wines_qs.order_by("-rating_avg", "-name", "-wine_id")
+            else:
+                wines_qs = wines_qs.order_by("rating_avg", "name", "wine_id")
 
-        paginator = Paginator(wines_list, 9)
+        paginator = Paginator(wines_qs, 9)
         page_obj = paginator.get_page(page_number)
         wines_page = page_obj.object_list
+
+        _attach_ratings(
+            wines_page,
+            {str(wine.wine_id): float(wine.rating_avg or 0) for wine in wines_page},
+        )
+    elif use_rating_sort or rating_filter_value is not None:
+        # Ratings ainda so no Mongo: le apenas (wine_id, name), pede os
+        # ratings numa chamada e escolhe a pagina com um heap; so os 9
+        # vinhos da pagina sao carregados por inteiro.
+        if use_rating_sort:
+            wines_qs = wines_qs.order_by()
+        rows = list(wines_qs.values_list("wine_id", "name"))
+        ratings_map = _ratings_map_for([row[0] for row in rows])
+
+        def _hydrate(ids):
+            by_id = _list_queryset().in_bulk(ids)
+            wines = [by_id[wine_id] for wine_id in ids if wine_id in by_id]
+            _attach_ratings(wines, ratings_map)
+            return wines
+
+        rated = RatedWinePage(
+            rows,
+            ratings_map,
+            _hydrate,
+            min_rating=rating_filter_value,
+            sort=sort if use_rating_sort else None,
+        )
+        paginator = Paginator(rated, 9)
+        page_obj = paginator.get_page(page_number)
+        wines_page = page_obj.object_list
+    elif sort in WINE_KEYSET_SORTS or not use_search_rank:
+        # Paginacao por cursor: sem COUNT nem OFFSET, qualquer pagina custa
+        # o mesmo que a primeira. O total vem das facetas (em cache).
+        try:
+            number = int(page_number)
+        except (TypeError, ValueError):
+            number = 1
+        page_obj = keyset_page(
+            wines_qs,
+            WINE_KEYSET_SORTS,
+            sort if sort in WINE_KEYSET_SORTS else "name",
+            9,
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+            number=number,
+            total=facets["total"] if facets else None,
+        )
+        wines_page = page_obj.object_list
+
+        ratings_map = _ratings_map_for([wine.wine_id for wine in wines_page])
+        _attach_ratings(wines_page, ratings_map)
     else:
+        # Pesquisa ordenada por relevancia.
         paginator = Paginator(wines_qs, 9)
         page_obj = paginator.get_page(page_number)
         wines_page = page_obj.object_list
@@ -158,36 +332,98 @@ def winelist(request):
     # 9) Querystring para paginacao
     # =========================
     params = request.GET.copy()
-    params.pop("page", None)
+    for key in ("page", "after", "before"):
+        params.pop(key, None)
     querystring = params.urlencode()
 
+    def _page_link(number, **cursor):
+        link = params.copy()
+        link["page"] = number
+        for key, value in cursor.items():
+            link[key] = value
+        return link.urlencode()
+
+    previous_link = next_link = None
+    if isinstance(page_obj, KeysetPage):
+        if page_obj.has_previous():
+            previous_link = _page_link(page_obj.number - 1, before=page_obj.previous_token)
+        if page_obj.has_next():
+            next_link = _page_link(page_obj.number + 1, after=page_obj.next_token)
+    else:
+        if page_obj.has_previous():
+            previous_link = _page_link(page_obj.previous_page_number())
+        if page_obj.has_next():
+            next_link = _page_link(page_obj.next_page_number())
+
     # =========================
     # 10) Dados auxiliares para o template
     # =========================
-    wine_types = WineType.objects.all().order_by("name")
+    wine_types = cached_wine_types()
     rating_options = [5, 4, 3, 2, 1]
 
+    if facets:
+        for wine_type in wine_types:
+            wine_type.facet_count = facets["types"].get(str(wine_type.type_id), 0)
+        for bucket in facets["prices"]:
+            bucket_params = params.copy()
+            bucket_params["min"] = bucket["min"]
+            if bucket["max"] is None:
+                bucket_params.pop("max", None)
+            else:
+                bucket_params["max"] = price_bucket_max_param(bucket["max"])
+            bucket["querystring"] = bucket_params.urlencode()
+
     context = {
         "wines": wines_page,
         "page_obj": page_obj,
         "is_paginated": page_obj.has_other_pages(),
         "querystring": querystring,
+        "previous_link": previous_link,
+        "next_link": next_link,
         "wine_types": wine_types,
         "selected_types": selected_types,
         "rating_options": rating_options,
         "has_rating_field": True,
         "rating_sort_key": rating_sort_key,
+        "facets": facets,
+        "selected_region": region,
+        "selected_decade": decade_value,
     }
 
     return render(request, "wine_list.html", context)
 
 
+def _rating_histogram(summary):
+    count = summary["count"]
+    return [
+        {
+            "stars": stars,
+            "count": summary["histogram"].get(stars, 0),
+            "pct": round(100 * summary["histogram"].get(stars, 0) / count) if count else 0,
+        }
+        for stars in sorted(summary["histogram"], reverse=True)
+    ]
+
+
 def wine_detail(request, wine_id):
-    wine = get_object_or_404(WineListView, wine_id=wine_id)
+    # Num GET o Mongo (pagina de reviews + resumo) corre numa thread
+    # enquanto o Postgres vai buscar o vinho. Num POST so depois de validar
+    # a review (se for gravada ha redirect e a leitura nao e precisa).
+    after = request.GET.get("after")
+    reviews_future = None
+    if request.method != "POST":
+        reviews_future = _detail_pool.submit(
+            wine_detail_reviews, wine_id, after=after, limit=50, fields=WINE_REVIEW_FIELDS
+        )
+
+    try:
+        wine = get_object_or_404(WineListView, wine_id=wine_id)
+    except Http404:
+        if reviews_future is not None:
+            reviews_future.cancel()
+        raise
 
     error = ""
-    rating_avg = 0
-    rating_count = 0
     if request.method == "POST":
         user_name = (request.POST.get("user_name") or "").strip() or "Anonimo"
         rating_raw = (request.POST.get("rating") or "").strip()
@@ -202,7 +438,7 @@ def wine_detail(request, wine_id):
             error = "Preenche comentario e rating (1-5)."
         else:
             try:
-                create_review(
+                submit_review(
                     wine_id=wine.wine_id,
                     wine_name=wine.name,
                     user_name=user_name,
@@ -213,32 +449,22 @@ def wine_detail(request, wine_id):
             except RuntimeError:
                 error = "Erro ao ligar ao MongoDB."
 
+    next_cursor = None
+    summary = None
     try:
-        reviews = list_reviews(wine_id=wine.wine_id, limit=50)
+        if reviews_future is None:
+            reviews, next_cursor, summary = wine_detail_reviews(
+                wine.wine_id, after=after, limit=50, fields=WINE_REVIEW_FIELDS
+            )
+        else:
+            reviews, next_cursor, summary = reviews_future.result()
     except RuntimeError:
         reviews = []
         if not error:
             error = "Erro ao ligar ao MongoDB."
 
-    if reviews:
-        rating_count = len(reviews)
-        try:
-            rating_avg = sum((r.get("rating", 0) or 0) for r in reviews) / rating_count
-        except (TypeError, ZeroDivisionError):
-            rating_avg = 0
-
-    try:
-        collection = get_reviews_collection()
-        agg = list(collection.aggregate([
-            {"$match": {"wine_id": str(wine.wine_id)}},
-            {"$group": {"_id": "$wine_id", "avg_rating": {"$avg": "$rating"}, "count": {"$sum": 1}}},
-        ]))
-        if agg:
-            rating_avg = float(agg[0].get("avg_rating") or 0)
-            rating_count = int(agg[0].get("count") or 0)
-    except Exception:
-        pass
-
+    rating_avg = summary["avg"] if summary else 0
+    rating_count = summary["count"] if summary else 0
     try:
         rating_safe = int(round(rating_avg))
     except (TypeError, ValueError):
@@ -248,9 +474,13 @@ def wine_detail(request, wine_id):
     context = {
         "wine": wine,
         "reviews": reviews,
+        "next_cursor": next_cursor,
         "error": error,
         "rating_avg": rating_avg,
         "rating_count": rating_count,
         "rating_safe": rating_safe,
+        "rating_histogram": _rating_histogram(summary) if rating_count else [],
+        "related_wines": recommended_wines(wine.wine_id),
+        "similar_wines": similar_wines(wine.wine_id),
     }
     return render(request, "wine_detail.html", context)
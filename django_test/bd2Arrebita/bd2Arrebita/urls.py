@@ -1,6 +1,8 @@
 from django.urls import path, include
 from Accounts import views as accounts_views
+from Events import api as events_api
 from Orders import views as orders_views
+from Wines import api as wines_api
 
 
 urlpatterns = [
@@ -21,4 +23,8 @@ urlpatterns = [
     path('statistics/', include('Statistics.urls')),
     path('wines/', include('Wines.urls')),
     path('backoffice/', include('Backoffice.urls')),
+    path('api/wines/', wines_api.wine_list_api, name='api_wines'),
+    path('api/wines/<uuid:wine_id>/', wines_api.wine_detail_api, name='api_wine_detail'),
+    path('api/events/', events_api.event_list_api, name='api_events'),
+    path('api/events/<slug:slug>/', events_api.event_detail_api, name='api_event_detail'),
 ]
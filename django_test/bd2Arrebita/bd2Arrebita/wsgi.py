@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bd2Arrebita.settings')
 
 application = get_wsgi_application()
+
+# Ficheiros de STATIC_ROOT (depois do collectstatic) servidos antes do
+# Django, com cache immutable e versoes .br/.gz.
+from Arrebita.staticfiles import StaticFilesApp  # noqa: E402
+
+application = StaticFilesApp(application)